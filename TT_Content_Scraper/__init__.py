@@ -6,6 +6,7 @@ Main Components:
 - TT_Content_Scraper: Main scraper class
 - ObjectTracker: Database for tracking scraping progress
 - BaseScraper: Core scraping functionality
+- AsyncBaseScraper: asyncio counterpart of BaseScraper
 """
 
 # Package metadata
@@ -17,7 +18,12 @@ __description__ = "TikTok Content Scraper with progress tracking"
 try:
     from .tt_content_scraper import TT_Content_Scraper
     from .src.object_tracker_db import ObjectTracker, ObjectStatus
-    from .src.scraper_functions.base_scraper import BaseScraper
+    from .src.scraper_functions.base_scraper import BaseScraper, RetryLaterError
+    from .src.retry_policy import RetryPolicy
+    from .src.response_cache import ResponseCache
+    from .src.metrics import MetricsRegistry
+    from .src.scraper_functions.async_scraper import AsyncBaseScraper
+    from .src.scraper_functions._decode_rehydration_data import set_json_backend, get_json_backend
     
     # Import logger configuration
     from .src import logger
@@ -27,6 +33,12 @@ try:
         "TT_Content_Scraper",
         "ObjectTracker", 
         "ObjectStatus",
+        "RetryPolicy",
+        "RetryLaterError",
+        "ResponseCache",
+        "MetricsRegistry",
+        "set_json_backend",
+        "get_json_backend",
         "logger"
     ]
     
@@ -42,7 +54,10 @@ DEFAULT_CONFIG = {
     "output_files_fp": "data/",
     "progress_file_fn": "progress_tracking/scraping_progress.db",
     "clear_console": False,
-    "scrape_files": False
+    "scrape_files": False,
+    "workers": 1,
+    "buffered_tracker": False,
+    "metadata_sink": "files"
 }
 
 def create_scraper(**kwargs):
@@ -66,7 +81,10 @@ def create_scraper(**kwargs):
         wait_time=config["wait_time"],
         output_files_fp=config["output_files_fp"],
         progress_file_fn=config["progress_file_fn"],
-        clear_console=config["clear_console"]
+        clear_console=config["clear_console"],
+        workers=config["workers"],
+        buffered_tracker=config["buffered_tracker"],
+        metadata_sink=config["metadata_sink"]
     )
 
 def create_tracker(progress_file_fn="progress_tracking/scraping_progress.db"):
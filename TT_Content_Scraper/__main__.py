@@ -7,11 +7,17 @@ Command-line interface for the TT_Content_Scraper package.
 import argparse
 import sys
 import os
+import time
+from datetime import timedelta
 from pathlib import Path
-from typing import Optional, List
 
 from .tt_content_scraper import TT_Content_Scraper
 from .src.object_tracker_db import ObjectTracker, ObjectStatus
+from .src.ingest import open_id_source, iter_ids
+from .src.columnar_export import export_metadata_tree
+from .src.proxy_pool import load_proxies
+from .src.retry_policy import RetryPolicy
+from .src.response_cache import ResponseCache
 
 
 def setup_parser() -> argparse.ArgumentParser:
@@ -58,7 +64,7 @@ def setup_parser() -> argparse.ArgumentParser:
     )
     add_parser.add_argument(
         "file",
-        help="Text file containing IDs (one per line)"
+        help="Text file containing IDs (one per line), may be gzip or zstd compressed, - reads stdin"
     )
     add_parser.add_argument(
         "--type",
@@ -70,6 +76,32 @@ def setup_parser() -> argparse.ArgumentParser:
         "--title",
         help="Optional title for all added objects"
     )
+    add_parser.add_argument(
+        "--priority",
+        type=int,
+        default=0,
+        help="Objects with a higher priority are scraped first (default: 0)"
+    )
+    add_parser.add_argument(
+        "--column",
+        help="Read the IDs from this CSV column (name from the header row or 0-based index)"
+    )
+    add_parser.add_argument(
+        "--delimiter",
+        default=",",
+        help="CSV delimiter for --column (default: ,)"
+    )
+    add_parser.add_argument(
+        "--no-header",
+        action="store_true",
+        help="The CSV file has no header row, the first row holds IDs already (only with a 0-based --column index)"
+    )
+    add_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=50_000,
+        help="IDs inserted per transaction (default: 50000)"
+    )
     
     # Scrape command
     scrape_parser = subparsers.add_parser(
@@ -92,6 +124,125 @@ def setup_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Clear console between iterations"
     )
+    scrape_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker threads sharing the --wait-time budget (default: 1)"
+    )
+    scrape_parser.add_argument(
+        "--worker-id",
+        help="Name under which this process claims IDs from the progress database (default: hostname:pid)"
+    )
+    scrape_parser.add_argument(
+        "--buffered-tracker",
+        action="store_true",
+        help="Write completed and failed IDs to the progress database in batches instead of one commit per ID"
+    )
+    scrape_parser.add_argument(
+        "--metadata-sink",
+        choices=["files", "segments"],
+        default="files",
+        help="Write metadata to one JSON file per ID or append it to rolling segment files (default: files)"
+    )
+    scrape_parser.add_argument(
+        "--compress-segments",
+        action="store_true",
+        help="gzip compress the records of --metadata-sink segments"
+    )
+    scrape_parser.add_argument(
+        "--dedup-files",
+        action="store_true",
+        help="Store every downloaded file once by content hash and download the audio of each music ID only once"
+    )
+    scrape_parser.add_argument(
+        "--entity-store",
+        action="store_true",
+        help="Keep authors, music and hashtags once in <output-dir>/entities.db and refer to them by ID in the content metadata"
+    )
+    scrape_parser.add_argument(
+        "--adaptive-rate",
+        action="store_true",
+        help="Adapt the request rate to TikTok's answers, starting at one request every --wait-time seconds"
+    )
+    scrape_parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=10.0,
+        help="Upper limit of --adaptive-rate in page requests per second (default: 10)"
+    )
+    scrape_parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=5,
+        help="Attempts per ID before a throttled or failed ID is marked as error (default: 5)"
+    )
+    scrape_parser.add_argument(
+        "--proxy-file",
+        metavar="FILE",
+        help="Spread the requests over the proxies in this file (one proxy url per line), each with its own session, rate budget and health score"
+    )
+    scrape_parser.add_argument(
+        "--proxy-concurrency",
+        type=int,
+        default=1,
+        help="IDs scraped at the same time through one proxy of --proxy-file (default: 1)"
+    )
+    scrape_parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        help="Keep the raw answers (pages and files) in this folder, see --cache-mode"
+    )
+    scrape_parser.add_argument(
+        "--cache-mode",
+        choices=["record", "replay"],
+        default="record",
+        help="record: answer from --cache-dir while fresh, fetch and store the rest; replay: answer only from --cache-dir, without network (default: record)"
+    )
+    scrape_parser.add_argument(
+        "--cache-ttl",
+        type=parse_duration,
+        help="Fetch answers older than this again when recording, e.g. 12h (default: never)"
+    )
+    scrape_parser.add_argument(
+        "--cache-max-gb",
+        type=float,
+        default=10.0,
+        help="Delete the least recently used answers once --cache-dir holds more than this (default: 10)"
+    )
+    scrape_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve the time per stage, bytes, HTTP statuses and retries on http://127.0.0.1:PORT/metrics (Prometheus format)"
+    )
+    scrape_parser.add_argument(
+        "--profile",
+        type=int,
+        metavar="N",
+        help="Profile the first N IDs: stacks for a flame graph and the top allocation sites go to --profile-dir"
+    )
+    scrape_parser.add_argument(
+        "--profile-every",
+        type=int,
+        metavar="M",
+        help="Profile another N IDs every M IDs, to compare the windows of a long scrape (default: only once)"
+    )
+    scrape_parser.add_argument(
+        "--profile-dir",
+        metavar="DIR",
+        help="Folder of the --profile results (default: <output-dir>/profiles)"
+    )
+    scrape_parser.add_argument(
+        "--stats-snapshots",
+        action="store_true",
+        help="Append the counters of every scraped content ID to <output-dir>/stats_snapshots.db (refreshed IDs always are)"
+    )
+    scrape_parser.add_argument(
+        "--columnar-export",
+        metavar="DIR",
+        help="Also write the content metadata tables as Parquet files to this folder (requires pyarrow)"
+    )
     
     # Statistics command
     stats_parser = subparsers.add_parser(
@@ -121,11 +272,80 @@ def setup_parser() -> argparse.ArgumentParser:
         help="Object IDs to check status for"
     )
     
+    # Stats refresh command
+    refresh_parser = subparsers.add_parser(
+        "refresh",
+        help="Queue completed content again for a snapshot of its counters (run 'scrape' afterwards, no files are downloaded)"
+    )
+    refresh_parser.add_argument(
+        "--older-than",
+        type=parse_duration,
+        default=timedelta(days=1),
+        help="Refresh content last scraped at least this long ago, e.g. 30m, 12h or 7d (default: 1d)"
+    )
+    refresh_parser.add_argument(
+        "--decay",
+        type=float,
+        help="Refresh every DECAY times the age of the post instead, at least --older-than and at most --max-age apart (e.g. 0.25)"
+    )
+    refresh_parser.add_argument(
+        "--max-age",
+        type=parse_duration,
+        default=timedelta(days=30),
+        help="Longest interval between two refreshes with --decay (default: 30d)"
+    )
+    refresh_parser.add_argument(
+        "--limit",
+        type=int,
+        help="Queue at most this many IDs, the longest unrefreshed first"
+    )
+    refresh_parser.add_argument(
+        "--title",
+        help="Only refresh the content of this seed list"
+    )
+    refresh_parser.add_argument(
+        "--priority",
+        type=int,
+        help="Priority of the queued IDs (default: unchanged)"
+    )
+
+    # Re-prioritize command
+    prioritize_parser = subparsers.add_parser(
+        "prioritize",
+        help="Change the priority or fair share weight of a seed list (title), or list all seed lists"
+    )
+    prioritize_parser.add_argument(
+        "title",
+        nargs="?",
+        help="Title given to 'add' (without a title, all seed lists are listed)"
+    )
+    prioritize_parser.add_argument(
+        "--priority",
+        type=int,
+        help="New priority of the objects of this title that are not scraped yet"
+    )
+    prioritize_parser.add_argument(
+        "--weight",
+        type=float,
+        help="Share of this title among titles with the same priority, relative to the others (default of every title: 1), 0 pauses it"
+    )
+    prioritize_parser.add_argument(
+        "--type",
+        choices=["content", "user"],
+        help="Only change the objects of this type"
+    )
+
     # Reset errors command
     reset_parser = subparsers.add_parser(
         "reset-errors",
         help="Reset all error objects back to pending for retry"
     )
+    reset_parser.add_argument(
+        "--reset-attempts",
+        action="store_true",
+        help="Also set their attempts back to 0, so they get a fresh budget of --max-attempts. "
+             "Without it, an object that used up its attempts is marked as error again on its next failure"
+    )
 
     # Reset all objects command
     reset_all_parser = subparsers.add_parser(
@@ -133,6 +353,32 @@ def setup_parser() -> argparse.ArgumentParser:
         help="Reset all error objects back to pending for retry"
     )
     
+    # Columnar export command
+    export_parser = subparsers.add_parser(
+        "export",
+        help="Convert scraped content metadata to Parquet files, one folder per table"
+    )
+    export_parser.add_argument(
+        "--input",
+        help="Folder with content metadata JSON or segment files (default: <output-dir>/content_metadata)"
+    )
+    export_parser.add_argument(
+        "--to",
+        dest="export_dir",
+        help="Folder for the Parquet files (default: <output-dir>/columnar)"
+    )
+    export_parser.add_argument(
+        "--processes",
+        type=int,
+        help="Number of worker processes (default: number of CPU cores)"
+    )
+    export_parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=10_000,
+        help="Rows per Parquet row group (default: 10000)"
+    )
+    
     # Clear data command
     clear_parser = subparsers.add_parser(
         "clear",
@@ -147,18 +393,15 @@ def setup_parser() -> argparse.ArgumentParser:
     return parser
 
 
-def load_ids_from_file(filepath: str) -> List[str]:
-    """Load IDs from a text file, one per line."""
+def parse_duration(text: str) -> timedelta:
+    """Read a duration like 90s, 30m, 12h or 7d (a number without unit is in days)."""
+    units = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+    unit = units.get(text[-1:].lower())
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            ids = [line.strip() for line in f if line.strip()]
-        return ids
-    except FileNotFoundError:
-        print(f"Error: File '{filepath}' not found.", file=sys.stderr)
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error reading file '{filepath}': {e}", file=sys.stderr)
-        sys.exit(1)
+        value = float(text[:-1] if unit else text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration {text!r}, use e.g. 30m, 12h or 7d")
+    return timedelta(**{unit or "days": value})
 
 
 def print_stats(tracker: ObjectTracker, obj_type: str = "all", detailed: bool = False):
@@ -170,6 +413,7 @@ def print_stats(tracker: ObjectTracker, obj_type: str = "all", detailed: bool =
     print(f"Pending:   {stats['pending']:,}")
     print(f"Errors:    {stats['errors']:,}")
     print(f"Retry:     {stats['retry']:,}")
+    print(f"In progress: {stats['in_progress']:,}")
     
     total = sum(stats.values())
     print(f"Total:     {total:,}")
@@ -195,19 +439,35 @@ def main():
     
     try:
         if args.command == "add":
-            # Load IDs from file and add to tracker
-            ids = load_ids_from_file(args.file)
-            
-            if not ids:
-                print("No IDs found in file.", file=sys.stderr)
+            # Stream IDs from file into the tracker, chunk by chunk
+            try:
+                source = open_id_source(args.file)
+            except FileNotFoundError:
+                print(f"Error: File '{args.file}' not found.", file=sys.stderr)
                 sys.exit(1)
             
-            print(f"Loading {len(ids)} IDs from {args.file}")
+            print(f"Loading IDs from {'stdin' if args.file == '-' else args.file}")
+            
+            n_read = 0
+            def report(read, added, rate):
+                nonlocal n_read
+                n_read = read
+                print(f"\r{read:,} IDs read, {added:,} new ({rate:,.0f} rows/sec)", end="", flush=True)
             
             tracker = ObjectTracker(args.progress_db)
-            tracker.add_objects(ids, title=args.title, type=args.type)
+            start = time.perf_counter()
+            with source:
+                ids = iter_ids(source, column=args.column, delimiter=args.delimiter, has_header=not args.no_header)
+                added = tracker.add_objects_stream(ids, title=args.title, type=args.type,
+                                                   chunk_size=args.chunk_size, progress=report, priority=args.priority)
+            print()
             
-            print(f"Added {len(ids)} {args.type} objects to tracker")
+            if n_read == 0:
+                print("No IDs found in file.", file=sys.stderr)
+                tracker.close()
+                sys.exit(1)
+            
+            print(f"Added {added:,} {args.type} objects to tracker in {time.perf_counter() - start:.1f} sec.")
             print_stats(tracker, args.type)
             tracker.close()
             
@@ -215,11 +475,35 @@ def main():
             # Start scraping
             print("Initializing scraper...")
             
+            response_cache = None
+            if args.cache_dir:
+                response_cache = ResponseCache(args.cache_dir, mode=args.cache_mode, max_bytes=int(args.cache_max_gb * 2**30),
+                                               ttl=args.cache_ttl.total_seconds() if args.cache_ttl else None)
+            
             scraper = TT_Content_Scraper(
                 wait_time=args.wait_time,
                 output_files_fp=args.output_dir,
                 progress_file_fn=args.progress_db,
-                clear_console=args.clear_console
+                clear_console=args.clear_console,
+                workers=args.workers,
+                worker_id=args.worker_id,
+                buffered_tracker=args.buffered_tracker,
+                metadata_sink=args.metadata_sink,
+                segment_compress=args.compress_segments,
+                columnar_export=args.columnar_export,
+                dedup_files=args.dedup_files,
+                entity_store=args.entity_store,
+                adaptive_rate=args.adaptive_rate,
+                max_rate=args.max_rate,
+                proxies=load_proxies(args.proxy_file) if args.proxy_file else None,
+                proxy_concurrency=args.proxy_concurrency,
+                retry_policy=RetryPolicy(max_attempts=args.max_attempts),
+                stats_snapshots=args.stats_snapshots,
+                response_cache=response_cache,
+                metrics_port=args.metrics_port,
+                profile=args.profile,
+                profile_every=args.profile_every,
+                profile_dir=args.profile_dir
             )
             
             try:
@@ -238,6 +522,8 @@ def main():
                 print("\nScraping interrupted by user.")
             except AssertionError as e:
                 print(f"Scraping completed: {e}")
+            finally:
+                scraper.close()
             #except Exception as e:
             #    print(f"Error during scraping: {e}", file=sys.stderr)
             #    sys.exit(1)
@@ -267,16 +553,47 @@ def main():
                         print(f"  Attempts: {status['attempts']}")
                     if status['file_path']:
                         print(f"  File: {status['file_path']}")
+                    if status['lease_owner']:
+                        print(f"  Claimed by: {status['lease_owner']} (until {status['lease_expires_at']})")
                     print()
                 else:
                     print(f"ID {obj_id}: Not found in tracker")
             
             tracker.close()
             
+        elif args.command == "refresh":
+            tracker = ObjectTracker(args.progress_db)
+            count = tracker.requeue_for_refresh(args.older_than, decay=args.decay, max_age=args.max_age,
+                                                limit=args.limit, priority=args.priority, title=args.title)
+            print(f"Queued {count:,} content objects for a stats refresh, run 'scrape' to take the snapshots")
+            print_stats(tracker, "content")
+            tracker.close()
+
+        elif args.command == "prioritize":
+            tracker = ObjectTracker(args.progress_db)
+            if args.title is not None:
+                if args.priority is None and args.weight is None:
+                    print("Error: give --priority and/or --weight", file=sys.stderr)
+                    tracker.close()
+                    sys.exit(1)
+                if args.weight is not None and args.weight < 0:
+                    print("Error: --weight must be 0 (paused) or more", file=sys.stderr)
+                    tracker.close()
+                    sys.exit(1)
+                count = tracker.set_priority(args.title, priority=args.priority, weight=args.weight, type=args.type)
+                print(f"Changed {count:,} objects of '{args.title}'")
+
+            print(f"\n=== Seed lists ===")
+            for queue in tracker.get_queues():
+                print(f"{queue['title'] or '(no title)'} [{queue['type']}]: {queue['pending']:,} pending, "
+                      f"priority {queue['top_priority'] if queue['top_priority'] is not None else '-'}, weight {queue['weight']:g}"
+                      f"{' (paused)' if queue['weight'] == 0 else ''}")
+            tracker.close()
+
         elif args.command == "reset-errors":
             # Reset error objects to pending
             tracker = ObjectTracker(args.progress_db)
-            count = tracker.reset_errors_to_pending()
+            count = tracker.reset_errors_to_pending(reset_attempts=args.reset_attempts)
             print(f"Reset {count} error objects back to pending")
             print_stats(tracker)
             tracker.close()
@@ -289,6 +606,25 @@ def main():
             print_stats(tracker)
             tracker.close()
             
+        elif args.command == "export":
+            # Convert content_metadata/ to Parquet
+            input_dir = args.input or os.path.join(args.output_dir, "content_metadata")
+            export_dir = args.export_dir or os.path.join(args.output_dir, "columnar")
+            if not os.path.isdir(input_dir):
+                print(f"Error: Folder '{input_dir}' not found.", file=sys.stderr)
+                sys.exit(1)
+            
+            def report(records, done, total):
+                print(f"\r{records:,} records exported ({done}/{total} shards)", end="", flush=True)
+            
+            start = time.perf_counter()
+            # content records written with --entity-store refer to the authors, music and hashtags in entities.db
+            entities_db = os.path.join(args.output_dir, "entities.db")
+            n_records = export_metadata_tree(input_dir, export_dir, processes=args.processes, row_group_size=args.row_group_size,
+                                             progress=report, entities_db=entities_db if os.path.exists(entities_db) else None)
+            print()
+            print(f"Exported {n_records:,} records to {export_dir} in {time.perf_counter() - start:.1f} sec.")
+            
         elif args.command == "clear":
             # Clear all data
             if not args.confirm:
@@ -0,0 +1,121 @@
+import os
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+import logging
+from typing import Optional
+
+import TT_Content_Scraper.src.logger
+logger = logging.getLogger('TTCS.BinStore')
+
+class BinaryStore:
+    """
+    Content-addressed store for downloaded binaries.
+
+    Every file is kept once under {directory}/.objects/ab/cd/{sha256}{suffix}, the per-ID names
+    (tiktok_video_{id}.mp4, ...) are hardlinks to it, or copies where the file system has no hardlinks.
+    An SQLite index remembers which object holds the audio of a music id, so the audio of a sound that
+    was already downloaded is linked without downloading it again.
+    """
+
+    def __init__(self, directory):
+        self.objects_dir = Path(directory, ".objects")
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._music_downloads = {}
+        self.stats = {"stored": 0, "deduplicated": 0, "bytes_saved": 0, "music_hits": 0}
+
+        self.index = sqlite3.connect(self.objects_dir / "index.db", check_same_thread=False, timeout=30)
+        self.index.execute("PRAGMA journal_mode = WAL")
+        self.index.execute("PRAGMA synchronous = NORMAL")
+        self.index.execute("""
+            CREATE TABLE IF NOT EXISTS music (
+                music_id TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                suffix TEXT NOT NULL
+            )
+        """)
+        self.index.commit()
+
+    def object_path(self, sha256 : str, suffix : str) -> Path:
+        return Path(self.objects_dir, sha256[:2], sha256[2:4], f"{sha256}{suffix}")
+
+    def place(self, tmp_filename, sha256 : str, filename) -> Path:
+        """
+        Move a finished download (`tmp_filename`, in the same folder as `filename`) into the store
+        and make `filename` refer to it. If the content is already stored, the download is dropped.
+        """
+        filename = Path(filename)
+        object_path = self.object_path(sha256, filename.suffix)
+        if object_path.exists():
+            size = os.path.getsize(tmp_filename)
+            os.unlink(tmp_filename)
+            with self._lock:
+                self.stats["deduplicated"] += 1
+                self.stats["bytes_saved"] += size
+        else:
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_filename, object_path)
+            with self._lock:
+                self.stats["stored"] += 1
+
+        # the name of the temporary file is free again, link through it to replace `filename` atomically
+        self._link(object_path, tmp_filename)
+        os.replace(tmp_filename, filename)
+        return filename
+
+    def _link(self, object_path, link_name):
+        try:
+            os.link(object_path, link_name)
+        except OSError:
+            shutil.copyfile(object_path, link_name)
+
+    def link_music(self, music_id : str, filename) -> Optional[Path]:
+        """Let `filename` refer to the stored audio of `music_id`. Returns None if the music is not known yet."""
+        with self._lock:
+            row = self.index.execute("SELECT sha256, suffix FROM music WHERE music_id = ?", (str(music_id),)).fetchone()
+        if row is None:
+            return None
+        object_path = self.object_path(*row)
+        if not object_path.exists():
+            return None
+
+        filename = Path(filename)
+        link_name = filename.with_name(f".{filename.name}.{os.getpid()}.{threading.get_ident()}.link")
+        self._link(object_path, link_name)
+        os.replace(link_name, filename)
+        with self._lock:
+            self.stats["music_hits"] += 1
+            self.stats["bytes_saved"] += object_path.stat().st_size
+        logger.debug(f"▼ music {music_id} already stored, linked to {filename}")
+        return filename
+
+    def claim_music_download(self, music_id : str) -> Optional[threading.Event]:
+        """
+        Returns None if the caller is the first to download the audio of `music_id` (it must call finish_music_download),
+        otherwise an Event that is set once the download running in another thread has finished.
+        """
+        with self._lock:
+            running = self._music_downloads.get(music_id)
+            if running is None:
+                self._music_downloads[music_id] = threading.Event()
+            return running
+
+    def finish_music_download(self, music_id : str):
+        with self._lock:
+            self._music_downloads.pop(music_id).set()
+
+    def remember_music(self, music_id : str, sha256 : str, suffix : str):
+        with self._lock:
+            try:
+                self.index.execute("INSERT OR IGNORE INTO music (music_id, sha256, suffix) VALUES (?, ?, ?)",
+                                   (str(music_id), sha256, suffix))
+                self.index.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error remembering music {music_id}: {e}")
+                raise
+
+    def close(self):
+        with self._lock:
+            self.index.close()
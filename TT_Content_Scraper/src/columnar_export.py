@@ -0,0 +1,239 @@
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from multiprocessing import Pool
+from pathlib import Path
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+import TT_Content_Scraper.src.logger
+from TT_Content_Scraper.src.scraper_functions._filter_tiktok_data import FIELD_SCHEMA, TABLES, _force_to_int
+from TT_Content_Scraper.src.entity_store import EntityStore
+logger = logging.getLogger('TTCS.Columnar')
+
+# columns that are not part of FIELD_SCHEMA: the slide flag set after downloading, and the hashtags of a video
+EXTRA_COLUMNS = {
+    "file_metadata": [("is_slide", "boolean")],
+    "hashtags_metadata": [("video_id", "bigint NOT NULL"), ("name", "character varying(250)"), ("id", "bigint"),
+                          ("type", "smallint"), ("sub_type", "smallint"), ("is_commerce", "boolean"), ("description", "text")],
+}
+COLUMNAR_TABLES = TABLES + ["hashtags_metadata"]
+
+def table_columns(table) -> list:
+    """(column, SQL type) of a table in the order of the exported files."""
+    columns = [(column, sql_type) for field_table, column, _, _, _, _, sql_type in FIELD_SCHEMA if field_table == table]
+    return columns + EXTRA_COLUMNS.get(table, [])
+
+# SQL type -> arrow type and a function that makes a value fit it
+
+def _to_int(value):
+    if value is None or isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return _force_to_int(value)
+
+def _to_bool(value):
+    return None if value is None else bool(value)
+
+def _to_float(value):
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_str(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+def _to_timestamp(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def _list_of(convert):
+    def to_list(value):
+        if value is None:
+            return None
+        if not isinstance(value, list):
+            value = [value]
+        return [convert(element) for element in value]
+    return to_list
+
+def _arrow_type(sql_type):
+    """Return (arrow type, conversion) for an SQL type as noted in FIELD_SCHEMA."""
+    sql_type = sql_type.replace(" NOT NULL", "")
+    if sql_type == "json[]":
+        return pyarrow.list_(pyarrow.string()), _list_of(_to_str)
+    if sql_type.endswith("[]"):
+        element_type, convert = _arrow_type(sql_type[:-2])
+        return pyarrow.list_(element_type), _list_of(convert)
+    if sql_type in ("bigint", "integer", "smallint"):
+        return pyarrow.int64(), _to_int
+    if sql_type == "boolean":
+        return pyarrow.bool_(), _to_bool
+    if sql_type.startswith("numeric"):
+        return pyarrow.float64(), _to_float
+    if sql_type.startswith("timestamp"):
+        return pyarrow.timestamp("s"), _to_timestamp
+    # text, character varying, path, json
+    return pyarrow.string(), _to_str
+
+class ColumnarSink:
+    """
+    Write filtered content metadata to one Parquet dataset per table (directory/{table}/*.parquet).
+
+    Records are collected per table and written as a typed row group every `row_group_size` rows.
+    A new file is started every `rows_per_file` rows, so an interrupted scraper only loses its last file.
+    Every sink writes its own files, several processes can use the same directory.
+    """
+
+    def __init__(self, directory, row_group_size = 10_000, rows_per_file = 1_000_000, compression = "zstd", tag = None):
+        if pyarrow is None:
+            raise ImportError("The columnar export requires pyarrow (pip install pyarrow)")
+        self.directory = Path(directory)
+        self.row_group_size = row_group_size
+        self.rows_per_file = rows_per_file
+        self.compression = compression
+        self.tag = tag or f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self._lock = threading.Lock()
+        self._schemas = {}
+        self._converters = {}
+        self._buffers = {}
+        self._writers = {}
+        self._file_numbers = {}
+        self._rows_in_file = {}
+        for table in COLUMNAR_TABLES:
+            columns = table_columns(table)
+            types = [_arrow_type(sql_type) for _, sql_type in columns]
+            self._schemas[table] = pyarrow.schema([(column, arrow_type) for (column, _), (arrow_type, _) in zip(columns, types)])
+            self._converters[table] = [(column, convert) for (column, _), (_, convert) in zip(columns, types)]
+            self._buffers[table] = []
+            self._file_numbers[table] = 0
+            self._rows_in_file[table] = 0
+        atexit.register(self.close)
+
+    def add(self, metadata_package : dict):
+        """Add the output of _filter_tiktok_data (as written to content_metadata/)."""
+        video_id = _to_int(metadata_package["video_metadata"].get("id"))
+        rows = {table: [metadata_package.get(table) or {}] for table in TABLES}
+        rows["hashtags_metadata"] = [dict(hashtag, video_id=video_id) for hashtag in metadata_package.get("hashtags_metadata") or []]
+
+        with self._lock:
+            for table, table_rows in rows.items():
+                buffer = self._buffers[table]
+                buffer.extend(table_rows)
+                if len(buffer) >= self.row_group_size:
+                    self._write_row_group(table)
+
+    def flush(self):
+        """Write all collected rows, even if a row group is not full yet."""
+        with self._lock:
+            for table in COLUMNAR_TABLES:
+                if self._buffers[table]:
+                    self._write_row_group(table)
+
+    def _write_row_group(self, table):
+        rows, self._buffers[table] = self._buffers[table], []
+        columns = {column: [convert(row.get(column)) for row in rows] for column, convert in self._converters[table]}
+        arrow_table = pyarrow.Table.from_pydict(columns, schema=self._schemas[table])
+
+        writer = self._writers.get(table)
+        if writer is None or self._rows_in_file[table] >= self.rows_per_file:
+            if writer is not None:
+                writer.close()
+            self._file_numbers[table] += 1
+            path = Path(self.directory, table, f"part-{self.tag}-{self._file_numbers[table]:05d}.parquet")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            writer = self._writers[table] = pyarrow.parquet.ParquetWriter(path, self._schemas[table], compression=self.compression)
+            self._rows_in_file[table] = 0
+        writer.write_table(arrow_table, row_group_size=self.row_group_size)
+        self._rows_in_file[table] += len(rows)
+        logger.debug(f"Wrote {len(rows)} rows to {table}")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers = {}
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _iter_records(path : Path):
+    """Yield the metadata records of a JSON file or of a segment file."""
+    if path.name.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield json.load(f)
+        return
+
+    # gzip.open also reads the one gzip member per record layout of compressed segments
+    opener = gzip.open if path.name.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _export_shard(args) -> int:
+    paths, output_dir, tag, row_group_size, entities_db = args
+    entity_store = EntityStore(entities_db) if entities_db else None
+    n_records = 0
+    with ColumnarSink(output_dir, row_group_size=row_group_size, tag=tag) as sink:
+        for path in paths:
+            try:
+                for record in _iter_records(Path(path)):
+                    if entity_store is not None:
+                        record = entity_store.expand(record)
+                    sink.add(record)
+                    n_records += 1
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping {path}: {e}")
+    if entity_store is not None:
+        entity_store.close()
+    return n_records
+
+def export_metadata_tree(input_dir, output_dir, processes = None, row_group_size = 10_000, progress = None, entities_db = None) -> int:
+    """
+    Convert an existing content_metadata/ folder (JSON files and/or segment files) to Parquet datasets.
+    Records that refer to an entity store are expanded with the authors, music and hashtags in `entities_db`.
+
+    The files are split into shards that are converted on `processes` worker processes (default: all cores),
+    each writing its own part files. progress(records, shards done, shards) is called after every shard.
+    Returns the number of exported records.
+    """
+    if pyarrow is None:
+        raise ImportError("The columnar export requires pyarrow (pip install pyarrow)")
+    paths = sorted(str(entry.path) for entry in os.scandir(input_dir)
+                   if entry.name.endswith((".json", ".jsonl", ".jsonl.gz")))
+    if not paths:
+        return 0
+
+    processes = processes or os.cpu_count() or 1
+    # segments are big, JSON files are tiny: aim for shards of similar size with a few per process
+    n_shards = min(len(paths), processes * 4)
+    shards = [paths[i::n_shards] for i in range(n_shards)]
+    run_tag = time.strftime('%Y%m%d%H%M%S')
+    jobs = [(shard, output_dir, f"export-{run_tag}-{i:04d}", row_group_size, entities_db) for i, shard in enumerate(shards)]
+
+    n_records = 0
+    with Pool(processes) as pool:
+        for done, count in enumerate(pool.imap_unordered(_export_shard, jobs), start=1):
+            n_records += count
+            if progress is not None:
+                progress(n_records, done, len(jobs))
+    logger.info(f"Exported {n_records:,} records from {input_dir} to {output_dir}")
+    return n_records
@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import logging
+
+import TT_Content_Scraper.src.logger
+logger = logging.getLogger('TTCS.Entities')
+
+# key of the content record -> table of the entity store
+ENTITY_TABLES = {
+    "author_metadata": "authors",
+    "music_metadata": "music",
+    "hashtags_metadata": "hashtags",
+}
+
+class EntityStore:
+    """
+    Keep every author, music and hashtag once in an SQLite database instead of in every content record.
+
+    normalize() writes the entities of a content record and replaces them by their ids (under "entity_refs"),
+    expand() puts them back. An entity is only written when it is new or its content changed, and the
+    last `cache_size` entities are kept in memory, so an entity that did not change is neither
+    serialized nor sent to the database again.
+    """
+
+    def __init__(self, db_file, cache_size = 100_000):
+        Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
+        self.stats = {"cached": 0, "unchanged": 0, "written": 0}
+
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        try:
+            for table in ENTITY_TABLES.values():
+                self.conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        id TEXT PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error creating entity tables: {e}")
+            raise
+
+    def normalize(self, metadata_package : dict) -> dict:
+        """Store the author, music and hashtags of a content record and return the record with references instead."""
+        record = dict(metadata_package)
+        refs = {}
+        upserts = []
+
+        for key in ("author_metadata", "music_metadata"):
+            entity = record.get(key)
+            if entity and entity.get("id") is not None:
+                self._collect(ENTITY_TABLES[key], entity, upserts)
+                refs[key] = entity["id"]
+                del record[key]
+
+        hashtags = record.get("hashtags_metadata")
+        if hashtags and all(hashtag.get("id") is not None for hashtag in hashtags):
+            for hashtag in hashtags:
+                self._collect("hashtags", hashtag, upserts)
+            refs["hashtags_metadata"] = [hashtag["id"] for hashtag in hashtags]
+            del record["hashtags_metadata"]
+
+        if upserts:
+            self._write(upserts)
+        if refs:
+            record["entity_refs"] = refs
+        return record
+
+    def expand(self, record : dict) -> dict:
+        """Inverse of normalize."""
+        refs = record.get("entity_refs")
+        if not refs:
+            return record
+        record = dict(record)
+        del record["entity_refs"]
+        for key, ids in refs.items():
+            table = ENTITY_TABLES[key]
+            if isinstance(ids, list):
+                record[key] = [self.get(table, id) for id in ids]
+            else:
+                record[key] = self.get(table, ids)
+        return record
+
+    def get(self, table : str, id):
+        with self._lock:
+            cached = self._cache.get((table, str(id)))
+            if cached is not None:
+                return cached
+            row = self.conn.execute(f"SELECT data FROM {table} WHERE id = ?", (str(id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _collect(self, table, entity, upserts):
+        key = (table, str(entity["id"]))
+        with self._lock:
+            if self._cache.get(key) == entity:
+                self._cache.move_to_end(key)
+                self.stats["cached"] += 1
+                return
+            self._cache[key] = entity
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        upserts.append((table, key[1], json.dumps(entity, ensure_ascii=False, sort_keys=True)))
+
+    def _write(self, upserts):
+        with self._lock:
+            try:
+                with self.conn:
+                    for table, id, data in upserts:
+                        # the WHERE clause leaves rows whose content did not change untouched
+                        cursor = self.conn.execute(f"""
+                            INSERT INTO {table} (id, data) VALUES (?, ?)
+                            ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+                            WHERE data != excluded.data
+                        """, (id, data))
+                        self.stats["written" if cursor.rowcount else "unchanged"] += 1
+            except sqlite3.Error as e:
+                logger.error(f"Error writing {len(upserts)} entities: {e}")
+                raise
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
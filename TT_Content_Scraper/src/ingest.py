@@ -0,0 +1,82 @@
+import csv
+import gzip
+import io
+import itertools
+import sys
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def open_id_source(path : str):
+    """
+    Open a seed file as text, "-" is stdin.
+    gzip and zstd files are decompressed while reading (recognized by their first bytes, not the file name).
+    """
+    if path == "-":
+        raw = sys.stdin.buffer
+    else:
+        raw = open(path, "rb")
+
+    magic = raw.peek(4)[:4]
+    if magic.startswith(GZIP_MAGIC):
+        if path == "-":
+            raw = gzip.GzipFile(fileobj=raw, mode="rb")
+        else:
+            # a GzipFile does not close a file object it was given, gzip.open closes the file it opened
+            raw.close()
+            raw = gzip.open(path, "rb")
+    elif magic.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ImportError("Reading zstd files requires the zstandard package (pip install zstandard)")
+        raw = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+def iter_ids(stream, column = None, delimiter = ",", has_header = True):
+    """
+    Yield the IDs of a text stream without reading all of it.
+
+    column : None for one ID per line, otherwise the CSV column with the IDs,
+        either its 0-based index or its name in the header row.
+    has_header : the first row of the CSV file is a header and no ID (a named column always needs one).
+    """
+    if column is None:
+        for line in stream:
+            id = line.strip()
+            if id:
+                yield id
+        return
+
+    reader = csv.reader(stream, delimiter=delimiter)
+    if isinstance(column, int) or str(column).isdigit():
+        index = int(column)
+        if has_header:
+            next(reader, None)
+    elif not has_header:
+        raise ValueError(f"Column {column!r} is a name, which needs a header row, use its 0-based index")
+    else:
+        header = next(reader, [])
+        try:
+            index = [name.strip() for name in header].index(column)
+        except ValueError:
+            raise ValueError(f"Column {column!r} not found in the header {header}")
+
+    for row in reader:
+        if len(row) > index:
+            id = row[index].strip()
+            if id:
+                yield id
+
+def chunked(iterable, size : int):
+    """Yield lists of at most `size` items, only one of them is held in memory at a time."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
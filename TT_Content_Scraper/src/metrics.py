@@ -0,0 +1,277 @@
+import threading
+import time
+from contextlib import nullcontext
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import logging
+
+import TT_Content_Scraper.src.logger
+logger = logging.getLogger('TTCS.Metrics')
+
+# upper bounds in seconds, from a JSON write to a slow download or a backoff
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# where the time of an ID goes, see MetricsRegistry.time()
+STAGES = ("fetch_page", "extract", "decode", "filter", "download", "write", "tracker", "sleep", "budget_wait")
+
+def _label_text(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+def _number(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """A value per combination of labels that only goes up."""
+    kind = "counter"
+
+    def __init__(self, name, help, labels = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount = 1, **labels) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: value for key, value in self._values.items()}
+
+    def render(self) -> list:
+        return [f"{self.name}{_label_text(self.labels, key)} {_number(value)}" for key, value in sorted(self.snapshot().items())]
+
+
+class Histogram:
+    """Count, sum and cumulative buckets of observed values (seconds) per combination of labels."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labels = (), buckets = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {} # labels -> [count per bucket (the last one is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def time(self, **labels):
+        """Context manager that observes the seconds spent in it."""
+        return _Timer(self, labels)
+
+    def snapshot(self) -> dict:
+        """labels -> {"count", "sum", "buckets": cumulative count per upper bound}"""
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        result = {}
+        for key, (counts, total) in values.items():
+            cumulative, running = {}, 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                cumulative[bound] = running
+            result[key] = {"count": running, "sum": total, "buckets": cumulative}
+        return result
+
+    def render(self) -> list:
+        lines = []
+        for key, value in sorted(self.snapshot().items()):
+            for bound, count in value["buckets"].items():
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{_label_text(self.labels + ('le',), key + (le,))} {count}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(value['sum'])}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {value['count']}")
+        return lines
+
+
+class Gauge:
+    """A value that is read from `callback` whenever the metrics are collected. With `label`, the callback returns {label value: value}."""
+    kind = "gauge"
+
+    def __init__(self, name, help, callback, label = None):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labels = (label,) if label else ()
+
+    def snapshot(self) -> dict:
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} could not be read - {e!r}")
+            return {}
+        if self.labels:
+            return {(key,): value for key, value in value.items()}
+        return {(): value} if value is not None else {}
+
+    def render(self) -> list:
+        return [f"{self.name}{_label_text(self.labels, key)} {_number(value)}" for key, value in sorted(self.snapshot().items())]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry:
+    """
+    Counters, histograms and gauges of a scraper, as a Python API (snapshot()) and in the Prometheus
+    text format (render(), or on http://host:port/metrics after serve()).
+
+    The scrapers report to the metrics declared here:
+    - ttcs_stage_seconds{stage, kind}: time per stage (see STAGES), kind is "page", "user", "mp4", "mp3" or "jpeg" where it matters
+    - ttcs_id_seconds{type}: time per scraped ID
+    - ttcs_ids_total{outcome}: finished IDs by outcome (completed, refreshed, retry, error)
+    - ttcs_downloaded_bytes_total{kind}: bytes of pages and files received (or replayed by the response cache)
+    - ttcs_http_responses_total{status_class}: answers by status class (2xx ... 5xx), "failed" for requests without an answer
+    - ttcs_retries_total{scope, error_class}: "immediate" retries of a page or file, and retries "scheduled" by the retry policy
+
+    fetch_page and download include the wait for the request budget of adaptive_rate, budget_wait shows how much of it that was.
+    sleep is the time spent pacing the IDs (wait_time) and in backoffs.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self.stages = self.histogram("ttcs_stage_seconds", "Seconds spent per stage of scraping an ID", ("stage", "kind"))
+        self.id_seconds = self.histogram("ttcs_id_seconds", "Seconds from the start to the end of an ID", ("type",))
+        self.ids = self.counter("ttcs_ids_total", "Finished IDs by outcome", ("outcome",))
+        self.downloaded_bytes = self.counter("ttcs_downloaded_bytes_total", "Bytes of pages and files received", ("kind",))
+        self.responses = self.counter("ttcs_http_responses_total", "HTTP answers by status class", ("status_class",))
+        self.retries = self.counter("ttcs_retries_total", "Retries of pages, files and IDs", ("scope", "error_class"))
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind or existing.labels != metric.labels:
+                    raise ValueError(f"Metric {metric.name} is already registered as a {existing.kind} with labels {existing.labels}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labels = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels = (), buckets = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, callback, label = None) -> Gauge:
+        """Register (or replace) a gauge that calls `callback` on every collection."""
+        gauge = Gauge(name, help, callback, label)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    # shortcuts for the scrapers
+    def time(self, stage, kind = ""):
+        """Context manager that adds the seconds spent in it to `stage`."""
+        return self.stages.time(stage=stage, kind=kind)
+
+    def observe(self, stage, seconds, kind = "") -> None:
+        self.stages.observe(seconds, stage=stage, kind=kind)
+
+    def count_response(self, status) -> None:
+        self.responses.inc(status_class=f"{status // 100}xx" if status else "failed")
+
+    def snapshot(self) -> dict:
+        """name -> {label values (tuple): value}, for histograms the value is {"count", "sum", "buckets"}."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def stage_summary(self) -> dict:
+        """(stage, kind) -> {"count", "seconds"}: where the wall-clock time went."""
+        return {key: {"count": value["count"], "seconds": value["sum"]} for key, value in self.stages.snapshot().items()}
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port = 9108, host = "127.0.0.1") -> str:
+        """Serve render() on http://host:port/metrics from a background thread. Returns the url."""
+        if self._server is not None:
+            return self.url
+        registry = self
+        class Handler(_MetricsHandler):
+            metrics = registry
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="TTCS-metrics", daemon=True).start()
+        logger.info(f"Metrics on {self.url}")
+        return self.url
+
+    @property
+    def url(self):
+        if self._server is None:
+            return None
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def timed(metrics, stage, kind = ""):
+    """metrics.time(stage, kind), or a context manager that does nothing if there are no metrics."""
+    if metrics is None:
+        return nullcontext()
+    return metrics.time(stage, kind)
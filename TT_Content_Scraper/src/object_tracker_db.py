@@ -1,12 +1,19 @@
 import sqlite3
 import os
-from datetime import datetime
+import threading
+import functools
+import itertools
+import time
+import atexit
+import signal
+from datetime import datetime, timedelta
 from enum import Enum
 from pathlib import Path
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Callable
 
 import TT_Content_Scraper.src.logger
+from TT_Content_Scraper.src.ingest import chunked
 logger = logging.getLogger('TTCS.ObjTracker')
 
 class ObjectStatus(Enum):
@@ -14,26 +21,146 @@ class ObjectStatus(Enum):
     COMPLETED = "completed"
     ERROR = "error"
     RETRY = "retry"
+    IN_PROGRESS = "in_progress"
+
+
+# Schema changes after the initial objects table, applied in order and recorded in PRAGMA user_version
+MIGRATIONS = [
+    # 1: leases for claiming work from several processes
+    [
+        "ALTER TABLE objects ADD COLUMN lease_owner TEXT",
+        "ALTER TABLE objects ADD COLUMN lease_expires_at TIMESTAMP",
+        "CREATE INDEX IF NOT EXISTS idx_lease ON objects(status, lease_expires_at)",
+    ],
+    # 2: every UPDATE sets updated_at itself, the trigger doubled each row change
+    [
+        "DROP TRIGGER IF EXISTS update_timestamp",
+    ],
+    # 3: queue index, SQLite appends the rowid to every index, so this is (status, type, rowid)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_queue ON objects(status, type)",
+    ],
+    # 4: retries are scheduled, the queue skips them until they are due
+    [
+        "ALTER TABLE objects ADD COLUMN next_attempt_at TIMESTAMP",
+    ],
+    # 5: priorities and fair share between seed lists: every (type, title) is a queue with a weight
+    [
+        "ALTER TABLE objects ADD COLUMN priority INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_fair ON objects(status, type, title, priority)",
+        "CREATE TABLE IF NOT EXISTS queues (type TEXT, title TEXT, weight REAL NOT NULL DEFAULT 1)",
+        "INSERT INTO queues (type, title) SELECT DISTINCT type, title FROM objects",
+    ],
+    # 6: stats refresh, completed content is queued again (refresh = 1) to take a snapshot of its counters
+    [
+        "ALTER TABLE objects ADD COLUMN refresh INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE objects ADD COLUMN posted_at TIMESTAMP",
+        "ALTER TABLE objects ADD COLUMN refreshed_at TIMESTAMP",
+        "CREATE INDEX IF NOT EXISTS idx_last_scraped ON objects(status, type, COALESCE(refreshed_at, completed_at))",
+    ],
+    # 7: one row per queue, processes that added the same seed list at once could each insert one.
+    # NULLs are distinct in a UNIQUE index, so a missing type or title is indexed as an empty blob, which equals no text
+    [
+        "DELETE FROM queues WHERE rowid NOT IN (SELECT MIN(rowid) FROM queues GROUP BY type, title)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_queues ON queues(IFNULL(type, x''), IFNULL(title, x''))",
+    ],
+    # 8: due retries are a range of (status, next_attempt_at), so a claim does not read the retries that are not due yet.
+    # Retries of the time before they were scheduled have no next_attempt_at, they are due right away
+    [
+        "UPDATE objects SET next_attempt_at = COALESCE(last_attempt, '0001-01-01T00:00:00') WHERE status = 'retry' AND next_attempt_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_retry ON objects(status, next_attempt_at)",
+    ],
+]
+
+
+def _synchronized(method):
+    """Serialize access to the shared SQLite connection, so several worker threads can use one tracker."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _flushed(method):
+    """Write the buffered status updates first, so `method` sees (and changes) the current state."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._buffer:
+            self._flush()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+# status transitions that can be buffered, each one is a single statement without a read before it
+_COMPLETED_SQL = """
+    UPDATE objects 
+    SET status = ?, completed_at = ?, file_path = ?, posted_at = COALESCE(?, posted_at), lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+# a refresh keeps file_path and completed_at of the first scrape
+_REFRESHED_SQL = """
+    UPDATE objects 
+    SET status = ?, refresh = 0, refreshed_at = ?, posted_at = COALESCE(?, posted_at), last_error = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+_ERROR_SQL = """
+    UPDATE objects 
+    SET status = ?, attempts = attempts + 1, last_error = ?, last_attempt = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+_RETRY_SQL = """
+    UPDATE objects 
+    SET status = ?, attempts = attempts + 1, last_error = ?, last_attempt = ?, next_attempt_at = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+
+
+# objects of queues (seed lists) that were paused with weight 0 are not handed out
+_NOT_PAUSED = "NOT EXISTS (SELECT 1 FROM queues WHERE queues.type IS objects.type AND queues.title IS objects.title AND queues.weight = 0)"
 
 
 class ObjectTracker:
     """Create an SQLite database that tracks whether an object (like a video id) was already processed or caused an error etc."""
     
-    def __init__(self, db_file="progress_tracking/scraping_progress.db"):
+    def __init__(self, db_file="progress_tracking/scraping_progress.db", buffered=False, flush_every=100, flush_interval_ms=1000):
+        """
+        buffered : queue mark_completed and mark_error in memory and write them in one transaction
+            every `flush_every` updates or at most `flush_interval_ms` milliseconds after the first one
+            (a background thread writes them if no further update comes), on close and on SIGTERM.
+            Updates that were not flushed yet are lost if the process is killed hard, and the IDs are scraped again.
+        """
         path_obj = Path(db_file)
         path_obj.parent.mkdir(parents=True, exist_ok=True)
 
+        self._lock = threading.RLock()
+        self._buffer = []
+        self.buffered = buffered
+        self.flush_every = max(1, int(flush_every))
+        self.flush_interval = flush_interval_ms / 1000
+        self._buffer_started_at = time.monotonic()
+        # fair share credit of every queue, carried over from one claim to the next
+        self._credits = {}
+
         if db_file is not None:
             self.db_file = db_file
             self.conn = None
             self._connect()
             self._create_tables()
             self._create_indexes()
+            self._migrate()
+
+        if buffered:
+            atexit.register(self.flush)
+            self._install_sigterm_handler()
+            self._stop_flusher = threading.Event()
+            threading.Thread(target=self._flush_periodically, name="TTCS-tracker-flush", daemon=True).start()
     
     def _connect(self):
         """Establish connection to SQLite database."""
         try:
-            self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            # several scraper processes may share the file, so wait for their write locks instead of failing
+            self.conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=30)
             # Enable foreign keys and set pragmas for better performance
             self.conn.execute("PRAGMA foreign_keys = ON")
             self.conn.execute("PRAGMA journal_mode = WAL")  # Better concurrent access
@@ -69,21 +196,11 @@ class ObjectTracker:
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """
-        
-        # Create trigger to update the updated_at timestamp
-        create_trigger_sql = """
-        CREATE TRIGGER IF NOT EXISTS update_timestamp 
-        AFTER UPDATE ON objects
-        BEGIN
-            UPDATE objects SET updated_at = CURRENT_TIMESTAMP 
-            WHERE id = NEW.id;
-        END;
-        """
+
         
         try:
             self.conn.execute(create_table_sql)
             self.conn.execute(create_metadata_sql)
-            self.conn.execute(create_trigger_sql)
             self.conn.commit()
             logger.info("Database tables created successfully")
         except sqlite3.Error as e:
@@ -107,6 +224,22 @@ class ObjectTracker:
             logger.error(f"Error creating indexes: {e}")
             raise
     
+    @_synchronized
+    def _migrate(self):
+        """Bring an existing database up to the current schema version."""
+        try:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in statements:
+                    self.conn.execute(statement)
+                self.conn.execute(f"PRAGMA user_version = {number}")
+                self.conn.commit()
+                logger.info(f"Database migrated to schema version {number}")
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error migrating database: {e}")
+            raise
+
     def _update_metadata(self, key: str, value: str):
         """Update metadata table."""
         try:
@@ -119,33 +252,96 @@ class ObjectTracker:
             logger.error(f"Error updating metadata: {e}")
             raise
             
-    def add_object(self, id: str, title: Optional[str] = None, type: Optional[str] = None):
+    def _enqueue(self, sql: str, params: tuple):
+        if not self._buffer:
+            self._buffer_started_at = time.monotonic()
+        self._buffer.append((sql, params))
+        if len(self._buffer) >= self.flush_every or time.monotonic() - self._buffer_started_at >= self.flush_interval:
+            self._flush()
+
+    @_synchronized
+    def flush(self):
+        """Write all buffered status updates to the database"""
+        if self._buffer:
+            self._flush()
+
+    @_synchronized
+    def _flush_if_due(self):
+        if self._buffer and time.monotonic() - self._buffer_started_at >= self.flush_interval:
+            self._flush()
+
+    def _flush_periodically(self):
+        # updates wait at most about 1.5 * flush_interval, even when no further update comes along
+        while not self._stop_flusher.wait(self.flush_interval / 2):
+            try:
+                self._flush_if_due()
+            except sqlite3.Error:
+                pass # logged by _flush, the updates stay buffered for the next attempt
+
+    def _flush(self):
+        if self.conn is None:
+            return
+        updates, self._buffer = self._buffer, []
+        try:
+            with self.conn:
+                # consecutive updates of the same kind go into one executemany, the order of all updates is kept
+                for sql, group in itertools.groupby(updates, key=lambda update: update[0]):
+                    self.conn.executemany(sql, [params for _, params in group])
+            logger.debug(f"Flushed {len(updates)} status updates")
+        except sqlite3.Error as e:
+            # keep them for the next attempt
+            self._buffer = updates + self._buffer
+            logger.error(f"Error flushing {len(updates)} status updates: {e}")
+            raise
+
+    def _install_sigterm_handler(self):
+        # signal handlers can only be set from the main thread
+        if threading.current_thread() is not threading.main_thread():
+            return
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def handler(signum, frame):
+            self.flush()
+            if callable(previous):
+                previous(signum, frame)
+            else:
+                raise SystemExit(128 + signum)
+
+        signal.signal(signal.SIGTERM, handler)
+
+    @_synchronized
+    @_flushed
+    def add_object(self, id: str, title: Optional[str] = None, type: Optional[str] = None, priority: int = 0):
         """Add a new object to track"""
         try:
+            self._register_queue(type, title)
             self.conn.execute("""
                 INSERT OR IGNORE INTO objects 
-                (id, status, title, type, added_at, attempts) 
-                VALUES (?, ?, ?, ?, ?, 0)
-            """, (id, ObjectStatus.PENDING.value, title, type, datetime.now().isoformat()))
+                (id, status, title, type, added_at, attempts, priority) 
+                VALUES (?, ?, ?, ?, ?, 0, ?)
+            """, (id, ObjectStatus.PENDING.value, title, type, datetime.now().isoformat(), priority))
             self.conn.commit()
             
         except sqlite3.Error as e:
             logger.error(f"Error adding object {id}: {e}")
             raise
     
-    def add_objects(self, ids: List[str], title: Optional[str] = None, type: Optional[str] = None):
+    @_synchronized
+    @_flushed
+    def add_objects(self, ids: List[str], title: Optional[str] = None, type: Optional[str] = None, priority: int = 0):
         """Add multiple objects to track"""
         try:
             current_time = datetime.now().isoformat()
             objects_data = [
-                (id, ObjectStatus.PENDING.value, title, type, current_time, 0) 
+                (id, ObjectStatus.PENDING.value, title, type, current_time, 0, priority) 
                 for id in ids
             ]
             
+            self._register_queue(type, title)
             self.conn.executemany("""
                 INSERT OR IGNORE INTO objects 
-                (id, status, title, type, added_at, attempts) 
-                VALUES (?, ?, ?, ?, ?, ?)
+                (id, status, title, type, added_at, attempts, priority) 
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             """, objects_data)
             self.conn.commit()
             
@@ -154,20 +350,68 @@ class ObjectTracker:
             logger.error(f"Error adding objects: {e}")
             raise
     
-    def mark_completed(self, id: str, file_path: Optional[str] = None):
-        """Mark object as successfully completed"""
+    @_synchronized
+    @_flushed
+    def add_objects_stream(self, ids: Iterable[str], title: Optional[str] = None, type: Optional[str] = None,
+                           chunk_size: int = 50_000, progress: Optional[Callable[[int, int, float], None]] = None,
+                           priority: int = 0) -> int:
+        """
+        Add objects from any iterable of IDs (e.g. a generator over a huge file) in chunks of `chunk_size`.
+
+        Only one chunk is held in memory, and every chunk is committed on its own, so an interrupted
+        ingest can simply be started again. Durability is relaxed while loading (synchronous = OFF).
+        progress(read, added, rows_per_second) is called after every chunk. Returns the number of new objects.
+        """
+        current_time = datetime.now().isoformat()
+        read = added = 0
+        start = time.perf_counter()
         try:
-            self.conn.execute("""
-                UPDATE objects 
-                SET status = ?, completed_at = ?, file_path = ?
-                WHERE id = ?
-            """, (ObjectStatus.COMPLETED.value, datetime.now().isoformat(), file_path, id))
+            self.conn.execute("PRAGMA synchronous = OFF")
+            self.conn.execute("PRAGMA cache_size = -65536") # 64 MiB, keeps the primary key index in memory
+            self.conn.execute("PRAGMA temp_store = MEMORY")
+            with self.conn:
+                self._register_queue(type, title)
+            for chunk in chunked(ids, chunk_size):
+                changes_before = self.conn.total_changes
+                with self.conn:
+                    self.conn.executemany("""
+                        INSERT OR IGNORE INTO objects 
+                        (id, status, title, type, added_at, attempts, priority) 
+                        VALUES (?, ?, ?, ?, ?, 0, ?)
+                    """, [(id, ObjectStatus.PENDING.value, title, type, current_time, priority) for id in chunk])
+                read += len(chunk)
+                added += self.conn.total_changes - changes_before
+                rate = read / max(time.perf_counter() - start, 1e-9)
+                if progress is not None:
+                    progress(read, added, rate)
+                logger.debug(f"Ingested {read:,} IDs ({added:,} new, {rate:,.0f} rows/sec)")
+        except sqlite3.Error as e:
+            logger.error(f"Error adding objects: {e}")
+            raise
+        finally:
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.execute("PRAGMA cache_size = -2000")
+
+        logger.info(f"Added {added:,} of {read:,} objects to tracker in {time.perf_counter() - start:.1f} sec.")
+        return added
+
+    @_synchronized
+    def mark_completed(self, id: str, file_path: Optional[str] = None, posted_at: Optional[str] = None):
+        """Mark object as successfully completed. `posted_at` (creation time of the content) schedules stats refreshes."""
+        params = (ObjectStatus.COMPLETED.value, datetime.now().isoformat(), file_path, posted_at, id)
+        if self.buffered:
+            self._enqueue(_COMPLETED_SQL, params)
+            return
+        try:
+            self.conn.execute(_COMPLETED_SQL, params)
             self.conn.commit()
             
         except sqlite3.Error as e:
             logger.error(f"Error marking object {id} as completed: {e}")
             raise
     
+    @_synchronized
+    @_flushed
     def mark_completed_multi(self, ids: List[str], file_paths: Optional[List[str]] = None):
         """Mark multiple objects as successfully completed"""
         try:
@@ -176,21 +420,17 @@ class ObjectTracker:
             if file_paths:
                 # With file paths
                 update_data = [
-                    (ObjectStatus.COMPLETED.value, current_time, file_paths[i], ids[i])
+                    (ObjectStatus.COMPLETED.value, current_time, file_paths[i], None, ids[i])
                     for i in range(len(ids))
                 ]
             else:
                 # Without file paths
                 update_data = [
-                    (ObjectStatus.COMPLETED.value, current_time, None, id)
+                    (ObjectStatus.COMPLETED.value, current_time, None, None, id)
                     for id in ids
                 ]
             
-            self.conn.executemany("""
-                UPDATE objects 
-                SET status = ?, completed_at = ?, file_path = ?
-                WHERE id = ?
-            """, update_data)
+            self.conn.executemany(_COMPLETED_SQL, update_data)
             self.conn.commit()
             
             logger.info(f"Marked {len(ids)} objects as completed")
@@ -198,58 +438,406 @@ class ObjectTracker:
             logger.error(f"Error marking objects as completed: {e}")
             raise
     
+    @_synchronized
+    def mark_refreshed(self, id: str, posted_at: Optional[str] = None, error_message: Optional[str] = None):
+        """
+        Set a refreshed object back to completed. With `error_message` the refresh failed for good,
+        the object stays completed (with the data of earlier scrapes) and is refreshed again on the next schedule.
+        """
+        params = (ObjectStatus.COMPLETED.value, datetime.now().isoformat(), posted_at, error_message, id)
+        if self.buffered:
+            self._enqueue(_REFRESHED_SQL, params)
+            return
+        try:
+            self.conn.execute(_REFRESHED_SQL, params)
+            self.conn.commit()
+
+        except sqlite3.Error as e:
+            logger.error(f"Error marking object {id} as refreshed: {e}")
+            raise
+
+    @_synchronized
+    @_flushed
+    def requeue_for_refresh(self, min_age: timedelta, decay: Optional[float] = None, max_age: timedelta = timedelta(days=30),
+                            limit: Optional[int] = None, priority: Optional[int] = None, title: Optional[str] = None) -> int:
+        """
+        Queue completed content again to take a new snapshot of its counters (metadata only, no files).
+
+        Content is due when it was last scraped (or refreshed) at least `min_age` ago. With `decay`, the
+        interval grows with the age of the post: decay * (time since posted), at least `min_age` and at most
+        `max_age`. E.g. decay = 0.25 refreshes a post of yesterday every 6 hours and one of last month weekly.
+        At most `limit` IDs (the longest unrefreshed first), optionally only of seed list `title` and with a new `priority`.
+        Returns the number of queued IDs.
+        """
+        now = datetime.now()
+        last_scraped = "COALESCE(refreshed_at, completed_at)"
+        # the index range only holds content that was scraped at least min_age ago, decay narrows it down
+        where = f"status = ? AND type = ? AND {last_scraped} <= ?"
+        params = [ObjectStatus.COMPLETED.value, "content", (now - min_age).isoformat()]
+        if decay is not None:
+            # in days, julianday() reads the ISO timestamps
+            interval = f"MIN(?, MAX(?, ? * (julianday(?) - julianday(COALESCE(posted_at, completed_at)))))"
+            where += f" AND julianday({last_scraped}) + {interval} <= julianday(?)"
+            params += [max_age.total_seconds() / 86400, min_age.total_seconds() / 86400, decay, now.isoformat(), now.isoformat()]
+        if title is not None:
+            where += " AND title IS ?"
+            params.append(title)
+        order = f"ORDER BY {last_scraped} LIMIT ?" if limit is not None else ""
+        if limit is not None:
+            params.append(limit)
+
+        try:
+            with self.conn:
+                cursor = self.conn.execute(f"""
+                    UPDATE objects
+                    SET status = ?, refresh = 1, attempts = 0, next_attempt_at = NULL, priority = COALESCE(?, priority), updated_at = CURRENT_TIMESTAMP
+                    WHERE rowid IN (SELECT rowid FROM objects WHERE {where} {order})
+                """, [ObjectStatus.PENDING.value, priority] + params)
+            logger.info(f"Queued {cursor.rowcount:,} content objects for a stats refresh")
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Error queueing objects for a refresh: {e}")
+            raise
+
+    @_synchronized
     def mark_error(self, id: str, error_message: str):
         """Mark object as error"""
+        params = (ObjectStatus.ERROR.value, error_message, datetime.now().isoformat(), id)
+        if self.buffered:
+            self._enqueue(_ERROR_SQL, params)
+            return
         try:
-            current_time = datetime.now().isoformat()
-            
-            # Get current attempts count
-            cursor = self.conn.execute(
-                "SELECT attempts FROM objects WHERE id = ?", (id,)
-            )
-            result = cursor.fetchone()
-            attempts = (result[0] + 1) if result else 1
-            
-            self.conn.execute("""
-                UPDATE objects 
-                SET status = ?, attempts = ?, last_error = ?, last_attempt = ?
-                WHERE id = ?
-            """, (ObjectStatus.ERROR.value, attempts, error_message, current_time, id))
+            self.conn.execute(_ERROR_SQL, params)
             self.conn.commit()
             
         except sqlite3.Error as e:
             logger.error(f"Error marking object {id} as error: {e}")
             raise
-    
-    def get_pending_objects(self, type="all", limit:int=10**10) -> List[str]:
-        """Get all objects that need to be processed"""
+
+    @_synchronized
+    def mark_retry(self, id: str, error_message: str, next_attempt_at: datetime):
+        """Mark object as failed for now, it is handed out again from `next_attempt_at` on"""
+        params = (ObjectStatus.RETRY.value, error_message, datetime.now().isoformat(), next_attempt_at.isoformat(), id)
+        if self.buffered:
+            self._enqueue(_RETRY_SQL, params)
+            return
+        try:
+            self.conn.execute(_RETRY_SQL, params)
+            self.conn.commit()
+
+        except sqlite3.Error as e:
+            logger.error(f"Error scheduling a retry of object {id}: {e}")
+            raise
+
+    @_synchronized
+    @_flushed
+    def seconds_until_next_retry(self, type="all") -> Optional[float]:
+        """Seconds until the next scheduled retry of a queue that is not paused is due (0 if one is due already), None if there is none."""
         try:
             if type == "all":
-                cursor = self.conn.execute("""
-                    SELECT id, title, type 
-                    FROM objects 
-                    WHERE status IN (?, ?)
-                    LIMIT ? 
-                """, (ObjectStatus.PENDING.value, ObjectStatus.RETRY.value, limit))
+                row = self.conn.execute(f"SELECT MIN(next_attempt_at) FROM objects WHERE status = ? AND {_NOT_PAUSED}",
+                                        (ObjectStatus.RETRY.value,)).fetchone()
             else:
-                cursor = self.conn.execute("""
-                    SELECT id, title, type 
-                    FROM objects 
-                    WHERE status IN (?, ?) AND type = ?
-                    LIMIT ? 
-                """, (ObjectStatus.PENDING.value, ObjectStatus.RETRY.value, type, limit))
-
+                row = self.conn.execute(f"SELECT MIN(next_attempt_at) FROM objects WHERE status = ? AND type = ? AND {_NOT_PAUSED}",
+                                        (ObjectStatus.RETRY.value, type)).fetchone()
+            if row[0] is None:
+                return None
+            return max(0.0, (datetime.fromisoformat(row[0]) - datetime.now()).total_seconds())
+        except sqlite3.Error as e:
+            logger.error(f"Error getting the next retry: {e}")
+            raise
+    
+    @_synchronized
+    @_flushed
+    def get_pending_objects(self, type="all", limit:int=10**10, after_rowid:int=0) -> Dict[str, Dict[str, Any]]:
+        """
+        Get objects that need to be processed, in the order they were added.
+        Pass the largest "rowid" of a page as `after_rowid` to get the next one (see iter_pending_objects).
+        """
+        try:
             result = {}
-            for row in cursor.fetchall():
-                result[row[0]] = {
-                    "title":row[1],
-                    "type": row[2]
+            for row in self._select_pending(type, limit, after_rowid):
+                result[row[1]] = {
+                    "title":row[2],
+                    "type": row[3],
+                    "attempts": row[4],
+                    "refresh": bool(row[5]),
+                    "rowid": row[0]
                 }
             return result
         except sqlite3.Error as e:
             logger.error(f"Error getting pending objects: {e}")
             raise
     
+    def iter_pending_objects(self, type="all", batch:int=1000):
+        """Yield (id, info) of all pending objects, fetched page by page."""
+        after_rowid = 0
+        while True:
+            page = self.get_pending_objects(type, limit=batch, after_rowid=after_rowid)
+            if not page:
+                return
+            yield from page.items()
+            after_rowid = max(info["rowid"] for info in page.values())
+
+    def _select_pending(self, type, limit, after_rowid=0) -> list:
+        """
+        Rows (rowid, id, title, type, attempts, refresh) with status pending or with a retry that is due, ordered by rowid.
+
+        Each status is a range of idx_status (status, rowid) or idx_queue (status, type, rowid) that is
+        searched from after_rowid on, and SQLite merges both ranges. Neither reads completed rows, so a
+        batch costs the same however many objects are done.
+        """
+        now = datetime.now().isoformat()
+        if type == "all":
+            arm = "SELECT rowid, id, title, type, attempts, refresh FROM objects WHERE status = ? AND rowid > ?"
+            params = (ObjectStatus.PENDING.value, after_rowid, ObjectStatus.RETRY.value, after_rowid, now, limit)
+        else:
+            arm = "SELECT rowid, id, title, type, attempts, refresh FROM objects WHERE status = ? AND type = ? AND rowid > ?"
+            params = (ObjectStatus.PENDING.value, type, after_rowid, ObjectStatus.RETRY.value, type, after_rowid, now, limit)
+        due = "AND next_attempt_at <= ?"
+        return self.conn.execute(f"{arm} UNION ALL {arm} {due} ORDER BY 1 LIMIT ?", params).fetchall()
+
+    def _register_queue(self, type, title):
+        """Remember the queue (type, title) of new objects, see _select_fair."""
+        # a single statement, so another process adding the same seed list can't insert it in between
+        self.conn.execute("INSERT INTO queues (type, title) VALUES (?, ?) ON CONFLICT DO NOTHING", (type, title))
+
+    def _select_fair(self, type, limit) -> list:
+        """
+        Rows (rowid, id, title, type, attempts, refresh) for the next batch: retries that are due first, then pending objects
+        by priority and, between the queues (seed lists) with the same priority, by weighted round-robin.
+        Queues with weight 0 are paused, neither their pending objects nor their retries are handed out.
+
+        Due retries are a range of idx_retry (status, next_attempt_at), retries that are not due yet are not read.
+        Every queue is a range of idx_fair (status, type, title, priority, rowid). The head (next priority) of every
+        queue is looked up once, and afterwards only for the queues that rows were taken from, so a batch costs a few
+        index probes per queue with pending objects however long the queues are. Whatever a queue does not get of
+        its share in this batch is credited to it for the next one.
+        """
+        now = datetime.now().isoformat()
+        if type == "all":
+            rows = self.conn.execute(f"""
+                SELECT rowid, id, title, type, attempts, refresh FROM objects
+                WHERE status = ? AND next_attempt_at <= ? AND {_NOT_PAUSED} ORDER BY rowid LIMIT ?
+            """, (ObjectStatus.RETRY.value, now, limit)).fetchall()
+            queues = self.conn.execute("SELECT type, title, weight FROM queues WHERE weight > 0").fetchall()
+        else:
+            rows = self.conn.execute(f"""
+                SELECT rowid, id, title, type, attempts, refresh FROM objects
+                WHERE status = ? AND type = ? AND next_attempt_at <= ? AND {_NOT_PAUSED} ORDER BY rowid LIMIT ?
+            """, (ObjectStatus.RETRY.value, type, now, limit)).fetchall()
+            queues = self.conn.execute("SELECT type, title, weight FROM queues WHERE type = ? AND weight > 0", (type,)).fetchall()
+        weights = {(queue_type, title): weight for queue_type, title, weight in queues}
+
+        # priority of the next pending object of every queue that has one, and the (priority, rowid) taken last
+        heads = {}
+        for queue in weights:
+            head = self._queue_head(queue)
+            if head is not None:
+                heads[queue] = head
+        positions = {}
+        pending = ObjectStatus.PENDING.value
+        while heads and len(rows) < limit:
+            top = max(heads.values())
+            contenders = [queue for queue, head in heads.items() if head == top]
+            for queue, share in self._fair_shares(contenders, weights, limit - len(rows)).items():
+                # the rowid cursor only holds within one priority, a lower one is read from its start
+                last_priority, last_rowid = positions.get(queue, (None, 0))
+                after = last_rowid if last_priority == top else 0
+                share = min(share, limit - len(rows))
+                taken = self.conn.execute("""
+                    SELECT rowid, id, title, type, attempts, refresh FROM objects
+                    WHERE status = ? AND type IS ? AND title IS ? AND priority = ? AND rowid > ? ORDER BY rowid LIMIT ?
+                """, (pending, *queue, top, after, share)).fetchall()
+                rows.extend(taken)
+                after = taken[-1][0] if taken else after
+                positions[queue] = (top, after)
+                # the queue is still at this priority only if it had enough rows for its share
+                head = self._queue_head(queue, top, after) if len(taken) == share else self._queue_head(queue, top)
+                if head is None:
+                    del heads[queue]
+                else:
+                    heads[queue] = head
+        return rows
+
+    def _queue_head(self, queue, priority = None, after = None) -> Optional[int]:
+        """
+        Priority of the next pending object of `queue`: `priority` if there is one after rowid `after`,
+        else the highest one below `priority` (without `priority`, the highest of all). None if there is none.
+        """
+        pending = ObjectStatus.PENDING.value
+        if after is not None and self.conn.execute(
+                "SELECT 1 FROM objects WHERE status = ? AND type IS ? AND title IS ? AND priority = ? AND rowid > ? LIMIT 1",
+                (pending, *queue, priority, after)).fetchone():
+            return priority
+        if priority is None:
+            return self.conn.execute("SELECT MAX(priority) FROM objects WHERE status = ? AND type IS ? AND title IS ?",
+                                     (pending, *queue)).fetchone()[0]
+        return self.conn.execute("SELECT MAX(priority) FROM objects WHERE status = ? AND type IS ? AND title IS ? AND priority < ?",
+                                 (pending, *queue, priority)).fetchone()[0]
+
+    def _fair_shares(self, queues, weights, n) -> Dict[Any, int]:
+        """Weighted round-robin: split `n` rows between `queues` by weight, fractions are carried over in self._credits."""
+        total = sum(weights[queue] for queue in queues)
+        shares = {}
+        for queue in queues:
+            self._credits[queue] = self._credits.get(queue, 0.0) + n * weights[queue] / total
+            shares[queue] = int(self._credits[queue])
+        if not any(shares.values()):
+            # every share is a fraction, the queue with the most credit goes first
+            shares[max(queues, key=lambda queue: self._credits[queue])] = 1
+        for queue, share in shares.items():
+            self._credits[queue] -= share
+        return {queue: share for queue, share in shares.items() if share > 0}
+
+    @_synchronized
+    @_flushed
+    def set_priority(self, title: Optional[str], priority: Optional[int] = None, weight: Optional[float] = None, type: Optional[str] = None) -> int:
+        """
+        Re-prioritize a seed list: set the priority of its objects that are not done yet and/or its fair share weight.
+        Weight 0 pauses the seed list until it gets a weight above 0 again.
+        Without `type`, the queues of both types with this title are changed. Returns the number of objects changed.
+        """
+        if weight is not None and not weight >= 0:
+            raise ValueError(f"The weight of a seed list must be 0 (paused) or more, not {weight}")
+        try:
+            if type is None:
+                queues = self.conn.execute("SELECT type FROM queues WHERE title IS ?", (title,)).fetchall()
+            else:
+                queues = self.conn.execute("SELECT type FROM queues WHERE title IS ? AND type IS ?", (title, type)).fetchall()
+            changed = 0
+            with self.conn:
+                for (queue_type,) in queues:
+                    if weight is not None:
+                        self.conn.execute("UPDATE queues SET weight = ? WHERE type IS ? AND title IS ?", (weight, queue_type, title))
+                    if priority is not None:
+                        for status in (ObjectStatus.PENDING.value, ObjectStatus.RETRY.value, ObjectStatus.IN_PROGRESS.value):
+                            cursor = self.conn.execute("""
+                                UPDATE objects SET priority = ?, updated_at = CURRENT_TIMESTAMP
+                                WHERE status = ? AND type IS ? AND title IS ? AND priority != ?
+                            """, (priority, status, queue_type, title, priority))
+                            changed += cursor.rowcount
+            logger.info(f"Set {title!r} to priority {priority}, weight {weight} ({changed:,} objects changed)")
+            return changed
+        except sqlite3.Error as e:
+            logger.error(f"Error re-prioritizing {title!r}: {e}")
+            raise
+
+    @_synchronized
+    @_flushed
+    def get_queues(self) -> List[Dict[str, Any]]:
+        """Type, title, weight and number of pending objects of every queue (seed list)."""
+        try:
+            result = []
+            for queue_type, title, weight in self.conn.execute("SELECT type, title, weight FROM queues").fetchall():
+                pending = self.conn.execute("SELECT COUNT(*), MAX(priority) FROM objects WHERE status = ? AND type IS ? AND title IS ?",
+                                            (ObjectStatus.PENDING.value, queue_type, title)).fetchone()
+                result.append({"type": queue_type, "title": title, "weight": weight, "pending": pending[0], "top_priority": pending[1]})
+            return result
+        except sqlite3.Error as e:
+            logger.error(f"Error getting queues: {e}")
+            raise
+
+    @_synchronized
+    @_flushed
+    def claim_pending(self, worker_id: str, batch: int = 100, lease_seconds: float = 600, type="all") -> Dict[str, Dict[str, Any]]:
+        """
+        Atomically claim up to `batch` pending objects for `worker_id`.
+
+        The claimed objects are set to in_progress with a lease that expires after `lease_seconds`.
+        Other processes using the same database file will not get them, unless the lease expires
+        before the object is marked as completed or error (e.g. because the worker crashed).
+        Expired leases are reclaimed before claiming.
+        """
+        now = datetime.now()
+        expires_at = (now + timedelta(seconds=lease_seconds)).isoformat()
+        try:
+            # BEGIN IMMEDIATE takes the write lock right away, so no other process can claim the same rows in between
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._reclaim_expired_leases(now)
+
+            rows = self._select_fair(type, batch)
+
+            self.conn.executemany("""
+                UPDATE objects 
+                SET status = ?, lease_owner = ?, lease_expires_at = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE rowid = ?
+            """, [(ObjectStatus.IN_PROGRESS.value, worker_id, expires_at, row[0]) for row in rows])
+            self.conn.commit()
+
+            result = {}
+            for row in rows:
+                result[row[1]] = {
+                    "title":row[2],
+                    "type": row[3],
+                    "attempts": row[4],
+                    "refresh": bool(row[5])
+                }
+            return result
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error claiming pending objects: {e}")
+            raise
+
+    @_synchronized
+    @_flushed
+    def renew_leases(self, worker_id: str, lease_seconds: float = 600) -> int:
+        """Heartbeat: extend the leases of all objects that `worker_id` is still working on."""
+        try:
+            expires_at = (datetime.now() + timedelta(seconds=lease_seconds)).isoformat()
+            cursor = self.conn.execute("""
+                UPDATE objects 
+                SET lease_expires_at = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE status = ? AND lease_owner = ?
+            """, (expires_at, ObjectStatus.IN_PROGRESS.value, worker_id))
+            self.conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Error renewing leases of {worker_id}: {e}")
+            raise
+
+    @_synchronized
+    @_flushed
+    def release_leases(self, worker_id: str) -> int:
+        """Give all objects that `worker_id` claimed but did not finish back to the pending queue."""
+        try:
+            cursor = self.conn.execute("""
+                UPDATE objects 
+                SET status = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE status = ? AND lease_owner = ?
+            """, (ObjectStatus.PENDING.value, ObjectStatus.IN_PROGRESS.value, worker_id))
+            self.conn.commit()
+            if cursor.rowcount:
+                logger.info(f"Released {cursor.rowcount} unfinished objects of {worker_id}")
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Error releasing leases of {worker_id}: {e}")
+            raise
+
+    @_synchronized
+    @_flushed
+    def reclaim_expired_leases(self) -> int:
+        """Set all in_progress objects whose lease has expired back to pending."""
+        try:
+            count = self._reclaim_expired_leases(datetime.now())
+            self.conn.commit()
+            return count
+        except sqlite3.Error as e:
+            logger.error(f"Error reclaiming expired leases: {e}")
+            raise
+
+    def _reclaim_expired_leases(self, now: datetime) -> int:
+        cursor = self.conn.execute("""
+            UPDATE objects 
+            SET status = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE status = ? AND lease_expires_at < ?
+        """, (ObjectStatus.PENDING.value, ObjectStatus.IN_PROGRESS.value, now.isoformat()))
+        if cursor.rowcount:
+            logger.info(f"Reclaimed {cursor.rowcount} objects with expired leases")
+        return cursor.rowcount
+    
+    @_synchronized
+    @_flushed
     def get_error_objects(self) -> Dict[str, Dict[str, Any]]:
         """Get all objects that failed"""
         try:
@@ -278,6 +866,8 @@ class ObjectTracker:
             logger.error(f"Error getting error objects: {e}")
             raise
     
+    @_synchronized
+    @_flushed
     def get_completed_objects(self) -> Dict[str, Dict[str, Any]]:
         """Get all successfully completed objects"""
         try:
@@ -305,6 +895,8 @@ class ObjectTracker:
             logger.error(f"Error getting completed objects: {e}")
             raise
     
+    @_synchronized
+    @_flushed
     def get_stats(self, type="all") -> Dict[str, int]:
         """Get processing statistics"""
         try:
@@ -322,7 +914,7 @@ class ObjectTracker:
                     GROUP BY status
                 """, (type,))
             
-            stats = {"completed": 0, "errors": 0, "pending": 0, "retry": 0}
+            stats = {"completed": 0, "errors": 0, "pending": 0, "retry": 0, "in_progress": 0}
             for status, count in cursor.fetchall():
                 if status == ObjectStatus.COMPLETED.value:
                     stats["completed"] = count
@@ -332,17 +924,22 @@ class ObjectTracker:
                     stats["pending"] = count
                 elif status == ObjectStatus.RETRY.value:
                     stats["retry"] = count
+                elif status == ObjectStatus.IN_PROGRESS.value:
+                    stats["in_progress"] = count
             
             return stats
         except sqlite3.Error as e:
             logger.error(f"Error getting statistics: {e}")
             raise
     
+    @_synchronized
+    @_flushed
     def get_object_status(self, id: str) -> Optional[Dict[str, Any]]:
         """Get the status of a specific object"""
         try:
             cursor = self.conn.execute("""
-                SELECT status, title, type, added_at, completed_at, attempts, last_error, last_attempt, file_path
+                SELECT status, title, type, added_at, completed_at, attempts, last_error, last_attempt, file_path, lease_owner, lease_expires_at, next_attempt_at,
+                       refresh, posted_at, refreshed_at
                 FROM objects 
                 WHERE id = ?
             """, (id,))
@@ -358,13 +955,21 @@ class ObjectTracker:
                     "attempts": result[5],
                     "last_error": result[6],
                     "last_attempt": result[7],
-                    "file_path": result[8]
+                    "file_path": result[8],
+                    "lease_owner": result[9],
+                    "lease_expires_at": result[10],
+                    "next_attempt_at": result[11],
+                    "refresh": bool(result[12]),
+                    "posted_at": result[13],
+                    "refreshed_at": result[14]
                 }
             return None
         except sqlite3.Error as e:
             logger.error(f"Error getting object status for {id}: {e}")
             raise
     
+    @_synchronized
+    @_flushed
     def is_completed(self, id: str) -> bool:
         """Check if an object is completed"""
         try:
@@ -377,12 +982,19 @@ class ObjectTracker:
             logger.error(f"Error checking if object {id} is completed: {e}")
             raise
     
-    def reset_errors_to_pending(self):
-        """Reset all error objects back to pending for retry"""
+    @_synchronized
+    @_flushed
+    def reset_errors_to_pending(self, reset_attempts: bool = False):
+        """
+        Reset all error objects back to pending for retry.
+        With `reset_attempts`, their attempts start at 0 again, so they get the full max_attempts of the retry
+        policy. Otherwise an object that used up its attempts is marked as error again on its next failure.
+        """
+        attempts = ", attempts = 0" if reset_attempts else ""
         try:
-            cursor = self.conn.execute("""
+            cursor = self.conn.execute(f"""
                 UPDATE objects 
-                SET status = ?, last_error = NULL, last_attempt = NULL
+                SET status = ?{attempts}, last_error = NULL, last_attempt = NULL, updated_at = CURRENT_TIMESTAMP
                 WHERE status = ?
             """, (ObjectStatus.PENDING.value, ObjectStatus.ERROR.value))
             self.conn.commit()
@@ -393,12 +1005,14 @@ class ObjectTracker:
             logger.error(f"Error resetting error objects: {e}")
             raise
     
+    @_synchronized
+    @_flushed
     def reset_all_to_pending(self):
         """Reset all objects back to pending for retry"""
         try:
             cursor = self.conn.execute("""
                 UPDATE objects 
-                SET status = "pending", last_error = NULL, last_attempt = NULL
+                SET status = "pending", refresh = 0, last_error = NULL, last_attempt = NULL, lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
             """)
             self.conn.commit()
             
@@ -408,10 +1022,13 @@ class ObjectTracker:
             logger.error(f"Error resetting error objects: {e}")
             raise
     
+    @_synchronized
+    @_flushed
     def clear_all_data(self):
         """Clear all tracking data (use with caution!)"""
         try:
             self.conn.execute("DELETE FROM objects")
+            self.conn.execute("DELETE FROM queues")
             self.conn.execute("DELETE FROM metadata")
             self.conn.commit()
             logger.info("All tracking data cleared")
@@ -419,9 +1036,14 @@ class ObjectTracker:
             logger.error(f"Error clearing all data: {e}")
             raise
     
+    @_synchronized
     def close(self):
         """Close the database connection"""
         if self.conn:
+            self.flush()
+            if self.buffered:
+                self._stop_flusher.set()
+                atexit.unregister(self.flush)
             self.conn.close()
             logger.info("Database connection closed")
     
@@ -0,0 +1,196 @@
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+import logging
+
+import TT_Content_Scraper.src.logger
+logger = logging.getLogger('TTCS.Profiler')
+
+# files of scrape_metadata, scrape_binaries(_to_disk) and _filter_tiktok_data, whose allocations are reported on their own
+ALLOCATION_SCOPES = {
+    "scrape_metadata / scrape_binaries": ("*/scraper_functions/base_scraper.py", "*/scraper_functions/async_scraper.py"),
+    "_filter_tiktok_data": ("*/scraper_functions/_filter_tiktok_data.py",),
+}
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _thread_label(name) -> str:
+    # all worker threads in one tower of the flame graph
+    return re.sub(r"_\d+$", "", name)
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler of all threads.
+
+    A background thread reads the stack of every other thread (sys._current_frames) every `interval` seconds
+    and counts the stacks. write() saves them in the collapsed format ("thread;outer;...;inner count" per line)
+    of flamegraph.pl, speedscope and inferno. Waiting threads are sampled as well, e.g. in threading.wait.
+    """
+    def __init__(self, interval = 0.01):
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="TTCS-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(_thread_label(names.get(ident, "thread")))
+                stack = ";".join(reversed(labels))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def write(self, filename) -> None:
+        with open(filename, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+
+
+class ScrapeProfiler:
+    """
+    Profiles windows of `window` IDs of a scrape, the first one when the scrape starts and, with `every`,
+    another one every `every` IDs.
+
+    During a window, a SamplingProfiler records the stacks and tracemalloc the allocations. At its end,
+    stacks_{n}.folded and allocations_{n}.txt are written to `output_dir`. The allocation report lists the
+    lines that allocated the most memory still held at the end of the window: overall, in the code of
+    scrape_metadata / scrape_binaries and of _filter_tiktok_data, and compared with the same lines at the end
+    of the previous window. Outside the windows, nothing is traced, every window is its own tracemalloc session,
+    and only the top lines of a window are kept for the next one.
+    """
+    def __init__(self, output_dir, window = 100, every = None, interval = 0.01, top = 25, frames = 25):
+        self.output_dir = Path(output_dir)
+        self.window = max(1, int(window))
+        self.every = max(self.window, int(every)) if every else None
+        self.interval = interval
+        self.top = top
+        self.frames = frames
+        self.ids = 0
+        self.windows = 0
+        self._window_start = None
+        self._last_start = 0
+        self._sampler = None
+        self._started_at = None
+        self._owns_tracemalloc = False
+        self._previous = {} # traceback -> (size, count) of the top lines of the previous window
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._window_start is not None
+
+    def maybe_start(self) -> None:
+        """Start a window if one is due. The scraper calls this when a scrape starts and after every ID."""
+        with self._lock:
+            if self.active:
+                return
+            if self.windows == 0 or (self.every and self.ids >= self._last_start + self.every):
+                self._start()
+
+    def id_finished(self) -> None:
+        with self._lock:
+            self.ids += 1
+            if self.active and self.ids - self._window_start >= self.window:
+                self._finish()
+        self.maybe_start()
+
+    def close(self) -> None:
+        """End a running window and write what it has so far."""
+        with self._lock:
+            if self.active:
+                self._finish()
+
+    def _start(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._window_start = self._last_start = self.ids
+        self._started_at = time.perf_counter()
+        # if tracemalloc was started by someone else, it is left running
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start(self.frames)
+        self._sampler = SamplingProfiler(self.interval)
+        self._sampler.start()
+        logger.info(f"Profiling the next {self.window:,} IDs")
+
+    def _finish(self):
+        self._sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        n_ids = self.ids - self._window_start
+        elapsed = time.perf_counter() - self._started_at
+        stacks_fn = self.output_dir / f"stacks_{self.windows}.folded"
+        allocations_fn = self.output_dir / f"allocations_{self.windows}.txt"
+        self._sampler.write(stacks_fn)
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)])
+        with open(allocations_fn, "w", encoding="utf-8") as f:
+            f.write(f"{n_ids:,} IDs in {elapsed:.1f} sec., IDs {self._window_start:,} to {self.ids:,} profiled by this scraper\n")
+            f.write(f"traced memory at the end {traced / 2**20:,.1f} MiB, peak {peak / 2**20:,.1f} MiB, max RSS {_max_rss() / 2**20:,.1f} MiB\n")
+            top = self._write_statistics(f, "allocated during the window and still held, by line", snapshot)
+            for scope, patterns in ALLOCATION_SCOPES.items():
+                scoped = snapshot.filter_traces([tracemalloc.Filter(True, pattern, all_frames=True) for pattern in patterns])
+                self._write_statistics(f, f"... of them in {scope} or the functions it calls", scoped)
+            if self._previous:
+                f.write("\n## held at the end of the window, compared with the end of the previous window\n")
+                for stat in top:
+                    if stat.traceback in self._previous:
+                        size, count = self._previous[stat.traceback]
+                        f.write(f"{stat.traceback}: size={stat.size / 1024:,.1f} KiB ({(stat.size - size) / 1024:+,.1f} KiB), "
+                                f"count={stat.count:,} ({stat.count - count:+,})\n")
+                    else:
+                        f.write(f"{stat.traceback}: size={stat.size / 1024:,.1f} KiB, count={stat.count:,} (not among the top lines before)\n")
+        # the snapshot itself is not kept, it holds every trace of the window
+        self._previous = {stat.traceback: (stat.size, stat.count) for stat in top}
+
+        logger.info(f"Profile ► {self._sampler.samples:,} samples of {n_ids:,} IDs in {stacks_fn}, allocations in {allocations_fn}")
+        self.windows += 1
+        self._window_start = None
+        self._sampler = None
+
+    def _write_statistics(self, f, title, snapshot) -> list:
+        """Write the top lines of `snapshot` and return them."""
+        statistics = snapshot.statistics("lineno")
+        f.write(f"\n## {title}: {sum(stat.size for stat in statistics) / 2**20:,.2f} MiB in {sum(stat.count for stat in statistics):,} blocks\n")
+        for stat in statistics[:self.top]:
+            f.write(f"{stat}\n")
+        return statistics[:self.top]
+
+
+def _max_rss() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0 # Windows
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
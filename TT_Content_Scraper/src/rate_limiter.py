@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+import logging
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('TTCS.RateLimit')
+
+# responses that mean "too fast": too many requests, unavailable
+THROTTLE_STATUS = {429, 503}
+# TikTok also blocks pages with a 403. Files are not in it, the CDN sends a 403 for an expired tt_chain_token
+# and for videos that are private or removed, which is about the ID and not about the rate
+PAGE_THROTTLE_STATUS = THROTTLE_STATUS | {403}
+# longest Retry-After that is obeyed, in seconds
+MAX_RETRY_AFTER = 300.0
+
+def retry_after_seconds(value):
+    """Seconds of a Retry-After header (seconds or an HTTP date), or None if there is none or it cannot be read."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(0.0, seconds), MAX_RETRY_AFTER)
+
+class RateLimiter():
+    """
+    Thread-safe politeness limiter shared by all workers of a scraper.
+
+    Every call to acquire() reserves the next free time slot. Slots are spaced at least
+    `min_interval` seconds apart, so no matter how many workers are running, the scraper as a whole
+    never starts more than 1 / min_interval IDs per second.
+    """
+    def __init__(self, min_interval : float):
+        self.min_interval = max(0.0, float(min_interval))
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def _reserve(self) -> float:
+        """Reserve the next free slot and return the seconds until it starts."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        return slot - now
+
+    def acquire(self) -> float:
+        """Block until the caller may start its next request. Returns the seconds spent waiting."""
+        wait_time = self._reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    async def acquire_async(self) -> float:
+        """Like acquire(), but only suspends the calling coroutine instead of blocking the event loop."""
+        wait_time = self._reserve()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+
+class TokenBucket():
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `burst` of them saved up.
+
+    A caller that finds the bucket empty takes a token anyway and waits until it would have been there,
+    so callers are served in order and the long-run rate never exceeds `rate`.
+    """
+    def __init__(self, rate : float, burst : float = 1.0):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate : float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def pause(self, seconds : float) -> None:
+        """Hand out the next token no earlier than `seconds` from now."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> float:
+        wait_time = self._reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    async def acquire_async(self) -> float:
+        wait_time = self._reserve()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+
+class AIMDController():
+    """
+    Additive increase, multiplicative decrease of the rate of a TokenBucket.
+
+    Every clean response raises the rate by `increase` / rate (about `increase` requests per second more
+    for every second of clean traffic). A throttled response (429, 503, a Retry-After header, a 403 or a page without
+    rehydration data) or a latency above `latency_factor` times the usual latency multiplies the rate by `decrease`,
+    at most once per `cooldown` seconds, because the requests that were already in flight will fail as well.
+    A Retry-After also holds back the next request for that long.
+    """
+    def __init__(self, bucket : TokenBucket, min_rate : float, max_rate : float, increase = 0.5, decrease = 0.5,
+                 latency_factor = 3.0, cooldown = 2.0):
+        self.bucket = bucket
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.latency = None # EWMA of the latency
+        self.baseline_latency = None # slowly adapting "usual" latency
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, throttled = False, latency = None, retry_after = None) -> None:
+        if retry_after is not None:
+            throttled = True
+        with self._lock:
+            if latency is not None:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                if self.baseline_latency is None or self.latency < self.baseline_latency:
+                    self.baseline_latency = self.latency
+                else:
+                    self.baseline_latency = 0.999 * self.baseline_latency + 0.001 * self.latency
+                if self.latency > self.latency_factor * self.baseline_latency:
+                    throttled = True
+
+            rate = self.bucket.rate
+            if throttled:
+                self.throttled += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    rate = max(self.min_rate, rate * self.decrease)
+                    logger.warning(f"Throttled, slowing down to {rate:.2f} requests/sec")
+            else:
+                rate = min(self.max_rate, rate + self.increase / rate)
+        if rate != self.bucket.rate:
+            self.bucket.set_rate(rate)
+        if retry_after is not None:
+            self.bucket.pause(retry_after)
+
+
+class AdaptiveRateLimiter():
+    """
+    Request level rate limiting with separate budgets for the pages of `page_host` and for the CDN hosts
+    (every other host). Each budget is a TokenBucket whose rate is steered by an AIMDController.
+    A 403 only throttles the page budget, see PAGE_THROTTLE_STATUS.
+
+    The scrapers call acquire(url) before and record(url, ...) after every request.
+    """
+    def __init__(self, page_host : str, initial_rate : float, min_rate = 0.2, max_rate = 10.0,
+                 cdn_initial_rate = None, cdn_max_rate = None):
+        self.page_host = page_host
+        cdn_initial_rate = cdn_initial_rate or 4 * initial_rate
+        cdn_max_rate = cdn_max_rate or 4 * max_rate
+        self.budgets = {}
+        for budget, rate, maximum in (("page", initial_rate, max_rate), ("cdn", cdn_initial_rate, cdn_max_rate)):
+            bucket = TokenBucket(min(rate, maximum))
+            self.budgets[budget] = AIMDController(bucket, min_rate=min_rate, max_rate=maximum)
+
+    def budget_for(self, url : str) -> str:
+        return "page" if urlsplit(url).hostname == self.page_host else "cdn"
+
+    def acquire(self, url : str) -> float:
+        return self.budgets[self.budget_for(url)].bucket.acquire()
+
+    async def acquire_async(self, url : str) -> float:
+        return await self.budgets[self.budget_for(url)].bucket.acquire_async()
+
+    def record(self, url : str, status = None, latency = None, throttled = False, retry_after = None) -> None:
+        """`retry_after` is the Retry-After header of the response, if it had one."""
+        budget = self.budget_for(url)
+        throttled = throttled or status in (PAGE_THROTTLE_STATUS if budget == "page" else THROTTLE_STATUS)
+        self.budgets[budget].record(throttled=throttled, latency=latency, retry_after=retry_after_seconds(retry_after))
+
+    def current_rates(self) -> dict:
+        """Current requests per second of every budget."""
+        return {budget: controller.bucket.rate for budget, controller in self.budgets.items()}
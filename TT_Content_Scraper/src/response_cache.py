@@ -0,0 +1,189 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+import logging
+from typing import Optional
+
+import TT_Content_Scraper.src.logger
+logger = logging.getLogger('TTCS.Cache')
+
+CachedResponse = namedtuple("CachedResponse", ["status", "content_type", "body"])
+
+class CacheMissError(Exception):
+    """An url was requested in replay mode, but it is not in the response cache."""
+
+
+class ResponseCache:
+    """
+    Record and replay the raw responses (pages and files) of the scraper on disk, keyed by url.
+
+    mode "record": answers come from the cache while they are younger than `ttl` seconds (None: forever),
+        everything else is fetched and successful answers (2xx) are stored. A stats refresh always fetches the page again.
+    mode "replay": answers only come from the cache, whatever their age. An url that is not cached raises
+        CacheMissError, nothing is sent over the network.
+
+    Bodies are files under {directory}/ab/{sha256 of the url}, an SQLite index keeps status, size and the
+    time of last use. Once the bodies exceed `max_bytes`, the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory, mode = "record", ttl = None, max_bytes = 10 * 2**30):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cache mode {mode!r}, use 'record' or 'replay'")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+        self.index = sqlite3.connect(self.directory / "index.db", check_same_thread=False, timeout=30)
+        self.index.execute("PRAGMA journal_mode = WAL")
+        self.index.execute("PRAGMA synchronous = NORMAL")
+        try:
+            self.index.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    content_type TEXT,
+                    size INTEGER NOT NULL,
+                    stored_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )
+            """)
+            self.index.execute("CREATE INDEX IF NOT EXISTS idx_used_at ON responses(used_at)")
+            self.index.commit()
+            self._size = self.index.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error creating the response cache index: {e}")
+            raise
+
+    def _key(self, url) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _path(self, key) -> Path:
+        return Path(self.directory, key[:2], key)
+
+    def get(self, url, refresh = False) -> Optional[CachedResponse]:
+        """
+        The cached answer to `url`, or None if it has to be fetched (record mode only, replay raises CacheMissError).
+        With `refresh` (the current counters of a stats refresh), a recorded answer is fetched again whatever its age.
+        """
+        key = self._key(url)
+        with self._lock:
+            row = self.index.execute("SELECT status, content_type, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+        fresh = row is not None and (self.mode == "replay" or not refresh and (self.ttl is None or time.time() - row[2] < self.ttl))
+        body = None
+        if fresh:
+            try:
+                body = self._path(key).read_bytes()
+            except FileNotFoundError:
+                # evicted by another process in between
+                pass
+
+        with self._lock:
+            if body is None:
+                self.stats["misses"] += 1
+            else:
+                self.stats["hits"] += 1
+                self.index.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+                self.index.commit()
+        if body is None:
+            if self.mode == "replay":
+                raise CacheMissError(f"{url} is not in the response cache")
+            return None
+        return CachedResponse(row[0], row[1], body)
+
+    def wants(self, status : int, size : int) -> bool:
+        """Whether an answer with `status` and `size` bytes is stored: successful and at most a tenth of the cache (record mode)."""
+        return self.mode == "record" and 200 <= status < 300 and size <= self.max_bytes / 10
+
+    def put(self, url, status : int, content_type : Optional[str], body : bytes) -> None:
+        """Store a successful answer (record mode). Bigger than a tenth of the cache, it is not stored."""
+        if self.wants(status, len(body)):
+            self._store(url, status, content_type, len(body), lambda f: f.write(body))
+
+    def put_file(self, url, status : int, content_type : Optional[str], filename) -> None:
+        """put() for an answer that was streamed into a file, which is copied in chunks instead of being read into memory."""
+        size = os.path.getsize(filename)
+        if not self.wants(status, size):
+            return
+        def copy(f):
+            with open(filename, "rb") as source:
+                shutil.copyfileobj(source, f)
+        self._store(url, status, content_type, size, copy)
+
+    def _store(self, url, status, content_type, size, write) -> None:
+        key = self._key(url)
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_filename = tempfile.mkstemp(dir=path.parent, prefix=f".{key}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_filename, path)
+        except BaseException:
+            Path(tmp_filename).unlink(missing_ok=True)
+            raise
+
+        now = time.time()
+        with self._lock:
+            try:
+                with self.index:
+                    previous = self.index.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                    self.index.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       (key, url, status, content_type, size, now, now))
+            except sqlite3.Error as e:
+                logger.error(f"Error storing the response of {url}: {e}")
+                raise
+            self._size += size - (previous[0] if previous else 0)
+            self.stats["stored"] += 1
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def discard(self, url) -> None:
+        """Forget the answer to `url`, e.g. a page that came without data (record mode, a replay keeps everything)."""
+        if self.mode != "record":
+            return
+        key = self._key(url)
+        with self._lock:
+            with self.index:
+                row = self.index.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return
+                self.index.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._size -= row[0]
+        self._path(key).unlink(missing_ok=True)
+
+    def _evict(self):
+        # other processes may share the cache, so start from the size of the index
+        self._size = self.index.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self._size <= self.max_bytes:
+            return
+        evicted = []
+        try:
+            with self.index:
+                for key, size in self.index.execute("SELECT key, size FROM responses ORDER BY used_at"):
+                    if self._size <= self.max_bytes * 0.9:
+                        break
+                    evicted.append(key)
+                    self._size -= size
+                self.index.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in evicted])
+        except sqlite3.Error as e:
+            logger.error(f"Error evicting responses from the cache: {e}")
+            raise
+        for key in evicted:
+            self._path(key).unlink(missing_ok=True)
+        self.stats["evicted"] += len(evicted)
+        logger.debug(f"Evicted {len(evicted)} responses from the cache")
+
+    def close(self):
+        with self._lock:
+            self.index.close()
@@ -0,0 +1,50 @@
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+import logging
+
+import TT_Content_Scraper.src.logger
+logger = logging.getLogger('TTCS.Retry')
+
+# first delay in seconds per error class, it doubles with every further attempt
+DEFAULT_BASE_DELAYS = {
+    "throttled": 120.0, # 403, 429 or a page without data
+    "server": 30.0, # 5xx
+    "connection": 10.0, # no answer at all
+    "download": 60.0, # a file failed although the page was fine, the links may have expired
+    "transient": 30.0, # anything else that is worth another try
+}
+
+def backoff_delay(attempt : int, base : float, factor : float = 2.0, maximum : Optional[float] = None) -> float:
+    """
+    Exponential backoff with jitter: about base * factor ** (attempt - 1) seconds, capped at `maximum`.
+    Half of the delay is random, so IDs (or workers) that failed together do not come back together.
+    """
+    delay = base * factor ** max(0, attempt - 1)
+    if maximum is not None:
+        delay = min(delay, maximum)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryPolicy:
+    """
+    When to scrape an ID again after a transient failure (see RetryLaterError).
+
+    The n-th failed attempt of an ID is retried after backoff_delay(n, base delay of its error class),
+    at most `max_delay` seconds later. After `max_attempts` attempts the ID is marked as error.
+    `immediate_retries` is the number of quick retries of a page inside the same attempt.
+    """
+    def __init__(self, max_attempts = 5, base_delays = None, factor = 2.0, max_delay = 6 * 3600.0, immediate_retries = 1):
+        self.max_attempts = max_attempts
+        self.base_delays = dict(DEFAULT_BASE_DELAYS, **(base_delays or {}))
+        self.factor = factor
+        self.max_delay = max_delay
+        self.immediate_retries = immediate_retries
+
+    def next_attempt_at(self, error_class : str, attempts : int) -> Optional[datetime]:
+        """When to try again after `attempts` failed attempts, or None if the ID should be given up."""
+        if attempts >= self.max_attempts:
+            return None
+        base = self.base_delays.get(error_class, self.base_delays["transient"])
+        delay = backoff_delay(attempts, base, factor=self.factor, maximum=self.max_delay)
+        return datetime.now() + timedelta(seconds=delay)
@@ -0,0 +1,185 @@
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = {"json": json.loads}
+if orjson is not None:
+    BACKENDS["orjson"] = orjson.loads
+
+_config = {
+    "name": "orjson" if orjson is not None else "json",
+    "loads": BACKENDS.get("orjson", json.loads),
+    "lazy": True,
+}
+_string = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
+_escape = re.compile(r'\\.')
+_scalar = re.compile(r'[^,\]}\s]+')
+_whitespace = re.compile(r'[ \t\n\r]*')
+_key_separator = re.compile(r'[ \t\n\r]*:[ \t\n\r]*')
+
+def set_json_backend(backend = "auto", lazy = True) -> None:
+    """
+    Choose how rehydration data is decoded.
+
+    backend : "auto" (orjson if installed, else json), "json", "orjson" or any callable that works like json.loads
+    lazy : only decode the scope of __DEFAULT_SCOPE__ that is actually read and skip all others.
+        Falls back to decoding everything with the backend if the scope cannot be found that way.
+    """
+    if backend == "auto":
+        backend = "orjson" if orjson is not None else "json"
+
+    if callable(backend):
+        _config["name"] = getattr(backend, "__module__", None) or repr(backend)
+        _config["loads"] = backend
+    elif backend in BACKENDS:
+        _config["name"] = backend
+        _config["loads"] = BACKENDS[backend]
+    else:
+        raise ValueError(f"Unknown JSON backend {backend!r}, available: {', '.join(BACKENDS)}")
+    _config["lazy"] = lazy
+
+def get_json_backend() -> dict:
+    return {"backend": _config["name"], "lazy": _config["lazy"]}
+
+def _loads(data):
+    try:
+        return _config["loads"](data)
+    except ValueError:
+        # e.g. orjson rejects integers above 64 bit that the json module accepts
+        if _config["loads"] is json.loads:
+            raise
+        return json.loads(data)
+
+def _decode_rehydration_path(rehydration_data : str, path : tuple):
+    """
+    Return rehydration_data[path[0]][path[1]]... like json.loads followed by indexing.
+    Raises KeyError if the path does not exist, just like indexing the fully decoded data.
+    """
+    if _config["lazy"] and len(path) >= 2:
+        found, value = _lazy_decode(rehydration_data, path)
+        if found:
+            return value
+
+    data = _loads(rehydration_data)
+    for key in path:
+        data = data[key]
+    return data
+
+def _lazy_decode(rehydration_data : str, path : tuple):
+    """
+    Find the value of path[1] among the members of the path[0] object, without decoding anything else,
+    and decode only that slice with the configured backend. Returns (found, value).
+    """
+    scanner = _Scanner(rehydration_data)
+    start = 0
+    for key in path[:2]:
+        start = scanner.member_start(start, key)
+        if start is None:
+            return False, None
+    end = scanner.value_end(start)
+    if end is None:
+        return False, None
+    value = _loads(rehydration_data[start:end])
+    for sub_key in path[2:]:
+        value = value[sub_key]
+    return True, value
+
+
+class _Scanner:
+    """
+    Finds the members of objects and the ends of values in a JSON text, scanning forward and without decoding.
+
+    Objects and arrays are skipped from bracket to bracket with str.find, which is much faster than a regex
+    or a loop over the characters. A bracket is inside a string if an odd number of unescaped quotes came before it.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.n = len(text)
+        # next position of "{", "}", "[" and "]" found so far, or len(text) if there is none
+        self.upcoming = [-1, -1, -1, -1]
+
+    def member_start(self, start, key):
+        """Start of the value of `key` in the object at text[start], or None if it has no such member."""
+        text = self.text
+        i = _whitespace.match(text, start).end()
+        if not text.startswith("{", i):
+            return None
+        i += 1
+        while True:
+            name = _string.match(text, _whitespace.match(text, i).end())
+            if name is None:
+                return None # end of the object (or not JSON)
+            separator = _key_separator.match(text, name.end())
+            if separator is None:
+                return None
+            name = name.group()
+            if (json.loads(name) if "\\" in name else name[1:-1]) == key:
+                return separator.end()
+            value_end = self.value_end(separator.end())
+            if value_end is None:
+                return None
+            i = _whitespace.match(text, value_end).end()
+            if not text.startswith(",", i):
+                return None
+            i += 1
+
+    def value_end(self, start):
+        """End of the JSON value at text[start], or None if it is not valid."""
+        text, n = self.text, self.n
+        if start >= n:
+            return None
+        first = text[start]
+        if first == '"':
+            string = _string.match(text, start)
+            return string.end() if string is not None else None
+        if first not in "{[":
+            scalar = _scalar.match(text, start)
+            return scalar.end() if scalar is not None else None
+
+        find, count = text.find, text.count
+        # positions of the next "{", "}", "[" and "]" at or after start (n if there is none)
+        o, c, a, b = (position if position >= start else find(bracket, start) for bracket, position in zip("{}[]", self.upcoming))
+        o, c, a, b = (position if position != -1 else n for position in (o, c, a, b))
+        depth = 0
+        in_string = False
+        i = start
+        while True:
+            position = min(o, c, a, b)
+            if position == n:
+                self.upcoming = [o, c, a, b]
+                return None
+            quotes = count('"', i, position)
+            if quotes and find("\\", i, position) != -1:
+                quotes = _escape.sub("", text[i:position]).count('"')
+            if quotes & 1:
+                in_string = not in_string
+            i = position + 1
+            if position == o:
+                o = find("{", i)
+                if o == -1: o = n
+                opens = True
+            elif position == a:
+                a = find("[", i)
+                if a == -1: a = n
+                opens = True
+            elif position == c:
+                c = find("}", i)
+                if c == -1: c = n
+                opens = False
+            else:
+                b = find("]", i)
+                if b == -1: b = n
+                opens = False
+            if in_string:
+                continue
+            if opens:
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    self.upcoming = [o, c, a, b]
+                    return i
@@ -0,0 +1,49 @@
+from bs4 import BeautifulSoup
+
+REHYDRATION_ID = "__UNIVERSAL_DATA_FOR_REHYDRATION__"
+_ID_BYTES = REHYDRATION_ID.encode()
+
+def _extract_rehydration_data(page):
+    """
+    Return the content of the __UNIVERSAL_DATA_FOR_REHYDRATION__ script tag of a page, or None if it is missing.
+
+    The raw page (bytes or str) is scanned for the tag and the JSON payload is sliced out directly,
+    without building a DOM. Pages where the tag cannot be found this way are parsed with BeautifulSoup.
+    """
+    if isinstance(page, str):
+        page = page.encode("utf-8")
+
+    data = _scan_for_script(page)
+    if data is not None:
+        return data
+    return _soup_rehydration_data(page)
+
+def _scan_for_script(page : bytes):
+    id_start = page.find(_ID_BYTES)
+    if id_start == -1:
+        return None
+
+    # the id has to be an attribute of an opening <script ...> tag
+    tag_start = page.rfind(b"<", 0, id_start)
+    if tag_start == -1 or page[tag_start:tag_start + 7].lower() != b"<script" or page.find(b">", tag_start, id_start) != -1:
+        return None
+    tag_end = page.find(b">", id_start)
+    if tag_end == -1:
+        return None
+
+    # a script element ends at the first "</script", there is no escaping inside of it
+    content_end = page.find(b"</script", tag_end)
+    if content_end == -1:
+        return None
+
+    try:
+        return page[tag_end + 1:content_end].decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+def _soup_rehydration_data(page):
+    soup = BeautifulSoup(page, "html.parser")
+    script_tag = soup.find('script', id=REHYDRATION_ID)
+    if script_tag is None:
+        return None
+    return script_tag.string
@@ -11,12 +11,179 @@ def _force_to_int(value):
     except (ValueError, TypeError):
         return None
 
+# coercions used by the schema below
+
+def _timestamp_to_iso(value):
+    return datetime.fromtimestamp(int(value)).isoformat()
+
+def _location_code(value):
+    # only two letter country codes are kept
+    if value and len(value) > 2:
+        if value == "FAKE-AD":
+            return "XX"
+        return None
+    return value
+
+def _empty_list_to_none(value):
+    if len(value) == 0:
+        return None
+    return value
+
+def _empty_dict_to_none(value):
+    if value == {}:
+        return None
+    return value
+
+def _empty_str_to_none(value):
+    if value == '':
+        return None
+    return value
+
+def _ratio_to_int(value):
+    # 540p -> 540
+    if value:
+        return _force_to_int(value[:-1])
+    return None
+
+# Sub-objects of an item struct. Every one is looked up once per item.
+SOURCES = {
+    "item": "data_slot",
+    "author": 'data_slot.get("author", {})',
+    "music": 'data_slot.get("music", {})',
+    "video": 'data_slot.get("video", {})',
+    "volume": 'video.get("volumeInfo", {})',
+    "cla": 'video.get("claInfo", {})',
+    "stats": 'data_slot["statsV2"] if "statsV2" in data_slot else data_slot.get("stats", {})',
+    # computed from textExtra and challenges by _prep_hashtags_and_mentions
+    "derived": "derived",
+}
+
+# table, output column, source, source key, default, coercion, SQL type of the column
+FIELD_SCHEMA = [
+    # video metadata
+    ("video_metadata", "id", "item", "id", None, _force_to_int, "bigint NOT NULL"),                                          # ID of the specific video
+    ("video_metadata", "time_created", "item", "createTime", None, _timestamp_to_iso, "timestamp without time zone"),
+    ("video_metadata", "author_id", "author", "id", None, _force_to_int, "bigint"),
+    ("video_metadata", "description", "item", "desc", None, None, "text"),
+    ("video_metadata", "hashtags", "derived", "hashtags", None, None, "character varying(250)[]"),
+    ("video_metadata", "mentions", "derived", "mentions", None, None, "bigint[]"),                                           # author ids of mentioned users
+    ("video_metadata", "music_id", "music", "id", None, _force_to_int, "bigint"),
+    ("video_metadata", "schedule_time", "item", "scheduleTime", None, None, "integer"),
+    ("video_metadata", "location_created", "item", "locationCreated", None, _location_code, "character varying(2)"),
+    ("video_metadata", "is_ad", "item", "isAd", False, None, "boolean"),                                                     # not in metadata seems to mean FALSE
+    ("video_metadata", "suggested_words", "item", "suggestedWords", None, None, "character varying(250)[]"),
+    ("video_metadata", "diggcount", "stats", "diggCount", None, _force_to_int, "integer"),
+    ("video_metadata", "sharecount", "stats", "shareCount", None, _force_to_int, "integer"),
+    ("video_metadata", "commentcount", "stats", "commentCount", None, _force_to_int, "integer"),
+    ("video_metadata", "playcount", "stats", "playCount", None, _force_to_int, "integer"),
+    ("video_metadata", "collectcount", "stats", "collectCount", None, _force_to_int, "integer"),
+    ("video_metadata", "repostcount", "stats", "repostCount", None, _force_to_int, "integer"),
+    ("video_metadata", "warn_info", "item", "warnInfo", None, _empty_dict_to_none, "json[]"),
+    ("video_metadata", "original_item", "item", "originalItem", None, None, "boolean"),
+    ("video_metadata", "offical_item", "item", "officalItem", None, None, "boolean"),
+    ("video_metadata", "secret", "item", "secret", None, None, "boolean"),
+    ("video_metadata", "for_friend", "item", "forFriend", None, None, "boolean"),
+    ("video_metadata", "digged", "item", "digged", None, None, "boolean"),
+    ("video_metadata", "item_comment_status", "item", "itemCommentStatus", None, None, "smallint"),
+    ("video_metadata", "take_down", "item", "takeDown", None, None, "integer"),
+    ("video_metadata", "effect_stickers", "item", "effectStickers", None, _empty_list_to_none, "character varying(250)[]"),
+    ("video_metadata", "private_item", "item", "privateItem", None, None, "boolean"),
+    ("video_metadata", "duet_enabled", "item", "duetEnabled", False, None, "boolean"),                                       # not in metadata seems to mean FALSE
+    ("video_metadata", "stitch_enabled", "item", "stitchEnabled", False, None, "boolean"),                                   # not in metadata seems to mean FALSE
+    ("video_metadata", "stickers_on_item", "item", "stickersOnItem", None, _empty_list_to_none, "character varying(250)[]"),
+    ("video_metadata", "share_enabled", "item", "shareEnabled", None, None, "boolean"),
+    ("video_metadata", "comments", "item", "comments", None, _empty_list_to_none, "character varying(250)[]"),
+    ("video_metadata", "duet_display", "item", "duetDisplay", None, None, "integer"),
+    ("video_metadata", "stitch_display", "item", "stitchDisplay", None, None, "integer"),
+    ("video_metadata", "index_enabled", "item", "indexEnabled", False, None, "boolean"),                                     # not in metadata seems to mean FALSE
+    ("video_metadata", "diversification_labels", "item", "diversificationLabels", None, None, "character varying(250)[]"),
+    ("video_metadata", "diversification_id", "item", "diversificationId", None, None, "bigint"),
+    ("video_metadata", "channel_tags", "item", "channelTags", None, _empty_dict_to_none, "character varying(250)[]"),
+    ("video_metadata", "keyword_tags", "item", "keywordTags", None, None, "json[]"),
+    ("video_metadata", "is_ai_gc", "item", "IsAigc", None, None, "boolean"),
+    ("video_metadata", "aigc_label_type", "item", "aigcLabelType", None, None, "integer"),
+    ("video_metadata", "ai_gc_description", "item", "AIGCDescription", None, _empty_str_to_none, "text"),
+    # <depreciated> poi_name, poi_address, poi_city (from stats.poi)
+
+    # video files metadata
+    ("file_metadata", "id", "item", "id", None, _force_to_int, "bigint NOT NULL"),                                           # ID of the specific video
+    ("file_metadata", "filepath", "derived", "filepath", None, None, "path NOT NULL"),                                       # specified later
+    ("file_metadata", "duration", "video", "duration", None, None, "integer"),
+    ("file_metadata", "height", "video", "height", None, None, "integer"),
+    ("file_metadata", "width", "video", "width", None, None, "integer"),
+    ("file_metadata", "ratio", "video", "ratio", None, _ratio_to_int, "integer"),                                            # in p
+    ("file_metadata", "volume_loudness", "volume", "Loudness", None, None, "numeric(3, 1)"),
+    ("file_metadata", "volume_peak", "volume", "Peak", None, None, "numeric(6, 5)"),
+    ("file_metadata", "has_original_audio", "cla", "hasOriginalAudio", None, None, "boolean"),
+    ("file_metadata", "enable_audio_caption", "cla", "enableAutoCaption", None, None, "boolean"),
+    ("file_metadata", "no_caption_reason", "cla", "noCaptionReason", None, None, "smallint"),
+
+    # video music metadata
+    ("music_metadata", "id", "music", "id", None, _force_to_int, "bigint"),                                                  # ID of the music, not the video!
+    ("music_metadata", "title", "music", "title", None, None, "character varying(250)"),
+    ("music_metadata", "author_name", "music", "authorName", None, None, "character varying(250)"),
+    ("music_metadata", "original", "music", "original", None, None, "boolean"),
+    ("music_metadata", "schedule_search_time", "music", "scheduleSearchTime", None, None, "integer"),
+    ("music_metadata", "collected", "music", "collected", None, None, "boolean"),
+    ("music_metadata", "precise_duration", "music", "preciseDuration", None, None, "json"),
+
+    # author metadata
+    ("author_metadata", "id", "author", "id", None, _force_to_int, "bigint"),
+    ("author_metadata", "username", "author", "uniqueId", None, None, "character varying(250)"),
+    ("author_metadata", "name", "author", "nickname", None, None, "character varying(250)"),
+    ("author_metadata", "signature", "author", "signature", None, None, "text"),
+    ("author_metadata", "create_time", "author", "createTime", None, None, "integer"),
+    ("author_metadata", "verified", "author", "verified", None, None, "boolean"),
+    ("author_metadata", "ftc", "author", "ftc", None, None, "boolean"),
+    ("author_metadata", "relation", "author", "relation", None, None, "integer"),
+    ("author_metadata", "open_favorite", "author", "openFavorite", None, None, "boolean"),
+    ("author_metadata", "comment_setting", "author", "commentSetting", None, None, "integer"),
+    ("author_metadata", "duet_setting", "author", "duetSetting", None, None, "smallint"),
+    ("author_metadata", "stitch_setting", "author", "stitchSetting", None, None, "smallint"),
+    ("author_metadata", "private_account", "author", "privateAccount", None, None, "boolean"),
+    ("author_metadata", "secret", "author", "secret", None, None, "boolean"),
+    ("author_metadata", "is_ad_virtual", "author", "isADVirtual", None, None, "boolean"),
+    ("author_metadata", "download_setting", "author", "downloadSetting", None, None, "smallint"),
+    ("author_metadata", "recommend_reason", "author", "recommendReason", None, None, "character varying(250)"),
+    ("author_metadata", "suggest_account_bind", "author", "suggestAccountBind", None, None, "boolean"),
+]
+
+TABLES = ["video_metadata", "file_metadata", "music_metadata", "author_metadata"]
+
+def _compile_schema(schema):
+    """
+    Compile the field schema into one function that builds all tables with straight-line code.
+    Every sub-object is resolved once, every field costs one dict lookup plus its coercion.
+    """
+    namespace = {}
+    lines = ["def _extract(data_slot, derived):"]
+    for source in ["video", "author", "music", "volume", "cla", "stats"]:
+        lines.append(f"    {source} = {SOURCES[source]}")
+    for table in TABLES:
+        lines.append(f"    {table} = {{")
+        for i, (field_table, column, source, key, default, coercion, _) in enumerate(schema):
+            if field_table != table:
+                continue
+            value = f"{SOURCES[source] if source in ('item', 'derived') else source}.get({key!r}, {default!r})"
+            if coercion is not None:
+                namespace[f"_coerce_{i}"] = coercion
+                value = f"_coerce_{i}({value})"
+            lines.append(f"        {column!r}: {value},")
+        lines.append("    }")
+    lines.append(f"    return {', '.join(TABLES)}")
+
+    exec(compile("\n".join(lines), "<_filter_tiktok_data schema>", "exec"), namespace)
+    return namespace["_extract"]
+
+_extract_tables = _compile_schema(FIELD_SCHEMA)
+
 def _prep_hashtags_and_mentions(data_slot):
     text_elements = data_slot.get("textExtra", None)
     challenges = data_slot.get("challenges", None)
 
     hashtags_metadata = []
     mentions_list = []
+    challenges_by_id = None
     if text_elements is not None:
         for element in text_elements:
             mention = element.get("userId", None)
@@ -29,9 +196,14 @@ def _prep_hashtags_and_mentions(data_slot):
                 hashtag_data["sub_type"] = element.get("subType", None)
                 hashtag_data["is_commerce"] = element.get("isCommerce", None)
 
-                matching_callenge = list(filter(lambda x : _force_to_int(x["id"]) == hashtag_data["id"], challenges))
+                if challenges_by_id is None:
+                    # index the challenges once, the first challenge with an id wins
+                    challenges_by_id = {}
+                    for challenge in challenges:
+                        challenges_by_id.setdefault(_force_to_int(challenge["id"]), challenge)
+
+                matching_callenge = challenges_by_id.get(hashtag_data["id"])
                 if matching_callenge:
-                    matching_callenge = matching_callenge[0]
                     hashtag_data["description"] = matching_callenge["desc"]
                 else:
                     hashtag_data["description"] = None
@@ -46,230 +218,12 @@ def _prep_hashtags_and_mentions(data_slot):
 def _filter_tiktok_data(data_slot):
     hashtags_metadata, mentions_list = _prep_hashtags_and_mentions(data_slot)
 
-    # video metadata
-    video_metadata = {}
-    ## id --> bigint NOT NULL
-    video_metadata["id"] = _force_to_int(data_slot.get("id", None)) #ID of the specific video
-    ## time_created --> timestamp without time zone,
-    video_metadata["time_created"] = datetime.fromtimestamp(int(data_slot.get("createTime", None))).isoformat()
-    ## author_id --> bigint
-    video_metadata["author_id"] = _force_to_int(data_slot.get("author", {}).get("id", None))
-    ## description --> text
-    video_metadata["description"] = data_slot.get("desc", None)
-    ## hashtags --> character varying(250)[]
-    video_metadata["hashtags"] = [h['name'] for h in hashtags_metadata]
-    ## mentions --> bigint[]
-    if mentions_list:
-        video_metadata["mentions"] = mentions_list # author ids of mentioned users
-    else:
-        video_metadata["mentions"] = None
-    ## music_id --> bigint
-    video_metadata["music_id"] = _force_to_int(data_slot.get("music", {}).get("id", None))
-    ## schedule_time --> integer
-    video_metadata["schedule_time"] = data_slot.get("scheduleTime", None)
-    ## location_created --> character varying(2)
-    video_metadata["location_created"] = data_slot.get("locationCreated", None)
-
-    if video_metadata["location_created"] and len(video_metadata["location_created"]) > 2:
-        if video_metadata["location_created"] == "FAKE-AD":
-            video_metadata["location_created"] = "XX"
-        else:
-            video_metadata["location_created"] = None
-    ## is_ad --> boolean
-    video_metadata["is_ad"] = data_slot.get("isAd", False) # Not in metadata seems to mean FALSE
-    ## suggested_words --> character varying(250)[]
-    video_metadata["suggested_words"] = data_slot.get("suggestedWords", None)
-    if video_metadata["suggested_words"] and len(video_metadata["suggested_words"]) == 0:
-        video_metadata["suggested_words"] = None
-
-    ## statistics for video metadata
-    try:
-        stats_data = data_slot["statsV2"]
-    except KeyError:
-        stats_data = data_slot.get("stats", {})
-
-    ## diggcount --> integer
-    video_metadata["diggcount"] = _force_to_int(stats_data.get("diggCount", None))
-    ## sharecount --> integer
-    video_metadata["sharecount"] = _force_to_int(stats_data.get("shareCount", None))
-    ## commentcount --> integer
-    video_metadata["commentcount"] = _force_to_int(stats_data.get("commentCount", None))
-    ## playcount --> integer
-    video_metadata["playcount"] = _force_to_int(stats_data.get("playCount", None))
-    ## collectcount --> integer
-    video_metadata["collectcount"] = _force_to_int(stats_data.get("collectCount", None))
-    ## repostcount --> integer
-    video_metadata["repostcount"] = _force_to_int(stats_data.get("repostCount", None))
-
-    # <depreciated>
-    ## poi data for video metadata
-    #poi_data = stats_data.get("poi", None)
-    #if poi_data is not None:
-    #    ## poi_name --> character varying(250)
-    #    video_metadata["poi_name"] = poi_data.get("name", None)
-    #    ## poi_address --> character varying(250)
-    #    video_metadata["poi_address"] = poi_data.get("address", None)
-    #    ## poi_city --> character varying(250)
-    #    video_metadata["poi_city"] = poi_data.get("city", None)
-
-    ## warn_info --> json[]
-    video_metadata["warn_info"] = data_slot.get("warnInfo", None)
-    if video_metadata["warn_info"] == {}:
-        video_metadata["warn_info"] = None
-    ## original_item --> boolean
-    video_metadata["original_item"] = data_slot.get("originalItem", None)
-    ## offical_item --> boolean
-    video_metadata["offical_item"] = data_slot.get("officalItem", None)
-    ## secret --> boolean
-    video_metadata["secret"] = data_slot.get("secret", None)
-    ## for_friend --> boolean
-    video_metadata["for_friend"] = data_slot.get("forFriend", None)
-    ## digged --> boolean
-    video_metadata["digged"] = data_slot.get("digged", None)
-    ## item_comment_status --> smallint
-    video_metadata["item_comment_status"] = data_slot.get("itemCommentStatus", None)
-    ## take_down --> integer
-    video_metadata["take_down"] = data_slot.get("takeDown", None)
-    ## effect_stickers --> character varying(250)[]
-    video_metadata["effect_stickers"] = data_slot.get("effectStickers", None)
-    if len(video_metadata["effect_stickers"]) == 0:
-        video_metadata["effect_stickers"] = None
-    ## private_item --> boolean
-    video_metadata["private_item"] = data_slot.get("privateItem", None)
-    ## duet_enabled --> boolean
-    video_metadata["duet_enabled"] = data_slot.get("duetEnabled", False) # Not in metadata seems to mean FALSE
-    ## stitch_enabled --> boolean
-    video_metadata["stitch_enabled"] = data_slot.get("stitchEnabled", False) # Not in metadata seems to mean FALSE
-    ## stickers_on_item --> character varying(250)[]
-    video_metadata["stickers_on_item"] = data_slot.get("stickersOnItem", None)
-    if len(video_metadata["stickers_on_item"]) == 0:
-        video_metadata["stickers_on_item"] = None
-    ## share_enabled --> boolean
-    video_metadata["share_enabled"] = data_slot.get("shareEnabled", None)
-    ## comments --> character varying(250)[]
-    video_metadata["comments"] = data_slot.get("comments", None)
-    if len(video_metadata["comments"]) == 0:
-        video_metadata["comments"] = None
-    ## duet_display --> integer
-    video_metadata["duet_display"] = data_slot.get("duetDisplay", None)
-    ## stitch_display --> integer
-    video_metadata["stitch_display"] = data_slot.get("stitchDisplay", None)
-    ## index_enabled --> boolean
-    video_metadata["index_enabled"] = data_slot.get("indexEnabled", False) # Not in metadata seems to mean FALSE
-    ## diversification_labels --> character varying(250)[]
-    video_metadata["diversification_labels"] = data_slot.get("diversificationLabels", None)
-    if video_metadata["diversification_labels"] and len(video_metadata["diversification_labels"]) == 0:
-        video_metadata["diversification_labels"] = None
-    ## diversification_id --> bigint
-    video_metadata["diversification_id"] = data_slot.get("diversificationId", None)
-    ## channel_tags --> character varying(250)[]
-    video_metadata["channel_tags"] = data_slot.get("channelTags", None) # is it really tied to the author?
-    if video_metadata["channel_tags"] == {}:
-        video_metadata["channel_tags"] = None
-    ## keyword_tags --> json[]
-    video_metadata["keyword_tags"] = data_slot.get("keywordTags", None)
-    ## is_ai_gc --> boolean
-    video_metadata["is_ai_gc"] = data_slot.get("IsAigc", None)
-    ## aigcLabelType --> integer
-    video_metadata["aigc_label_type"] = data_slot.get("aigcLabelType", None)
-    ## ai_gc_description --> text
-    video_metadata["ai_gc_description"] = data_slot.get("AIGCDescription", None)
-    if video_metadata["ai_gc_description"] == '':
-        video_metadata["ai_gc_description"] = None
-
-    # ---
-
-    # Video Files metadata
-    file_metadata = {}
-    ## id --> bigint NOT NULL
-    file_metadata["id"] = _force_to_int(data_slot.get("id", None)) #ID of the specific video
-    ## filepath --> path NOT NULL
-    file_metadata["filepath"] = None #specified later
-    ## duration --> integer
-    file_metadata["duration"] = data_slot.get("video", {}).get("duration", None)
-    ## height --> integer
-    file_metadata["height"] = data_slot.get("video", {}).get("height", None)
-    ## width --> integer
-    file_metadata["width"] = data_slot.get("video", {}).get("width", None)
-    ## ratio --> integer
-    file_metadata["ratio"] = data_slot.get("video", {}).get("ratio", None) #in p
-    if file_metadata["ratio"]:
-        file_metadata["ratio"] = _force_to_int(file_metadata["ratio"][:-1]) # 540p -> 540
-    else:
-        file_metadata["ratio"] = None
-    ## volume_loudness --> numeric(3, 1)
-    file_metadata["volume_loudness"] = data_slot.get("video", {}).get("volumeInfo", {}).get("Loudness", None)
-    ## volume_peak --> numeric(6, 5)
-    file_metadata["volume_peak"] = data_slot.get("video", {}).get("volumeInfo", {}).get("Peak", None)
-    ## has_original_audio --> boolean
-    file_metadata["has_original_audio"] = data_slot.get("video", {}).get("claInfo", {}).get("hasOriginalAudio", None)
-    ## enable_audio_caption --> boolean
-    file_metadata["enable_audio_caption"] = data_slot.get("video", {}).get("claInfo", {}).get("enableAutoCaption", None)
-    ## no_caption_reason --> smallint
-    file_metadata["no_caption_reason"] = data_slot.get("video", {}).get("claInfo", {}).get("noCaptionReason", None)
-
-    # ---
-
-    # Video Music metadata
-    music_metadata = {}
-    ## id --> bigint
-    music_metadata["id"] = video_metadata["music_id"] # ID of the music, not the video!
-    ## title --> character varying(250)
-    music_metadata["title"] = data_slot.get("music", {}).get("title", None)
-    ## author_name --> character varying(250)
-    music_metadata["author_name"] = data_slot.get("music", {}).get("authorName", None)
-
-    ## original --> boolean
-    music_metadata["original"] = data_slot.get("music", {}).get("original", None)
-    ## schedule_search_time --> integer
-    music_metadata["schedule_search_time"] = data_slot.get("music", {}).get("scheduleSearchTime", None)
-    ## collected --> boolean
-    music_metadata["collected"] = data_slot.get("music", {}).get("collected", None)
-    ## precise_duration --> json
-    music_metadata["precise_duration"] = data_slot.get("music", {}).get("preciseDuration", None)
-
-    # ---
-
-    # Author metadata
-    author_metadata = {}
-    ## id --> bigint
-    author_metadata["id"] = _force_to_int(data_slot.get("author", {}).get("id", None))
-    ## username --> character varying(250)
-    author_metadata["username"] = data_slot.get("author", {}).get("uniqueId", None)
-    ## name --> character varying(250)
-    author_metadata["name"] = data_slot.get("author", {}).get("nickname", None)
-    ## signature --> text
-    author_metadata["signature"] = data_slot.get("author", {}).get("signature", None)
-    ## create_time --> integer
-    author_metadata["create_time"] = data_slot.get("author", {}).get("createTime", None)
-    ## verified --> boolean
-    author_metadata["verified"] = data_slot.get("author", {}).get("verified", None)
-    ## ftc --> boolean
-    author_metadata["ftc"] = data_slot.get("author", {}).get("ftc", None)
-    ## relation --> integer
-    author_metadata["relation"] = data_slot.get("author", {}).get("relation", None)
-    ## open_favorite --> boolean
-    author_metadata["open_favorite"] = data_slot.get("author", {}).get("openFavorite", None)
-    ## comment_setting --> integer
-    author_metadata["comment_setting"] = data_slot.get("author", {}).get("commentSetting", None)
-    ## duet_setting --> smallint
-    author_metadata["duet_setting"] = data_slot.get("author", {}).get("duetSetting", None)
-    ## stitch_setting --> smallint
-    author_metadata["stitch_setting"] = data_slot.get("author", {}).get("stitchSetting", None)
-    ## private_account --> boolean
-    author_metadata["private_account"] = data_slot.get("author", {}).get("privateAccount", None)
-    ## secret --> boolean
-    author_metadata["secret"] = data_slot.get("author", {}).get("secret", None)
-    ## is_ad_virtual --> boolean
-    author_metadata["is_ad_virtual"] = data_slot.get("author", {}).get("isADVirtual", None)
-    ## download_setting --> smallint
-    author_metadata["download_setting"] = data_slot.get("author", {}).get("downloadSetting", None)
-    ## recommend_reason --> character varying(250)
-    author_metadata["recommend_reason"] = data_slot.get("author", {}).get("recommendReason", None)
-    ## suggest_account_bind --> boolean
-    author_metadata["suggest_account_bind"] = data_slot.get("author", {}).get("suggestAccountBind", None)
-
-    # ---x
+    derived = {
+        "hashtags": [h['name'] for h in hashtags_metadata],
+        "mentions": mentions_list if mentions_list else None,
+        "filepath": None,
+    }
+    video_metadata, file_metadata, music_metadata, author_metadata = _extract_tables(data_slot, derived)
 
     # combine all
     filtered_metadata = {}
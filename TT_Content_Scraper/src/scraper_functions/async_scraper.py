@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .base_scraper import BaseScraper, DownloadFailedError, _parse_metadata, _parse_user, _missing_data_error, _file_kind
+from ..retry_policy import backoff_delay
+from ..metrics import timed
+from ._extract_rehydration_data import _extract_rehydration_data
+
+logger = logging.getLogger('TTCS.AsyncBase')
+
+# errors of requests that did not get an answer
+CONNECTION_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) if aiohttp is not None else (asyncio.TimeoutError,)
+
+class AsyncBaseScraper(BaseScraper):
+    """
+    asyncio counterpart of BaseScraper.
+
+    scrape_metadata, scrape_user and scrape_binaries are coroutines that share one aiohttp session.
+    At most `max_concurrency` requests are in flight at the same time. The session is bound to the
+    event loop it is opened in, so use the scraper as an async context manager inside the loop
+    that runs the scrape (this also works in an already running loop, e.g. in Jupyter).
+    """
+    def __init__(self, browser_name = None, proxy = None, base_url = "https://www.tiktok.com", max_concurrency = 100, chunk_size = 64 * 1024):
+        if aiohttp is None:
+            raise ImportError("The async scraper needs aiohttp, install it with 'pip install aiohttp'")
+
+        super().__init__(browser_name=browser_name, proxy=proxy, base_url=base_url, chunk_size=chunk_size)
+        self.max_concurrency = max_concurrency
+        self.session = None
+        self._semaphore = None
+        self._music_downloads = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def open(self) -> None:
+        if self.session is not None:
+            return
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+        # browser cookies come as a CookieJar, cookies retained from a response as a dict
+        cookies = self.cookies if isinstance(self.cookies, dict) else {c.name: c.value for c in self.cookies}
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            cookies=cookies,
+            # like the timeout of requests: per connect and per read, a long download may take as long as it keeps going
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=20, sock_read=20),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _proxy_url(self):
+        # requests expects a dict of proxies per scheme, aiohttp a single proxy url
+        if isinstance(self.proxy, dict):
+            return self.proxy.get("https") or self.proxy.get("http")
+        return self.proxy
+
+    async def request(self, url, read_text = False, refresh = False):
+        """
+        Fetch an url and return its status code and body (bytes, or str if read_text). Cookies are kept in the session.
+        `refresh`: a stats refresh, which needs the current page and not a recorded one (see ResponseCache.get).
+        """
+        cache = self.response_cache
+        if cache is not None:
+            cached = cache.get(url, refresh=refresh)
+            if cached is not None:
+                return cached.status, cached.body.decode("utf-8", errors="replace") if read_text else cached.body
+
+        if self.session is None:
+            await self.open()
+
+        async with self._semaphore:
+            response = await self._get(url)
+            try:
+                body = await response.read()
+                if cache is not None:
+                    cache.put(url, response.status, response.headers.get("Content-Type"), body)
+                if read_text:
+                    body = body.decode(response.get_encoding(), errors="replace")
+                return response.status, body
+            finally:
+                response.release()
+
+    async def _get(self, url):
+        """session.get that waits for the rate limiter and reports the status and latency to it."""
+        if self.rate_limiter is not None:
+            wait_time = await self.rate_limiter.acquire_async(url)
+            if self.metrics is not None:
+                self.metrics.observe("budget_wait", wait_time)
+        start = time.monotonic()
+        try:
+            response = await self.session.get(url, allow_redirects=True, proxy=self._proxy_url())
+        except CONNECTION_ERRORS:
+            # refused or dropped connections count as throttling, too
+            if self.rate_limiter is not None:
+                self.rate_limiter.record(url, throttled=True)
+            if self.metrics is not None:
+                self.metrics.count_response(None)
+            raise
+        if self.rate_limiter is not None:
+            self.rate_limiter.record(url, status=response.status, latency=time.monotonic() - start,
+                                    retry_after=response.headers.get("Retry-After"))
+        if self.metrics is not None:
+            self.metrics.count_response(response.status)
+        return response
+
+    async def scrape_metadata(self, video_id, refresh = False) -> tuple:
+        url = f"{self.base_url}/@tiktok/video/{video_id}"
+        retries = 0
+        while True:
+            with timed(self.metrics, "fetch_page", "page"):
+                status, page = await self.request(url, refresh=refresh)
+            with timed(self.metrics, "extract", "page"):
+                rehydration_data = _extract_rehydration_data(page)
+            self._count_page(page)
+            if rehydration_data is not None:
+                break # success
+            self._report_missing_rehydration(url, status)
+            retries += 1
+            if retries > self.page_retries:
+                raise _missing_data_error(status)
+            await self._sleep_async(backoff_delay(retries, base=0.2), "throttled")
+
+        return _parse_metadata(rehydration_data, self.metrics)
+
+    async def scrape_user(self, username : str) -> dict:
+        """Scrapes a single user page based on the username (with or without an "@")."""
+        username = username.replace("@", "")
+
+        url = f"{self.base_url}/@{username}"
+        with timed(self.metrics, "fetch_page", "user"):
+            status, page = await self.request(url)
+        with timed(self.metrics, "extract", "user"):
+            rehydration_data = _extract_rehydration_data(page)
+        self._count_page(page)
+        if rehydration_data is None:
+            self._report_missing_rehydration(url, status)
+            raise _missing_data_error(status)
+
+        return _parse_user(rehydration_data, self.metrics)
+
+    async def scrape_binaries(self, links) -> dict:
+        """Download mp3, mp4 and all slide pictures of one post concurrently. Returns the same dict as BaseScraper.scrape_binaries."""
+        audio = self._with_retries_async(self._scrape_binary, links["mp3"]) if links["mp3"] else _none()
+        video = self._with_retries_async(self._scrape_binary, links["mp4"], strip_chain_token=True) if links["mp4"] else _none()
+        pictures = []
+        if links["jpegs"]:
+            logger.info("-> is slide with {} pictures".format(len(links["jpegs"])))
+            pictures = [self._with_retries_async(self._scrape_binary, image["imageURL"]["urlList"][0]) for image in links["jpegs"]]
+
+        audio_binary, video_binary, *picture_binaries = await asyncio.gather(audio, video, *pictures)
+        return {"mp3": audio_binary,
+                "mp4": video_binary,
+                "jpegs": picture_binaries if links["jpegs"] else None}
+
+    async def scrape_binaries_to_disk(self, links, filenames) -> dict:
+        """Stream the binaries of a post into files, see BaseScraper.scrape_binaries_to_disk. Slide pictures are downloaded concurrently."""
+        written = {"mp3": None, "mp4": None, "jpegs": None}
+
+        if links["mp4"]:
+            written["mp4"] = await self._with_retries_async(self.download_to_file, links["mp4"], filenames["mp4"], strip_chain_token=True)
+        elif links["jpegs"]:
+            logger.info("-> is slide with {} pictures".format(len(links["jpegs"])))
+            downloads = [self._with_retries_async(self.download_to_file, image["imageURL"]["urlList"][0], filenames["jpegs"][i])
+                         for i, image in enumerate(links["jpegs"])]
+            if links["mp3"]:
+                downloads.append(self._with_retries_async(self._download_music, links, filenames["mp3"]))
+            paths = await asyncio.gather(*downloads)
+            written["jpegs"] = paths[:len(links["jpegs"])]
+            if links["mp3"]:
+                written["mp3"] = paths[-1]
+
+        return written
+
+    async def _with_retries_async(self, download, *args, **kwargs):
+        """await download(*args, **kwargs), up to self.asset_retries more times with backoff if it fails for a transient reason."""
+        retries = 0
+        while True:
+            try:
+                return await download(*args, **kwargs)
+            except (ConnectionError,) + CONNECTION_ERRORS as e:
+                retries += 1
+                if retries > self.asset_retries:
+                    raise DownloadFailedError(f"{e.__class__.__name__}: {e}") from e
+                delay = backoff_delay(retries, base=0.2)
+                logger.warning(f"{e} - retry {retries} of {self.asset_retries} in {delay:.1f}s")
+                await self._sleep_async(delay, "download")
+
+    async def _sleep_async(self, delay, error_class) -> None:
+        if self.metrics is not None:
+            self.metrics.retries.inc(scope="immediate", error_class=error_class)
+            self.metrics.observe("sleep", delay)
+        await asyncio.sleep(delay)
+
+    async def _download_music(self, links, filename) -> Path:
+        """Download the audio of a slide, unless the binary store already has the audio of its music id."""
+        store = self.binary_store
+        music_id = links.get("music_id")
+        if store is None or not music_id:
+            return await self.download_to_file(links["mp3"], filename)
+
+        path = store.link_music(music_id, filename)
+        if path is not None:
+            return path
+
+        # another task may be downloading the same sound right now
+        running = self._music_downloads.get(music_id)
+        if running is not None:
+            await running.wait()
+            path = store.link_music(music_id, filename)
+            if path is not None:
+                return path
+            return await self.download_to_file(links["mp3"], filename)
+
+        self._music_downloads[music_id] = asyncio.Event()
+        try:
+            path, sha256 = await self._download(links["mp3"], filename)
+            store.remember_music(music_id, sha256, path.suffix)
+        finally:
+            self._music_downloads.pop(music_id).set()
+        return path
+
+    async def download_to_file(self, url, filename, strip_chain_token = False) -> Path:
+        """Download an url in chunks into a temporary file that is renamed to `filename` (or handed to the binary store) once it is complete."""
+        return (await self._download(url, filename, strip_chain_token))[0]
+
+    async def _download(self, url, filename, strip_chain_token = False) -> tuple:
+        with timed(self.metrics, "download", _file_kind(filename)):
+            if self.response_cache is not None:
+                cached = await _in_thread(self.response_cache.get, url)
+                if cached is not None:
+                    return await self._download_cached(cached, filename)
+            return await self._download_streamed(url, filename, strip_chain_token)
+
+    async def _download_streamed(self, url, filename, strip_chain_token = False) -> tuple:
+        if self.session is None:
+            await self.open()
+
+        async with self._semaphore:
+            response = await self._get(url)
+            try:
+                # permission error (videos can sometimes be fetched without the chain token)
+                if strip_chain_token and response.status >= 400:
+                    response.release()
+                    url = url.replace("=tt_chain_token", "")
+                    response = await self._get(url)
+
+                if response.status == 403:
+                    raise ConnectionError(f"403 for {url}")
+
+                # the file is written by the default executor, so a slow disk does not hold up the event loop
+                filename = Path(filename)
+                hasher = hashlib.sha256() if self.binary_store is not None else None
+                fd, tmp_filename = await _in_thread(tempfile.mkstemp, ".part", f".{filename.name}.", filename.parent)
+                size = 0
+                try:
+                    f = os.fdopen(fd, "wb")
+                    try:
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            await _in_thread(f.write, chunk)
+                            size += len(chunk)
+                            if hasher is not None:
+                                hasher.update(chunk)
+                    finally:
+                        await _in_thread(f.close)
+                    if self.response_cache is not None:
+                        # recorded from the file, so the download is not held in memory
+                        await _in_thread(self.response_cache.put_file, url, response.status, response.headers.get("Content-Type"), tmp_filename)
+                    await _in_thread(self._place, tmp_filename, hasher.hexdigest() if hasher is not None else None, filename)
+                except BaseException:
+                    Path(tmp_filename).unlink(missing_ok=True)
+                    raise
+            finally:
+                response.release()
+
+        if self.metrics is not None:
+            self.metrics.downloaded_bytes.inc(size, kind=_file_kind(filename))
+        logger.debug(f"▼ {filename.suffix[1:].upper():<4} saved to {filename}")
+        return filename, hasher.hexdigest() if hasher is not None else None
+
+    async def _download_cached(self, cached, filename) -> tuple:
+        """_download of an answer from the response cache."""
+        content = cached.body
+
+        filename = Path(filename)
+        sha256 = hashlib.sha256(content).hexdigest() if self.binary_store is not None else None
+        await _in_thread(self._write_file, content, sha256, filename)
+
+        if self.metrics is not None:
+            self.metrics.downloaded_bytes.inc(len(content), kind=_file_kind(filename))
+        logger.debug(f"▼ {filename.suffix[1:].upper():<4} saved to {filename}")
+        return filename, sha256
+
+    def _write_file(self, content, sha256, filename) -> None:
+        fd, tmp_filename = tempfile.mkstemp(dir=filename.parent, prefix=f".{filename.name}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            self._place(tmp_filename, sha256, filename)
+        except BaseException:
+            Path(tmp_filename).unlink(missing_ok=True)
+            raise
+
+    def _place(self, tmp_filename, sha256, filename) -> None:
+        """Move a complete temporary file to `filename`, or into the binary store if there is one."""
+        if self.binary_store is not None:
+            self.binary_store.place(tmp_filename, sha256, filename)
+        else:
+            os.replace(tmp_filename, filename)
+
+    async def _scrape_binary(self, url, strip_chain_token = False) -> bytes:
+        status, content = await self.request(url)
+
+        # permission error (videos can sometimes be fetched without the chain token)
+        if strip_chain_token and status >= 400:
+            status, content = await self.request(url.replace("=tt_chain_token", ""))
+
+        if status == 403:
+            raise ConnectionError
+        return content
+
+
+async def _none():
+    return None
+
+async def _in_thread(function, *args):
+    """Run a blocking function (disk I/O) in the default executor of the running loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
@@ -1,27 +1,113 @@
 import logging
-import json
-import logging
-import json
-import requests
-import browser_cookie3
-from bs4 import BeautifulSoup
-import json
-from pprint import pprint
+import os
+import hashlib
 import ssl
+import tempfile
 import time
+from pathlib import Path
+from urllib.parse import urlsplit
 
+import requests
+import browser_cookie3
 
 from ._filter_tiktok_data import _filter_tiktok_data
+from ._extract_rehydration_data import _extract_rehydration_data
+from ._decode_rehydration_data import _decode_rehydration_path
+from .http_session import PooledSessions
+from ..retry_policy import backoff_delay
+from ..metrics import timed
 
 logger = logging.getLogger('TTCS.Base')
 
 class RetryLaterError(Exception):
-     """Something could not be scraped, maybe later..."""
-     pass
+     """Something could not be scraped, maybe later... `error_class` selects the backoff (see RetryPolicy)."""
+     error_class = "transient"
+
+     def __init__(self, message, error_class = None):
+          super().__init__(message)
+          if error_class is not None:
+               self.error_class = error_class
+
+class MissingDataError(RetryLaterError, KeyError):
+     """A page came without __UNIVERSAL_DATA_FOR_REHYDRATION__, usually because TikTok throttles the scraper."""
+     error_class = "throttled"
+
+class DownloadFailedError(RetryLaterError, ConnectionError):
+     """A file could not be downloaded, not even after several attempts."""
+     error_class = "download"
+
+# errors of a download that are worth another attempt
+TRANSIENT_ERRORS = (requests.exceptions.ChunkedEncodingError, ConnectionError, requests.exceptions.ReadTimeout,
+                    requests.exceptions.ConnectionError, ssl.SSLError, requests.exceptions.SSLError)
+
+def _parse_metadata(rehydration_data : str, metrics = None) -> tuple:
+    """Turn the rehydration data of a video page into the sorted metadata and the links to its binaries."""
+    with timed(metrics, "decode", "page"):
+        metadata = _decode_rehydration_path(rehydration_data, ("__DEFAULT_SCOPE__", "webapp.video-detail", "itemInfo", "itemStruct"))
+    with timed(metrics, "filter", "page"):
+        sorted_metadata = _filter_tiktok_data(data_slot=metadata)
+
+    # find link to binary of slide (pictures), music or video file
+    images_binaries_addr = metadata.get('imagePost', None)
+    if images_binaries_addr: images_binaries_addr = images_binaries_addr.get("images", None)
+    
+    audio_binary_addr = metadata.get('music', None)
+    if audio_binary_addr: audio_binary_addr = audio_binary_addr.get("playUrl", None)
+    
+    video_binary_addr = metadata.get('video', None)
+    if video_binary_addr: video_binary_addr = video_binary_addr.get("playAddr", None)
+    if video_binary_addr == '':
+        video_binary_addr = metadata.get('video', None).get("downloadAddr", None)
+
+    music_id = metadata.get('music', None)
+    if music_id: music_id = music_id.get("id", None)
+
+    link_to_binaries = {
+        "mp4" : video_binary_addr,
+        "mp3" : audio_binary_addr,
+        "jpegs" : images_binaries_addr,
+        "music_id" : music_id
+        }
+
+    return sorted_metadata, link_to_binaries
+
+def _parse_user(rehydration_data : str, metrics = None) -> dict:
+    """Return the user info from the rehydration data of a user page."""
+    # filtering html data
+    with timed(metrics, "decode", "user"):
+        user_data = _decode_rehydration_path(rehydration_data, ("__DEFAULT_SCOPE__", "webapp.user-detail", "userInfo"))
+    
+    return user_data
+
+
+def _cached_response(url, cached) -> requests.Response:
+    """A requests.Response with the status and body of a cached answer (see ResponseCache)."""
+    response = requests.Response()
+    response.url = url
+    response.status_code = cached.status
+    if cached.content_type:
+        response.headers["Content-Type"] = cached.content_type
+    # iter_content() hands out slices of the body once it is consumed
+    response._content = cached.body
+    response._content_consumed = True
+    response.from_cache = True
+    return response
+
+def _file_kind(filename) -> str:
+    """"mp4", "mp3" or "jpeg", the kind of a download in the metrics."""
+    return Path(filename).suffix[1:].lower()
+
+def _missing_data_error(status : int) -> MissingDataError:
+    return MissingDataError("__UNIVERSAL_DATA_FOR_REHYDRATION__ not in response",
+                            error_class="server" if status >= 500 else "throttled")
+
 
 class BaseScraper():
-    def __init__(self, browser_name = None, proxy=None):
+    def __init__(self, browser_name = None, proxy=None, base_url = "https://www.tiktok.com", pool_size = 10, chunk_size = 64 * 1024):
         self.proxy = proxy
+        self.chunk_size = chunk_size
+        self.base_url = base_url.rstrip("/")
+        self.sessions = PooledSessions(page_host=urlsplit(self.base_url).hostname, pool_size=pool_size)
         self.headers = {
             'Accept-Encoding': 'gzip, deflate, sdch',
             'Accept-Language': 'en-US,en;q=0.8',
@@ -33,6 +119,17 @@ class BaseScraper():
             'referer' : 'https://www.tiktok.com/'
         }   
         self.cookies = dict()
+        # BinaryStore for content addressed downloads, set by TT_Content_Scraper(dedup_files=True)
+        self.binary_store = None
+        # AdaptiveRateLimiter shared by all scrapers, set by TT_Content_Scraper(adaptive_rate=True)
+        self.rate_limiter = None
+        # quick retries of a page without data and of every single file, with exponential backoff
+        self.page_retries = 3
+        self.asset_retries = 3
+        # ResponseCache that records or replays the answers, set by TT_Content_Scraper(response_cache=...)
+        self.response_cache = None
+        # MetricsRegistry that gets the time per stage, bytes, statuses and retries, set by TT_Content_Scraper(metrics=...)
+        self.metrics = None
     
     def set_browser(self, browser_name) -> None:
         self.cookies = getattr(browser_cookie3, browser_name)(domain_name='.tiktok.com')  # Inspired by pyktok
@@ -41,16 +138,47 @@ class BaseScraper():
         self.proxy = proxy
         return
 
-    def request_and_retain_cookies(self, url, retain = True) -> requests.Response:
-            
-            response = requests.get(url,
-                    allow_redirects=True, # may have to set to True
-                    headers=self.headers,
-                    cookies=self.cookies,
-                    timeout=20,
-                    stream=False,
-                    proxies=self.proxy
-            )
+    def request_and_retain_cookies(self, url, retain = True, stream = False, refresh = False) -> requests.Response:
+            """`refresh`: a stats refresh, which needs the current page and not a recorded one (see ResponseCache.get)."""
+
+            cache = self.response_cache
+            if cache is not None:
+                cached = cache.get(url, refresh=refresh)
+                if cached is not None:
+                    # no request, so no cookies to retain and nothing for the rate limiter
+                    return _cached_response(url, cached)
+
+            if self.rate_limiter is not None:
+                wait_time = self.rate_limiter.acquire(url)
+                if self.metrics is not None:
+                    self.metrics.observe("budget_wait", wait_time)
+
+            try:
+                response = self.sessions.session_for(url).get(url,
+                        allow_redirects=True, # may have to set to True
+                        headers=self.headers,
+                        cookies=self.cookies,
+                        timeout=20,
+                        stream=stream,
+                        proxies=self.proxy
+                )
+            except requests.RequestException:
+                # refused or dropped connections count as throttling, too
+                if self.rate_limiter is not None:
+                    self.rate_limiter.record(url, throttled=True)
+                if self.metrics is not None:
+                    self.metrics.count_response(None)
+                raise
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.record(url, status=response.status_code, latency=response.elapsed.total_seconds(),
+                                        retry_after=response.headers.get("Retry-After"))
+            if self.metrics is not None:
+                self.metrics.count_response(response.status_code)
+
+            # a streamed body is not read here, the download stores the file it was written to (see _download_timed)
+            if cache is not None and not stream:
+                cache.put(url, response.status_code, response.headers.get("Content-Type"), response.content)
             
             # retain any new cookies that got set in this request
             if retain:
@@ -58,46 +186,44 @@ class BaseScraper():
 
             return response
 
-    def scrape_metadata(self, video_id) -> dict:
+    def _report_missing_rehydration(self, url, status) -> None:
+        # TikTok answers too many requests with a page without data rather than with an error status
+        # (error statuses were already reported by the request itself, a 403 of a page as throttling)
+        if self.rate_limiter is not None and status < 400:
+            self.rate_limiter.record(url, throttled=True)
+        # the next attempt must not get the same empty page from the cache
+        if self.response_cache is not None:
+            self.response_cache.discard(url)
 
-        retries = 0
-        script_tag = None
-        while script_tag is None and retries <= 3:
-            response = self.request_and_retain_cookies(url=f"https://www.tiktok.com/@tiktok/video/{video_id}")
-            soup = BeautifulSoup(response.text, "html.parser")
-            script_tag = soup.find('script', id="__UNIVERSAL_DATA_FOR_REHYDRATION__")
+    def connection_stats(self) -> dict:
+        """Number of requests, new connections and reused keep-alive connections of this scraper."""
+        return self.sessions.stats.as_dict()
 
-            if script_tag is not None:
-                break # success
-            else:
-                retries += 1
-                time.sleep(0.1)
-        else:
-            if script_tag is None: raise KeyError("__UNIVERSAL_DATA_FOR_REHYDRATION__ not in response")
+    def close(self) -> None:
+        self.sessions.close()
 
-        data = json.loads(script_tag.string)
-        metadata = data["__DEFAULT_SCOPE__"]["webapp.video-detail"]["itemInfo"]["itemStruct"]
-        sorted_metadata = _filter_tiktok_data(data_slot=metadata)
+    def scrape_metadata(self, video_id, refresh = False) -> dict:
+        """`refresh`: a stats refresh of the video, its page is fetched even if the response cache has it."""
 
-        # find link to binary of slide (pictures), music or video file
-        images_binaries_addr = metadata.get('imagePost', None)
-        if images_binaries_addr: images_binaries_addr = images_binaries_addr.get("images", None)
-        
-        audio_binary_addr = metadata.get('music', None)
-        if audio_binary_addr: audio_binary_addr = audio_binary_addr.get("playUrl", None)
-        
-        video_binary_addr = metadata.get('video', None)
-        if video_binary_addr: video_binary_addr = video_binary_addr.get("playAddr", None)
-        if video_binary_addr == '':
-            video_binary_addr = metadata.get('video', None).get("downloadAddr", None)
+        url = f"{self.base_url}/@tiktok/video/{video_id}"
+        retries = 0
+        while True:
+            with timed(self.metrics, "fetch_page", "page"):
+                response = self.request_and_retain_cookies(url=url, refresh=refresh)
+                content = response.content
+            with timed(self.metrics, "extract", "page"):
+                rehydration_data = _extract_rehydration_data(content)
+            self._count_page(content)
 
-        link_to_binaries = {
-            "mp4" : video_binary_addr,
-            "mp3" : audio_binary_addr,
-            "jpegs" : images_binaries_addr
-            }
+            if rehydration_data is not None:
+                break # success
+            self._report_missing_rehydration(url, response.status_code)
+            retries += 1
+            if retries > self.page_retries:
+                raise _missing_data_error(response.status_code)
+            self._sleep(backoff_delay(retries, base=0.2), "throttled")
 
-        return sorted_metadata, link_to_binaries
+        return _parse_metadata(rehydration_data, self.metrics)
 
     def scrape_user(self, username : str) -> dict:
         """
@@ -115,53 +241,171 @@ class BaseScraper():
         if "@" in username:
             username = str.replace(username, "@", "")
         
-        response = self.request_and_retain_cookies(url=f"https://www.tiktok.com/@{username}")
-        
-        soup = BeautifulSoup(response.text, "html.parser")
-        rehydration_data = soup.find('script', attrs={'id':"__UNIVERSAL_DATA_FOR_REHYDRATION__"})
+        url = f"{self.base_url}/@{username}"
+        with timed(self.metrics, "fetch_page", "user"):
+            response = self.request_and_retain_cookies(url=url)
+            content = response.content
+        with timed(self.metrics, "extract", "user"):
+            rehydration_data = _extract_rehydration_data(content)
+        self._count_page(content)
+        if rehydration_data is None:
+            self._report_missing_rehydration(url, response.status_code)
+            raise _missing_data_error(response.status_code)
 
-        rehydration_data_json = json.loads(rehydration_data.string)
+        return _parse_user(rehydration_data, self.metrics)
 
-        # filtering html data
-        user_data = rehydration_data_json["__DEFAULT_SCOPE__"]["webapp.user-detail"]["userInfo"]
-        
-        return user_data
+    def _count_page(self, content) -> None:
+        if self.metrics is not None:
+            self.metrics.downloaded_bytes.inc(len(content), kind="page")
+
+    def _sleep(self, delay, error_class) -> None:
+        """Sleep before an immediate retry of a page or file (error_class "throttled" or "download")."""
+        if self.metrics is not None:
+            self.metrics.retries.inc(scope="immediate", error_class=error_class)
+            self.metrics.observe("sleep", delay)
+        time.sleep(delay)
 
     def scrape_binaries(self, links) -> dict:
         audio_binary = None
         video_binary = None
         picture_content_binary = None
-        retries = 0
 
-        while retries <= 3:
+        if links["mp3"]:
+            audio_binary = self._with_retries(self._scrape_audio, links["mp3"])
+        if links["mp4"]:
+            video_binary = self._with_retries(self._scrape_video, links["mp4"])
+        if links["jpegs"]:
+            metadata_images = links["jpegs"]
+            logger.info("-> is slide with {} pictures".format(len(metadata_images)))
+            picture_content_binary = (len(metadata_images)) * [None]
+            for i in range(len(metadata_images)):
+                tt_pic_url = metadata_images[i]["imageURL"]["urlList"][0]
+                # metadata_images[i].pop("imageURL")
+                # picture_formats = metadata_images
+
+                picture_content_binary[i] = self._with_retries(self._scrape_picture, tt_pic_url)
+
+        return {"mp3": audio_binary,
+                "mp4": video_binary,
+                "jpegs": picture_content_binary}
+
+    def scrape_binaries_to_disk(self, links, filenames) -> dict:
+        """
+        Stream the binaries of a post straight into files instead of keeping them in memory.
+
+        `filenames` maps "mp4" and "mp3" to a path and "jpegs" to one path per slide picture.
+        Only the video is downloaded for videos, pictures and music for slides.
+        Every file is retried on its own, so a failed picture does not download the others again.
+        Returns the same keys with the paths that were written (or None).
+        """
+        written = {"mp3": None, "mp4": None, "jpegs": None}
+
+        if links["mp4"]:
+            written["mp4"] = self._with_retries(self.download_to_file, links["mp4"], filenames["mp4"], strip_chain_token=True)
+        elif links["jpegs"]:
+            metadata_images = links["jpegs"]
+            logger.info("-> is slide with {} pictures".format(len(metadata_images)))
+            written["jpegs"] = (len(metadata_images)) * [None]
+            for i in range(len(metadata_images)):
+                tt_pic_url = metadata_images[i]["imageURL"]["urlList"][0]
+                written["jpegs"][i] = self._with_retries(self.download_to_file, tt_pic_url, filenames["jpegs"][i])
+            if links["mp3"]:
+                written["mp3"] = self._with_retries(self._download_music, links, filenames["mp3"])
+
+        return written
+
+    def _with_retries(self, download, *args, **kwargs):
+        """Call download(*args, **kwargs), up to self.asset_retries more times with backoff if it fails for a transient reason."""
+        retries = 0
+        while True:
             try:
-                if links["mp3"]:
-                    audio_binary = self._scrape_audio(links["mp3"])
-                if links["mp4"]:
-                    video_binary = self._scrape_video(links["mp4"])
-                if links["jpegs"]:
-                    metadata_images = links["jpegs"]
-                    logger.info("-> is slide with {} pictures".format(len(metadata_images)))
-                    picture_content_binary = (len(metadata_images)) * [None]
-                    for i in range(len(metadata_images)):
-                        tt_pic_url = metadata_images[i]["imageURL"]["urlList"][0]
-                        # metadata_images[i].pop("imageURL")
-                        # picture_formats = metadata_images
-
-                        pic_binary = self._scrape_picture(tt_pic_url)
-                        picture_content_binary[i] = pic_binary
-                
-                return {"mp3": audio_binary,
-                        "mp4": video_binary,
-                        "jpegs": picture_content_binary}
-            except (requests.exceptions.ChunkedEncodingError, ConnectionError, requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError, ssl.SSLError, requests.exceptions.SSLError) as e:
-                logger.warning(f"{e} - retrying max. 3 times with 0.5s sleep in between")
-                time.sleep(0.1)
+                return download(*args, **kwargs)
+            except TRANSIENT_ERRORS as e:
                 retries += 1
-                continue
-        
-        raise ConnectionError
+                if retries > self.asset_retries:
+                    raise DownloadFailedError(f"{e.__class__.__name__}: {e}") from e
+                delay = backoff_delay(retries, base=0.2)
+                logger.warning(f"{e} - retry {retries} of {self.asset_retries} in {delay:.1f}s")
+                self._sleep(delay, "download")
+
+    def _download_music(self, links, filename) -> Path:
+        """Download the audio of a slide, unless the binary store already has the audio of its music id."""
+        store = self.binary_store
+        music_id = links.get("music_id")
+        if store is None or not music_id:
+            return self.download_to_file(links["mp3"], filename)
+
+        path = store.link_music(music_id, filename)
+        if path is not None:
+            return path
+
+        # another worker may be downloading the same sound right now
+        running = store.claim_music_download(music_id)
+        if running is not None:
+            running.wait(timeout=60)
+            path = store.link_music(music_id, filename)
+            if path is not None:
+                return path
+            return self.download_to_file(links["mp3"], filename)
+
+        try:
+            path, sha256 = self._download(links["mp3"], filename)
+            store.remember_music(music_id, sha256, path.suffix)
+        finally:
+            store.finish_music_download(music_id)
+        return path
+
+    def download_to_file(self, url, filename, strip_chain_token = False) -> Path:
+        """
+        Download an url in chunks of self.chunk_size bytes into a temporary file next to `filename`.
+        The temporary file is renamed to `filename` only once the download is complete,
+        or handed to the binary store, which keeps every content once and links `filename` to it.
+        """
+        return self._download(url, filename, strip_chain_token)[0]
+
+    def _download(self, url, filename, strip_chain_token = False) -> tuple:
+        """download_to_file, also returns the sha256 of the content if there is a binary store (else None)."""
+        with timed(self.metrics, "download", _file_kind(filename)):
+            return self._download_timed(url, filename, strip_chain_token)
+
+    def _download_timed(self, url, filename, strip_chain_token = False) -> tuple:
+        response = self.request_and_retain_cookies(url, retain=False, stream=True)
+
+        # permission error (videos can sometimes be fetched without the chain token)
+        if strip_chain_token and not response:
+            response.close()
+            url = url.replace("=tt_chain_token", "")
+            response = self.request_and_retain_cookies(url, retain=False, stream=True)
+
+        if response.status_code == 403:
+            response.close()
+            raise ConnectionError(f"403 for {url}")
+
+        filename = Path(filename)
+        hasher = hashlib.sha256() if self.binary_store is not None else None
+        fd, tmp_filename = tempfile.mkstemp(dir=filename.parent, prefix=f".{filename.name}.", suffix=".part")
+        size = 0
+        try:
+            with response, os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+            if self.response_cache is not None and not getattr(response, "from_cache", False):
+                self.response_cache.put_file(url, response.status_code, response.headers.get("Content-Type"), tmp_filename)
+            if hasher is not None:
+                self.binary_store.place(tmp_filename, hasher.hexdigest(), filename)
+            else:
+                os.replace(tmp_filename, filename)
+        except BaseException:
+            Path(tmp_filename).unlink(missing_ok=True)
+            raise
 
+        if self.metrics is not None:
+            self.metrics.downloaded_bytes.inc(size, kind=_file_kind(filename))
+        logger.debug(f"▼ {filename.suffix[1:].upper():<4} saved to {filename}")
+        return filename, hasher.hexdigest() if hasher is not None else None
 
     def _scrape_video(self, url):
         # edited version of pyktok.save_tiktok() (https://github.com/dfreelon/pyktok)
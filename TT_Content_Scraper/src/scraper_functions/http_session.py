@@ -0,0 +1,163 @@
+import logging
+import ssl
+import threading
+from urllib.parse import urlsplit
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger('TTCS.Session')
+
+class ConnectionStats():
+    """Thread-safe counters showing how often a request could reuse an open connection instead of a new TCP+TLS handshake."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_resumptions = 0
+        self.per_host = {}
+
+    def record_request(self, host):
+        with self._lock:
+            self.requests += 1
+            self._host(host)["requests"] += 1
+
+    def record_new_connection(self, host):
+        with self._lock:
+            self.new_connections += 1
+            self._host(host)["new_connections"] += 1
+
+    def record_tls_resumption(self, host):
+        with self._lock:
+            self.tls_resumptions += 1
+
+    def _host(self, host):
+        if host not in self.per_host:
+            self.per_host[host] = {"requests": 0, "new_connections": 0}
+        return self.per_host[host]
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": max(0, self.requests - self.new_connections),
+                "tls_resumptions": self.tls_resumptions,
+            }
+
+
+class _ResumingSSLContext(ssl.SSLContext):
+    """SSLContext that offers the last TLS session of a host again, so new connections can skip the full handshake."""
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        if session is None:
+            session = self.tls_sessions.get(server_hostname)
+        try:
+            ssl_sock = super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+        except ValueError:
+            # session does not belong to this context / host anymore
+            self.tls_sessions.pop(server_hostname, None)
+            ssl_sock = super().wrap_socket(sock, *args, server_hostname=server_hostname, **kwargs)
+
+        if ssl_sock.session_reused:
+            self.stats.record_tls_resumption(server_hostname)
+        self.remember_session(server_hostname, ssl_sock)
+        return ssl_sock
+
+    def remember_session(self, server_hostname, ssl_sock):
+        # TLS 1.3 tickets arrive after the handshake, so this is called again right before a connection is closed
+        session = getattr(ssl_sock, "session", None)
+        if session is not None:
+            self.tls_sessions[server_hostname] = session
+
+
+def _new_ssl_context(stats) -> ssl.SSLContext:
+    context = _ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_verify_locations(requests.certs.where())
+    context.tls_sessions = {}
+    context.stats = stats
+    return context
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every newly opened connection to a ConnectionStats object."""
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        self.ssl_context = _new_ssl_context(stats)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs["ssl_context"] = self.ssl_context
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self.stats),
+            "https": _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        # requests with a proxy bypass self.poolmanager, so its managers get the same context and counting pools
+        if proxy in self.proxy_manager:
+            return self.proxy_manager[proxy]
+        proxy_kwargs["ssl_context"] = self.ssl_context
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        # SOCKS managers have pool classes of their own, the counting ones are derived from whatever is there
+        manager.pool_classes_by_scheme = {
+            scheme: _counting_pool(pool_class, self.stats) for scheme, pool_class in manager.pool_classes_by_scheme.items()
+        }
+        return manager
+
+    def send(self, request, *args, **kwargs):
+        self.stats.record_request(urlsplit(request.url).hostname)
+        return super().send(request, *args, **kwargs)
+
+
+def _counting_pool(pool_class, stats):
+    # pools keep their connection objects and silently reconnect dropped ones, so count connect() calls
+    class CountingConnection(pool_class.ConnectionCls):
+        def connect(self):
+            stats.record_new_connection(self.host)
+            return super().connect()
+
+        def close(self):
+            context = getattr(self, "ssl_context", None)
+            if isinstance(context, _ResumingSSLContext) and self.sock is not None:
+                context.remember_session(self.host, self.sock)
+            return super().close()
+
+    class CountingPool(pool_class):
+        ConnectionCls = CountingConnection
+    return CountingPool
+
+
+class PooledSessions():
+    """
+    Persistent keep-alive sessions for one BaseScraper.
+
+    Pages of `page_host` (www.tiktok.com) and binaries from the CDN hosts use separate sessions, so
+    large mp4 downloads never occupy a connection that the next page request could reuse.
+    Every session keeps up to `pool_size` open connections per host. Both sessions ignore
+    cookies set by responses, BaseScraper passes its cookies explicitly with every request.
+    """
+    def __init__(self, page_host = "www.tiktok.com", pool_size = 10, cdn_hosts = 32):
+        self.page_host = page_host
+        self.stats = ConnectionStats()
+        self.page_session = self._new_session(pool_connections=1, pool_maxsize=pool_size)
+        self.cdn_session = self._new_session(pool_connections=cdn_hosts, pool_maxsize=pool_size)
+
+    def _new_session(self, pool_connections, pool_maxsize) -> requests.Session:
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = _CountingHTTPAdapter(self.stats, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session_for(self, url) -> requests.Session:
+        if urlsplit(url).hostname == self.page_host:
+            return self.page_session
+        return self.cdn_session
+
+    def close(self) -> None:
+        self.page_session.close()
+        self.cdn_session.close()
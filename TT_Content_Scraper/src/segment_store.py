@@ -0,0 +1,140 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+import logging
+from typing import Optional, Any
+
+import TT_Content_Scraper.src.logger
+logger = logging.getLogger('TTCS.SegStore')
+
+class SegmentStore:
+    """
+    Append-only store for metadata records: rolling JSONL segment files plus an SQLite index (id -> segment, offset).
+
+    Every process writes to its own segments, named {prefix}-{start time}-{pid}-{number}.jsonl,
+    so several scrapers can share the directory. With compress=True every record is its own gzip member
+    and the segments end with .jsonl.gz; they stay readable with zcat or gzip.open.
+    """
+
+    def __init__(self, directory, prefix = "segment", max_segment_bytes = 256 * 2**20, compress = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._writer_tag = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self._segment_number = 0
+        self._segment = None
+        self._segment_path = None
+
+        self.index = sqlite3.connect(self.directory / "index.db", check_same_thread=False, timeout=30)
+        self.index.execute("PRAGMA journal_mode = WAL")
+        self.index.execute("PRAGMA synchronous = NORMAL")
+        self.index.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                id TEXT PRIMARY KEY,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL
+            )
+        """)
+        self.index.commit()
+
+    def append(self, id : str, record) -> str:
+        """Append `record` and return its location "segment_path:offset" (see read_location)."""
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data, compresslevel=6)
+
+        with self._lock:
+            if self._segment is None or self._segment.tell() + len(data) > self.max_segment_bytes:
+                self._roll()
+            segment_path = self._segment_path
+            offset = self._segment.tell()
+            self._segment.write(data)
+            self._segment.flush()
+            try:
+                self.index.execute("INSERT OR REPLACE INTO records (id, segment, offset) VALUES (?, ?, ?)",
+                                   (id, segment_path.name, offset))
+                self.index.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error indexing record {id}: {e}")
+                raise
+        return f"{segment_path}:{offset}"
+
+    def get(self, id : str) -> Optional[Any]:
+        """Return the record stored under `id` (the latest one, if it was stored several times) or None."""
+        with self._lock:
+            row = self.index.execute("SELECT segment, offset FROM records WHERE id = ?", (id,)).fetchone()
+        if row is None:
+            return None
+        return read_location(f"{self.directory / row[0]}:{row[1]}")
+
+    def __contains__(self, id : str) -> bool:
+        with self._lock:
+            return self.index.execute("SELECT 1 FROM records WHERE id = ?", (id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.index.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def _roll(self):
+        if self._segment is not None:
+            self._segment.close()
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        while True:
+            self._segment_number += 1
+            path = self.directory / f"{self.prefix}-{self._writer_tag}-{self._segment_number:05d}{suffix}"
+            if not path.exists():
+                break
+        self._segment_path = path
+        self._segment = open(path, "ab")
+        logger.debug(f"Writing to new segment {path}")
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def is_segment_location(file_path) -> bool:
+    path, _, offset = str(file_path).rpartition(":")
+    return offset.isdigit() and (path.endswith(".jsonl") or path.endswith(".jsonl.gz"))
+
+def read_location(location : str):
+    """Read one record from a "segment_path:offset" location as returned by SegmentStore.append."""
+    path, _, offset = location.rpartition(":")
+    with open(path, "rb") as f:
+        f.seek(int(offset))
+        if not path.endswith(".gz"):
+            return json.loads(f.readline())
+
+        # decompress exactly one gzip member
+        decompressor = zlib.decompressobj(wbits=31)
+        data = b""
+        while not decompressor.eof:
+            chunk = f.read(64 * 1024)
+            if not chunk:
+                break
+            data += decompressor.decompress(chunk)
+        return json.loads(data)
+
+def load_metadata(file_path):
+    """Load a metadata record from the file_path the tracker stored for it, either a JSON file or a segment location."""
+    if is_segment_location(file_path):
+        return read_location(str(file_path))
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
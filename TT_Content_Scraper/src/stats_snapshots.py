@@ -0,0 +1,99 @@
+import atexit
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import logging
+
+import TT_Content_Scraper.src.logger
+logger = logging.getLogger('TTCS.Snapshots')
+
+# counters of video_metadata (see FIELD_SCHEMA) that are kept for every refresh
+SNAPSHOT_COUNTERS = ("playcount", "diggcount", "sharecount", "commentcount", "collectcount", "repostcount")
+
+class StatsSnapshotStore:
+    """
+    Time series of the counters of content IDs: one row (id, unix time, counters) per scrape, in an SQLite database.
+
+    Rows are collected in memory and written in one transaction every `flush_every` rows or
+    `flush_interval` seconds, on flush() and on close(). A row is a few dozen bytes, instead of
+    a rewrite of the whole metadata package for every refresh.
+    """
+
+    def __init__(self, db_file, flush_every = 500, flush_interval = 5.0):
+        Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._rows = []
+        self._flushed_at = time.monotonic()
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        try:
+            # the primary key is the only index, a row of the table is stored in it
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    id INTEGER NOT NULL,
+                    scraped_at INTEGER NOT NULL,
+                    {", ".join(f"{counter} INTEGER" for counter in SNAPSHOT_COUNTERS)},
+                    PRIMARY KEY (id, scraped_at)
+                ) WITHOUT ROWID
+            """)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error creating snapshot table: {e}")
+            raise
+        atexit.register(self.close)
+
+    def add(self, id, video_metadata : dict, scraped_at = None):
+        """Append the counters of a content ID (video_metadata of _filter_tiktok_data) as of now or `scraped_at` (unix time)."""
+        row = (int(id), int(scraped_at or time.time())) + tuple(video_metadata.get(counter) for counter in SNAPSHOT_COUNTERS)
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) >= self.flush_every or time.monotonic() - self._flushed_at >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._flushed_at = time.monotonic()
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        try:
+            with self.conn:
+                # a second snapshot of an ID within the same second replaces the first
+                self.conn.executemany(f"INSERT OR REPLACE INTO snapshots VALUES ({', '.join('?' * (2 + len(SNAPSHOT_COUNTERS)))})", rows)
+            logger.debug(f"Wrote {len(rows)} stats snapshots")
+        except sqlite3.Error as e:
+            self._rows = rows + self._rows
+            logger.error(f"Error writing {len(rows)} stats snapshots: {e}")
+            raise
+
+    def history(self, id) -> list:
+        """All snapshots of an ID, oldest first."""
+        self.flush()
+        columns = ("scraped_at",) + SNAPSHOT_COUNTERS
+        with self._lock:
+            rows = self.conn.execute(f"SELECT {', '.join(columns)} FROM snapshots WHERE id = ? ORDER BY scraped_at",
+                                     (int(id),)).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            if self.conn is None:
+                return
+            self._flush()
+            self.conn.close()
+            self.conn = None
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
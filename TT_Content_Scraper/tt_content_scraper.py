@@ -1,18 +1,61 @@
 import os
+import socket
 from pathlib import Path
 import time
 from datetime import timedelta
 import statistics
 from pprint import pprint
 import json
+from urllib.parse import urlsplit
+import threading
+import asyncio
+from contextlib import contextmanager, asynccontextmanager, AsyncExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 
 from .src.logger import logger
 from .src.object_tracker_db import ObjectTracker
-from .src.scraper_functions.base_scraper import BaseScraper
-
-# initialize html scraper
-base_scraper = BaseScraper()
+from .src.rate_limiter import RateLimiter, AdaptiveRateLimiter
+from .src.proxy_pool import ProxyPool
+from .src.segment_store import SegmentStore, load_metadata
+from .src.columnar_export import ColumnarSink
+from .src.binary_store import BinaryStore
+from .src.entity_store import EntityStore
+from .src.stats_snapshots import StatsSnapshotStore
+from .src.retry_policy import RetryPolicy
+from .src.response_cache import CacheMissError
+from .src.metrics import MetricsRegistry, timed
+from .src.profiler import ScrapeProfiler
+from .src.scraper_functions.base_scraper import BaseScraper, RetryLaterError
+from .src.scraper_functions.async_scraper import AsyncBaseScraper, CONNECTION_ERRORS, _in_thread
+
+
+class _AsyncScrapers():
+    """
+    The opened AsyncBaseScrapers of scrape_pending_async. Without a proxy pool all IDs share one scraper (one aiohttp session).
+    With a pool, a lease of a proxy takes a scraper that no other lease uses right now (like ProxySlot.take_scraper),
+    so IDs that run through the same proxy at the same time don't share cookies and chain tokens.
+    """
+    def __init__(self, new_scraper, stack):
+        self._new_scraper = new_scraper
+        self._stack = stack # closes every scraper at the end of the scrape
+        self._shared = None
+        self._idle = {}
+
+    async def open_shared(self) -> None:
+        self._shared = await self._stack.enter_async_context(self._new_scraper(None))
+
+    async def take(self, slot) -> AsyncBaseScraper:
+        if slot is None:
+            return self._shared
+        idle = self._idle.setdefault(slot, [])
+        if idle:
+            return idle.pop()
+        return await self._stack.enter_async_context(self._new_scraper(slot))
+
+    def put(self, slot, scraper) -> None:
+        if slot is not None:
+            self._idle[slot].append(scraper)
 
 
 class TT_Content_Scraper(ObjectTracker):
@@ -23,30 +66,127 @@ class TT_Content_Scraper(ObjectTracker):
                 clear_console = False,
                 browser_name = None,
                 proxy = None,
+                workers = 1,
+                base_url = "https://www.tiktok.com",
+                pool_size = 10,
+                chunk_size = 64 * 1024,
+                worker_id = None,
+                lease_seconds = 600,
+                buffered_tracker = False,
+                flush_every = 100,
+                flush_interval_ms = 1000,
+                metadata_sink = "files",
+                segment_max_bytes = 256 * 2**20,
+                segment_compress = False,
+                columnar_export = None,
+                dedup_files = False,
+                entity_store = False,
+                adaptive_rate = False,
+                max_rate = 10.0,
+                proxies = None,
+                proxy_concurrency = 1,
+                proxy_cooldown = 60.0,
+                retry_policy = None,
+                stats_snapshots = False,
+                response_cache = None,
+                metrics = None,
+                metrics_port = None,
+                profile = None,
+                profile_every = None,
+                profile_dir = None,
     ):
         # initialize object tracker (database of pending and finished objects (ids))
-        super().__init__(progress_file_fn)
-
-        if browser_name:
-            base_scraper.set_browser(browser_name)
-
-        if proxy:
-            base_scraper.set_proxy(proxy)
+        super().__init__(progress_file_fn, buffered=buffered_tracker, flush_every=flush_every, flush_interval_ms=flush_interval_ms)
+
+        # initialize html scraper (every worker thread gets its own, see _get_base_scraper)
+        self.browser_name = browser_name
+        self.proxy = proxy
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.chunk_size = chunk_size
+        # with dedup_files, downloads are stored once by content hash and music is only downloaded once per music id
+        self.binary_store = BinaryStore(Path(output_files_fp, "content_files")) if dedup_files else None
+        # a ResponseCache records the answers to disk or replays them without any network (see ResponseCache)
+        self.response_cache = response_cache
+        # with metrics (True or a MetricsRegistry), every stage of every ID is timed and counted, see MetricsRegistry;
+        # metrics_port also serves them on http://127.0.0.1:{metrics_port}/metrics
+        if metrics is True or (metrics is None and metrics_port is not None):
+            metrics = MetricsRegistry()
+        self.metrics = metrics or None
+        # transient failures (throttling, connection errors, failed downloads) are scheduled again with backoff
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._attempts = {}
+        # IDs of the current batch that were queued again by requeue_for_refresh
+        self._refresh = set()
+        # with adaptive_rate, every request waits for the budget of its host (pages or CDN), which speeds up
+        # while the answers are clean and slows down when TikTok throttles; wait_time is only the starting point
+        self.request_limiter = None
+        if adaptive_rate:
+            initial_rate = 1 / max(wait_time, 1 / max_rate)
+            self.request_limiter = AdaptiveRateLimiter(page_host=urlsplit(base_url).hostname, initial_rate=initial_rate, max_rate=max_rate)
+        self._base_scrapers = []
+        self.base_scraper = self._new_base_scraper()
+        self._thread_local = threading.local()
+        # with a list of proxies, every proxy gets its own scraper, rate budget and health score (see ProxyPool)
+        self.proxy_pool = None
+        if proxies:
+            self.proxy_pool = ProxyPool(proxies, new_scraper=self._new_base_scraper, wait_time=wait_time,
+                                        max_concurrency=proxy_concurrency, cooldown=proxy_cooldown,
+                                        adaptive_rate=adaptive_rate, max_rate=max_rate)
 
         # create output folder if doesnt exist
         Path(output_files_fp).mkdir(parents=True, exist_ok=True)
         self.output_files_fp = output_files_fp
 
+        # metadata goes to one JSON file per ID ("files") or is appended to rolling segment files ("segments")
+        if metadata_sink not in ("files", "segments"):
+            raise ValueError(f"Unknown metadata_sink {metadata_sink!r}, use 'files' or 'segments'")
+        self.metadata_sink = metadata_sink
+        self._segment_stores = {}
+        if metadata_sink == "segments":
+            for kind in ("content", "user"):
+                self._segment_stores[kind] = SegmentStore(Path(output_files_fp, f"{kind}_metadata"), prefix=kind,
+                                                          max_segment_bytes=segment_max_bytes, compress=segment_compress)
+
+        # optionally, the content tables are also written as Parquet files to this folder
+        self._columnar_sink = ColumnarSink(columnar_export) if columnar_export else None
+
+        # optionally, authors, music and hashtags are kept once in entities.db and content records refer to them by id
+        self.entity_store = EntityStore(Path(output_files_fp, "entities.db")) if entity_store else None
+
+        # the counters of refreshed content (and with stats_snapshots, of every scraped content) go to a time series
+        self._stats_snapshots_fn = Path(output_files_fp, "stats_snapshots.db")
+        self.stats_snapshots = StatsSnapshotStore(self._stats_snapshots_fn) if stats_snapshots else None
+
         self.WAIT_TIME = wait_time
+        self.workers = max(1, int(workers))
+        # the fixed spacing of IDs is replaced by the request budgets of the adaptive limiter, or kept per proxy
+        self.rate_limiter = RateLimiter(0 if adaptive_rate or self.proxy_pool is not None else wait_time)
+        # IDs are claimed with a lease, so several processes can share one progress database
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self._lease_renewed_at = time.monotonic()
+        self._progress_lock = threading.RLock()
         self.iter_times = []
         self.ITER_TIME = 0
         self.iterations = 0
         self.repeated_error = 0
         self.clear_console = clear_console
 
+        if self.metrics is not None:
+            self._register_gauges()
+            if metrics_port is not None:
+                self.metrics.serve(metrics_port)
+
+        # with profile, windows of that many IDs (the first one and, with profile_every, one every profile_every IDs)
+        # are profiled: stacks for a flame graph and the top allocation sites go to profile_dir (see ScrapeProfiler)
+        self.profiler = None
+        if profile:
+            self.profiler = ScrapeProfiler(profile_dir or Path(output_files_fp, "profiles"), window=profile, every=profile_every)
+
         logger.info("Scraper Initialized\n***")
         
-    def scrape_pending(self, only_content=False, only_users=False, scrape_files = False):
+    def scrape_pending(self, only_content=False, only_users=False, scrape_files = False, workers = None):
     
         if only_content:
             seed_type = "content"
@@ -54,10 +194,30 @@ class TT_Content_Scraper(ObjectTracker):
             seed_type = "user"
         else:
             seed_type = "all"
-        
+
+        workers = self.workers if workers is None else max(1, int(workers))
+        if self.profiler is not None:
+            self.profiler.maybe_start()
+        try:
+            if workers > 1:
+                return self._scrape_pending_concurrent(seed_type, scrape_files, workers)
+            return self._scrape_pending_serial(seed_type, scrape_files)
+        finally:
+            # IDs claimed but not scraped (e.g. on KeyboardInterrupt) go back to the queue right away
+            self.release_leases(self.worker_id)
+            # a window that was cut short is written anyway
+            if self.profiler is not None:
+                self.profiler.close()
+
+    def _scrape_pending_serial(self, seed_type, scrape_files):
         while True:
             #self._logging_queue_progress(type = seed_type)
-            seedlist = self.get_pending_objects(type=seed_type, limit=100)
+            seedlist = self._claim_batch(seed_type, limit=100)
+            if not seedlist:
+                wait_time = self._retry_wait(seed_type)
+                if wait_time is not None:
+                    time.sleep(wait_time)
+                    continue
             assert len(seedlist) > 0, f"No more pending objects of type {seed_type} to scrape"
             for self.iterations, seed in enumerate(seedlist.items()):
                 start = time.time()
@@ -73,85 +233,475 @@ class TT_Content_Scraper(ObjectTracker):
                 self._logging_queue_progress(type = seed_type)
 
 
-                if type == "user":
-                    self._user_action_protocol(id)
-                elif type == "content":
-                    self._content_action_protocol(id, scrape_files)
+                self._action_protocol(id, type, scrape_files)
 
                 # measure time and set wait time
                 stop = time.time()
                 self.ITER_TIME = stop - start
-                wait_time_left = max(0, self.WAIT_TIME - self.ITER_TIME)
+                wait_time_left = max(0, self.rate_limiter.min_interval - self.ITER_TIME)
                 self.ITER_TIME = self.ITER_TIME + wait_time_left
                 
                 # succesfull run
                 logger.info("Continuing with next ID...\n\n--------")
 
+                if self.metrics is not None:
+                    self.metrics.observe("sleep", wait_time_left)
                 time.sleep(wait_time_left)
                 self.repeated_error = 0
-
+                self._heartbeat()
+
+    def _scrape_pending_concurrent(self, seed_type, scrape_files, workers):
+        """
+        Scrape pending objects on a pool of worker threads.
+
+        All workers share self.rate_limiter, so IDs are started at most every WAIT_TIME seconds in total
+        (with adaptive_rate, the requests of all workers share the budgets of self.request_limiter instead).
+        A new batch is only fetched from the tracker once the previous one is finished, so no ID is handed out twice.
+        """
+        logger.info(f"Starting {workers} workers")
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="TTCS-worker")
+        try:
+            while True:
+                seedlist = self._claim_batch(seed_type, limit=max(100, workers * 4))
+                if not seedlist:
+                    wait_time = self._retry_wait(seed_type)
+                    if wait_time is not None:
+                        time.sleep(wait_time)
+                        continue
+                assert len(seedlist) > 0, f"No more pending objects of type {seed_type} to scrape"
+
+                self.iterations = 0
+                self._last_finish = time.time()
+                futures = [executor.submit(self._worker_task, id, seed["type"], scrape_files, seed_type)
+                           for id, seed in seedlist.items()]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            # drop queued IDs (e.g. on KeyboardInterrupt), but let running workers finish their ID
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _worker_task(self, id, type, scrape_files, seed_type):
+        wait_time = self.rate_limiter.acquire()
+        if self.metrics is not None:
+            self.metrics.observe("sleep", wait_time)
+
+        with self._progress_lock:
+            if self.clear_console:
+                self._clear_console()
+            logger.info(f"Scraping ID: {id}")
+            self._logging_queue_progress(type = seed_type)
+            self.iterations += 1
+
+        self._action_protocol(id, type, scrape_files)
+
+        # with several workers the time between two finished IDs is what matters for the ETA
+        with self._progress_lock:
+            stop = time.time()
+            self.ITER_TIME = stop - self._last_finish
+            self._last_finish = stop
+            self.repeated_error = 0
+            self._heartbeat()
+
+    def _claim_batch(self, seed_type, limit):
+        with timed(self.metrics, "tracker", "claim"):
+            seedlist = self.claim_pending(self.worker_id, batch=limit, lease_seconds=self.lease_seconds, type=seed_type)
+        self._lease_renewed_at = time.monotonic()
+        # failed attempts so far, for the retry policy (a batch is finished before the next one is claimed)
+        self._attempts = {id: seed["attempts"] for id, seed in seedlist.items()}
+        self._refresh = {id for id, seed in seedlist.items() if seed["refresh"]}
+        if self._refresh and self.stats_snapshots is None:
+            self.stats_snapshots = StatsSnapshotStore(self._stats_snapshots_fn)
+        return seedlist
+
+    def _retry_wait(self, seed_type):
+        """If nothing is pending but retries are scheduled, the seconds to sleep before claiming again (at most a minute), else None."""
+        due_in = self.seconds_until_next_retry(seed_type)
+        if due_in is None:
+            return None
+        logger.info(f"Nothing pending, next retry is due in {due_in:.0f} sec.")
+        wait_time = min(due_in, 60.0) + 0.1
+        if self.metrics is not None:
+            self.metrics.observe("sleep", wait_time)
+        return wait_time
+
+    def _heartbeat(self):
+        """Renew the leases of the current batch once half of the lease time has passed."""
+        if time.monotonic() - self._lease_renewed_at > self.lease_seconds / 2:
+            self.renew_leases(self.worker_id, lease_seconds=self.lease_seconds)
+            self._lease_renewed_at = time.monotonic()
+
+    def _action_protocol(self, id, type, scrape_files):
+        """
+        Scrape one ID. With a proxy pool, an ID whose proxy could not be reached is tried again through another proxy.
+        If the connection fails anyway, or a user page comes without data, the ID is scheduled for a retry.
+        """
+        start = time.perf_counter()
+        try:
+            self._scrape_id(id, type, scrape_files)
+        finally:
+            if self.metrics is not None:
+                self.metrics.id_seconds.observe(time.perf_counter() - start, type=type)
+            if self.profiler is not None:
+                self.profiler.id_finished()
+
+    def _scrape_id(self, id, type, scrape_files):
+        attempts = len(self.proxy_pool.slots) if self.proxy_pool is not None else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                with self._proxy_lease():
+                    if type == "user":
+                        self._user_action_protocol(id)
+                    elif type == "content":
+                        self._content_action_protocol(id, scrape_files)
+                return
+            except requests.RequestException as e:
+                if attempt == attempts:
+                    logger.warning(f"ID {id} could not be reached - {e.__class__.__name__}")
+                    self._register_error(id, RetryLaterError(f"{e.__class__.__name__}: {e}", error_class="connection"))
+                    return
+                logger.warning(f"ID {id} failed on its proxy ({e.__class__.__name__}), trying another one")
+            except RetryLaterError as e:
+                logger.warning(f"ID {id} did not lead to any data - {e!r}")
+                self._register_error(id, e)
+                return
+            except CacheMissError as e:
+                logger.warning(f"ID {id} can not be replayed - {e}")
+                self._register_error(id, e)
+                return
+
+    @contextmanager
+    def _proxy_lease(self):
+        """Scrape one ID through the healthiest free proxy of the pool. Does nothing without a pool."""
+        if self.proxy_pool is None:
+            yield None
+            return
+        with self.proxy_pool.lease() as slot:
+            wait_time = slot.rate_limiter.acquire()
+            if self.metrics is not None:
+                self.metrics.observe("sleep", wait_time)
+            # with proxy_concurrency above 1, leases of the same proxy must not share a scraper and its cookies
+            self._thread_local.proxy_scraper = slot.take_scraper()
+            try:
+                yield slot
+            finally:
+                slot.return_scraper(self._thread_local.proxy_scraper)
+                self._thread_local.proxy_scraper = None
+
+    @asynccontextmanager
+    async def _proxy_lease_async(self):
+        if self.proxy_pool is None:
+            yield None
+            return
+        async with self.proxy_pool.lease_async() as slot:
+            wait_time = await slot.rate_limiter.acquire_async()
+            if self.metrics is not None:
+                self.metrics.observe("sleep", wait_time)
+            yield slot
+
+    def _new_base_scraper(self, proxy = None) -> BaseScraper:
+        scraper = BaseScraper(proxy=proxy or self.proxy, base_url=self.base_url, pool_size=self.pool_size, chunk_size=self.chunk_size)
+        if self.browser_name:
+            scraper.set_browser(self.browser_name)
+        scraper.binary_store = self.binary_store
+        scraper.response_cache = self.response_cache
+        scraper.metrics = self.metrics
+        scraper.rate_limiter = self.request_limiter
+        scraper.page_retries = self.retry_policy.immediate_retries
+        self._base_scrapers.append(scraper)
+        return scraper
+
+    def _get_base_scraper(self) -> BaseScraper:
+        """Return the BaseScraper (and thereby the session and cookies) of the calling thread, or of its leased proxy."""
+        scraper = getattr(self._thread_local, "proxy_scraper", None)
+        if scraper is not None:
+            return scraper
+
+        if threading.current_thread() is threading.main_thread():
+            return self.base_scraper
+
+        scraper = getattr(self._thread_local, "base_scraper", None)
+        if scraper is None:
+            scraper = self._new_base_scraper()
+            self._thread_local.base_scraper = scraper
+        return scraper
+
+    def connection_stats(self) -> dict:
+        """Requests, new connections and reused keep-alive connections summed over the sessions of all workers."""
+        total = {}
+        for scraper in list(self._base_scrapers):
+            for key, value in scraper.connection_stats().items():
+                total[key] = total.get(key, 0) + value
+        return total
 
     def _user_action_protocol(self, id):
-        filepath = os.path.join(self.output_files_fp, "user_metadata/", f"{id}.json")
-        Path(self.output_files_fp, "user_metadata/").mkdir(parents=True, exist_ok=True)
-        user_data = base_scraper.scrape_user(id)
-        self._write_metadata_package(user_data, filepath)
-        self.mark_completed(id, filepath)
-        self.n_scraped_total += 1
+        user_data = self._get_base_scraper().scrape_user(id)
+        self._register_user(id, user_data)
 
     def _content_action_protocol(self, id, scrape_files):
-        filepath = os.path.join(self.output_files_fp, "content_metadata/", f"{id}.json")
-        Path(self.output_files_fp, "content_metadata/").mkdir(parents=True, exist_ok=True)
-
         try:
-            sorted_metadata, link_to_binaries = base_scraper.scrape_metadata(id)
+            sorted_metadata, link_to_binaries = self._get_base_scraper().scrape_metadata(id, refresh=id in self._refresh)
         except KeyError as e:
             logger.warning(f"ID {id} did not lead to any metadata - KeyError {e}")
-            self.mark_error(id, str(e))
-            self.n_errors_total += 1
-            self.n_pending -= 1
+            self._register_error(id, e)
             return None
     
-        if scrape_files:
+        # a refresh only takes a snapshot of the counters, the files were downloaded by the first scrape
+        if scrape_files and id not in self._refresh:
             """To later find all files relating to an ID search for "self.output_files_fp/content_files/tiktok_{id}*"""
             Path(self.output_files_fp, "content_files/").mkdir(parents=True, exist_ok=True)
 
             try:
-                binaries : dict = base_scraper.scrape_binaries(link_to_binaries)
+                binaries : dict = self._get_base_scraper().scrape_binaries_to_disk(link_to_binaries, self._binary_filenames(id, link_to_binaries))
             except ConnectionError as e:
                 logger.warning(f"ID {id} did not lead to any downloadable files - KeyError {e}")
-                self.mark_error(id, str(e))
-                self.n_errors_total += 1
-                self.n_pending -= 1
+                self._register_error(id, e)
                 return None
 
-            
-            # if video available
-            if binaries["mp4"]:
-                sorted_metadata["file_metadata"]["is_slide"] = False
-                self._write_video(video_content=binaries["mp4"],
-                                  filename=Path(self.output_files_fp, "content_files/", f"tiktok_video_{id}.mp4"))
-            # if slide (with music) available
-            elif binaries["jpegs"]:
-                sorted_metadata["file_metadata"]["is_slide"] = True
-                for i, jpeg in enumerate(binaries["jpegs"]):
-                    self._write_pictures(picture_content=jpeg,
-                                         filename=Path(self.output_files_fp, "content_files/", f"tiktok_picture_{id}_{str(i)}.jpeg"))
-                if binaries["mp3"]:
-                    self._write_audio(audio_content=binaries["mp3"],
-                                            filename=Path(self.output_files_fp, "content_files/", f"tiktok_audio_{id}.mp3"))
-
-        self._write_metadata_package(sorted_metadata, filepath)
-        self.mark_completed(id, filepath)
-        self.n_scraped_total += 1
-        self.n_pending -= 1
+            self._mark_slide(sorted_metadata, binaries)
+
+        self._register_content(id, sorted_metadata)
+
+    async def scrape_pending_async(self, only_content=False, only_users=False, scrape_files = False, concurrency = 100):
+        """
+        asyncio version of scrape_pending. Keeps up to `concurrency` requests in flight on the running event loop.
+
+        The wait time is still respected: IDs are started at most every WAIT_TIME seconds.
+        Run it with asyncio.run(scraper.scrape_pending_async()) or, inside Jupyter, with await scraper.scrape_pending_async().
+        """
+        if only_content:
+            seed_type = "content"
+        elif only_users:
+            seed_type = "user"
+        else:
+            seed_type = "all"
+
+        if self.profiler is not None:
+            self.profiler.maybe_start()
+        try:
+            async with AsyncExitStack() as stack:
+                scrapers = _AsyncScrapers(lambda slot: self._new_async_scraper(slot, concurrency), stack)
+                if self.proxy_pool is None:
+                    await scrapers.open_shared()
+                while True:
+                    seedlist = self._claim_batch(seed_type, limit=max(100, concurrency * 4))
+                    if not seedlist:
+                        wait_time = self._retry_wait(seed_type)
+                        if wait_time is not None:
+                            await asyncio.sleep(wait_time)
+                            continue
+                    assert len(seedlist) > 0, f"No more pending objects of type {seed_type} to scrape"
+
+                    self.iterations = 0
+                    self._last_finish = time.time()
+                    await asyncio.gather(*(self._async_task(scrapers, id, seed["type"], scrape_files, seed_type)
+                                           for id, seed in seedlist.items()))
+        finally:
+            self.release_leases(self.worker_id)
+            if self.profiler is not None:
+                self.profiler.close()
+
+    def _new_async_scraper(self, slot, concurrency) -> AsyncBaseScraper:
+        scraper = AsyncBaseScraper(proxy=slot.proxy if slot else self.proxy, base_url=self.base_url, max_concurrency=concurrency, chunk_size=self.chunk_size)
+        scraper.cookies = self.base_scraper.cookies # browser cookies, if a browser_name was given
+        scraper.binary_store = self.binary_store
+        scraper.response_cache = self.response_cache
+        scraper.metrics = self.metrics
+        scraper.rate_limiter = slot if slot else self.request_limiter
+        scraper.page_retries = self.retry_policy.immediate_retries
+        return scraper
+
+    async def _async_task(self, scrapers, id, type, scrape_files, seed_type):
+        wait_time = await self.rate_limiter.acquire_async()
+        if self.metrics is not None:
+            self.metrics.observe("sleep", wait_time)
+        start = time.perf_counter()
+
+        if self.clear_console:
+            self._clear_console()
+        logger.info(f"Scraping ID: {id}")
+        self._logging_queue_progress(type = seed_type)
+        self.iterations += 1
+
+        attempts = len(self.proxy_pool.slots) if self.proxy_pool is not None else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                async with self._proxy_lease_async() as slot:
+                    scraper = await scrapers.take(slot)
+                    try:
+                        if type == "user":
+                            await self._async_user_action_protocol(scraper, id)
+                        elif type == "content":
+                            await self._async_content_action_protocol(scraper, id, scrape_files)
+                    finally:
+                        scrapers.put(slot, scraper)
+                break
+            except CONNECTION_ERRORS as e:
+                if attempt == attempts:
+                    logger.warning(f"ID {id} could not be reached - {e.__class__.__name__}")
+                    await _in_thread(self._register_error, id, RetryLaterError(f"{e.__class__.__name__}: {e}", error_class="connection"))
+                    break
+                logger.warning(f"ID {id} failed on its proxy ({e.__class__.__name__}), trying another one")
+            except RetryLaterError as e:
+                logger.warning(f"ID {id} did not lead to any data - {e!r}")
+                await _in_thread(self._register_error, id, e)
+                break
+            except CacheMissError as e:
+                logger.warning(f"ID {id} can not be replayed - {e}")
+                await _in_thread(self._register_error, id, e)
+                break
+            except Exception as e:
+                # the other tasks of the batch go on, and the ID does not stay in progress until its lease expires
+                logger.error(f"ID {id} failed - {e!r}", exc_info=True)
+                await _in_thread(self._register_error, id, e)
+                break
+
+        if self.metrics is not None:
+            self.metrics.id_seconds.observe(time.perf_counter() - start, type=type)
+        if self.profiler is not None:
+            self.profiler.id_finished()
+        stop = time.time()
+        self.ITER_TIME = stop - self._last_finish
+        self._last_finish = stop
+        self.repeated_error = 0
+        await _in_thread(self._heartbeat)
+
+    async def _async_user_action_protocol(self, scraper, id):
+        user_data = await scraper.scrape_user(id)
+        # metadata files and the tracker are written by the default executor, not in the event loop
+        await _in_thread(self._register_user, id, user_data)
+
+    async def _async_content_action_protocol(self, scraper, id, scrape_files):
+        try:
+            sorted_metadata, link_to_binaries = await scraper.scrape_metadata(id, refresh=id in self._refresh)
+        except KeyError as e:
+            logger.warning(f"ID {id} did not lead to any metadata - KeyError {e}")
+            await _in_thread(self._register_error, id, e)
+            return None
+
+        if scrape_files and id not in self._refresh:
+            Path(self.output_files_fp, "content_files/").mkdir(parents=True, exist_ok=True)
+
+            try:
+                binaries : dict = await scraper.scrape_binaries_to_disk(link_to_binaries, self._binary_filenames(id, link_to_binaries))
+            except ConnectionError as e:
+                logger.warning(f"ID {id} did not lead to any downloadable files - KeyError {e}")
+                await _in_thread(self._register_error, id, e)
+                return None
+
+            self._mark_slide(sorted_metadata, binaries)
+
+        # metadata files and the tracker are written by the default executor, not in the event loop
+        await _in_thread(self._register_content, id, sorted_metadata)
+
+    def _binary_filenames(self, id, link_to_binaries) -> dict:
+        files_fp = Path(self.output_files_fp, "content_files/")
+        n_pictures = len(link_to_binaries["jpegs"]) if link_to_binaries["jpegs"] else 0
+        return {
+            "mp4": Path(files_fp, f"tiktok_video_{id}.mp4"),
+            "mp3": Path(files_fp, f"tiktok_audio_{id}.mp3"),
+            "jpegs": [Path(files_fp, f"tiktok_picture_{id}_{str(i)}.jpeg") for i in range(n_pictures)],
+        }
+
+    def _mark_slide(self, sorted_metadata, binaries):
+        # if video available
+        if binaries["mp4"]:
+            sorted_metadata["file_metadata"]["is_slide"] = False
+        # if slide (with music) available
+        elif binaries["jpegs"]:
+            sorted_metadata["file_metadata"]["is_slide"] = True
+
+    def _register_user(self, id, user_data):
+        filepath = self._store_metadata("user", id, user_data)
+        with timed(self.metrics, "tracker", "completed"):
+            self.mark_completed(id, filepath)
+        self._count_id("completed")
+        with self._progress_lock:
+            self.n_scraped_total += 1
+
+    def _register_content(self, id, sorted_metadata):
+        posted_at = sorted_metadata["video_metadata"].get("time_created")
+        if self.stats_snapshots is not None:
+            self.stats_snapshots.add(id, sorted_metadata["video_metadata"])
+        if id in self._refresh:
+            # the metadata package of the first scrape is kept, the counters are in the snapshot
+            with timed(self.metrics, "tracker", "refreshed"):
+                self.mark_refreshed(id, posted_at=posted_at)
+            self._count_id("refreshed")
+            with self._progress_lock:
+                self.n_scraped_total += 1
+                self.n_pending -= 1
+            return
+
+        if self._columnar_sink is not None:
+            self._columnar_sink.add(sorted_metadata)
+        if self.entity_store is not None:
+            sorted_metadata = self.entity_store.normalize(sorted_metadata)
+        filepath = self._store_metadata("content", id, sorted_metadata)
+        with timed(self.metrics, "tracker", "completed"):
+            self.mark_completed(id, filepath, posted_at=posted_at)
+        self._count_id("completed")
+        with self._progress_lock:
+            self.n_scraped_total += 1
+            self.n_pending -= 1
+
+    def _register_error(self, id, error):
+        """Schedule a retry for a transient error (RetryLaterError) while the retry policy allows it, else mark the ID as error."""
+        next_attempt_at = None
+        if isinstance(error, RetryLaterError):
+            attempts = self._attempts.get(id, 0) + 1
+            next_attempt_at = self.retry_policy.next_attempt_at(error.error_class, attempts)
+
+        if next_attempt_at is not None:
+            logger.info(f"ID {id} ({error.error_class}) is retried at {next_attempt_at:%Y-%m-%d %H:%M:%S}")
+            with timed(self.metrics, "tracker", "retry"):
+                self.mark_retry(id, str(error), next_attempt_at)
+            if self.metrics is not None:
+                self.metrics.retries.inc(scope="scheduled", error_class=error.error_class)
+            self._count_id("retry")
+            with self._progress_lock:
+                self.n_retry += 1
+                self.n_pending -= 1
+            return
+
+        with timed(self.metrics, "tracker", "error"):
+            if id in self._refresh:
+                # the content was scraped before, it stays completed and is tried again on the next refresh
+                self.mark_refreshed(id, error_message=str(error))
+            else:
+                self.mark_error(id, str(error))
+        self._count_id("error")
+        with self._progress_lock:
+            self.n_errors_total += 1
+            self.n_pending -= 1
+
+    def _count_id(self, outcome):
+        if self.metrics is not None:
+            self.metrics.ids.inc(outcome=outcome)
+
+    def _register_gauges(self):
+        """Gauges that are read from the scraper whenever the metrics are collected."""
+        def request_rates():
+            rates = dict(self.request_limiter.current_rates()) if self.request_limiter is not None else {}
+            if self.proxy_pool is not None:
+                for slot in self.proxy_pool.slots:
+                    if slot.request_limiter is not None:
+                        rates.update({f"{slot.name}/{budget}": rate for budget, rate in slot.request_limiter.current_rates().items()})
+            return rates
+        self.metrics.gauge("ttcs_request_rate", "Current requests per second of every request budget (adaptive_rate)", request_rates, label="budget")
+        self.metrics.gauge("ttcs_pending", "Pending IDs of the running scrape", lambda: getattr(self, "n_pending", None))
+        self.metrics.gauge("ttcs_retries_pending", "IDs waiting for a scheduled retry", lambda: getattr(self, "n_retry", None))
+        if self.proxy_pool is not None:
+            self.metrics.gauge("ttcs_proxies_healthy", "Proxies that are not ejected", self.proxy_pool.healthy)
+        if self.response_cache is not None:
+            self.metrics.gauge("ttcs_response_cache", "Hits, misses and stored answers of the response cache",
+                               lambda: dict(self.response_cache.stats), label="event")
 
     def _logging_queue_progress(self, type):
         if self.iterations == 0:
             stats = self.get_stats(type)
             self.n_scraped_total = stats["completed"]
             self.n_errors_total = stats["errors"]
-            self.n_pending = stats["pending"]
+            self.n_pending = stats["pending"] + stats["in_progress"]
             self.n_retry= stats["retry"]     
             self.n_total = self.n_scraped_total + self.n_errors_total + self.n_pending + self.n_retry  
     
@@ -170,9 +720,30 @@ class TT_Content_Scraper(ObjectTracker):
             logger.info(f"Scraped objects ► {(self.n_scraped_total + self.n_errors_total) :,} / {self.n_total :,}")
             logger.info(f"...minus errors ► {self.n_scraped_total :,}") #/ {(self.n_total-self.n_errors_total) :,}
 
+        if self.n_retry > 0:
+            logger.info(f"Retries pending ► {self.n_retry :,}")
+
         if self.repeated_error > 0:
             logger.info(f"Errors in a row ► {self.repeated_error}")
 
+        connections = self.connection_stats()
+        if connections.get("requests"):
+            logger.info(f"Connections ► {connections['reused_connections'] :,} of {connections['requests'] :,} requests reused an open connection")
+
+        if self.binary_store is not None and self.binary_store.stats["bytes_saved"]:
+            logger.info(f"Deduplicated ► {self.binary_store.stats['bytes_saved'] / 2**20 :,.1f} MB not stored again")
+
+        if self.response_cache is not None:
+            cache_stats = self.response_cache.stats
+            logger.info(f"Response cache ► {cache_stats['hits'] :,} hits, {cache_stats['misses'] :,} misses, {cache_stats['stored'] :,} stored")
+
+        if self.request_limiter is not None:
+            rates = ", ".join(f"{budget} {rate:.2f}/s" for budget, rate in self.request_limiter.current_rates().items())
+            logger.info(f"Request rate ► {rates}")
+
+        if self.proxy_pool is not None:
+            logger.info(f"Proxies ► {self.proxy_pool.healthy()} of {len(self.proxy_pool.slots)} healthy")
+
         logger.info("Iteration time ► " + str(round(self.ITER_TIME, 2)) + " sec.")
         logger.info("......averaged ► " +str(round(self.mean_iter_time, 2)) + " sec.")
         logger.info(f"ETA ► {self.queue_eta}\n↓↓↓")
@@ -187,22 +758,50 @@ class TT_Content_Scraper(ObjectTracker):
         os.system('clear')
             
     # output
+    def _store_metadata(self, kind, id, metadata_package) -> str:
+        """Write the metadata of a "content" or "user" ID to the metadata sink and return the file_path for the tracker."""
+        with timed(self.metrics, "write", kind):
+            return self._store_metadata_untimed(kind, id, metadata_package)
+
+    def _store_metadata_untimed(self, kind, id, metadata_package) -> str:
+        if self.metadata_sink == "segments":
+            return self._segment_stores[kind].append(id, metadata_package)
+        Path(self.output_files_fp, f"{kind}_metadata/").mkdir(parents=True, exist_ok=True)
+        filepath = os.path.join(self.output_files_fp, f"{kind}_metadata/", f"{id}.json")
+        self._write_metadata_package(metadata_package, filepath)
+        return filepath
+
+    def get_metadata(self, id):
+        """Return the stored metadata of a completed ID, from whichever sink it was written to, or None."""
+        status = self.get_object_status(id)
+        if status is None or not status["file_path"]:
+            return None
+        metadata = load_metadata(status["file_path"])
+        if self.entity_store is not None and status["type"] == "content":
+            metadata = self.entity_store.expand(metadata)
+        return metadata
+
+    def close(self):
+        for store in self._segment_stores.values():
+            store.close()
+        if self._columnar_sink is not None:
+            self._columnar_sink.close()
+        if self.binary_store is not None:
+            self.binary_store.close()
+        if self.entity_store is not None:
+            self.entity_store.close()
+        if self.stats_snapshots is not None:
+            self.stats_snapshots.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.profiler is not None:
+            self.profiler.close()
+        super().close()
+
     def _write_metadata_package(self, metadata_package, filename):
         with open(filename, "w", encoding="utf-8") as f:
             json.dump(metadata_package, f, ensure_ascii=False, indent=4)
         logger.debug(f"▼ JSON saved to {filename}")
 
-    def _write_video(self, video_content, filename,):
-        with open(filename, 'wb') as fn:
-            fn.write(video_content)
-        logger.debug(f"▼ MP4  saved to {filename}")
-
-    def _write_pictures(self, picture_content, filename):
-        with open(filename, 'wb') as f:
-            f.write(picture_content)
-        logger.debug(f"▼ JPEG saved to {filename}")
-
-    def _write_audio(self, audio_content, filename):
-        with open(filename, "wb") as f:
-            f.write(audio_content)
-        logger.debug(f"▼ MP3  saved to {filename}")
@@ -0,0 +1,125 @@
+"""
+Synthetic TikTok fixtures for the benchmarks.
+
+The item structs contain every field _filter_tiktok_data reads, and the pages wrap them in a
+__UNIVERSAL_DATA_FOR_REHYDRATION__ script tag between the usual amount of other markup, so the
+benchmarks see roughly the sizes and shapes of real pages without any network access.
+"""
+import json
+import random
+
+KINDS = ("video", "slide", "hashtags")
+
+def make_item_struct(i, kind = "video", cdn_url = "https://v16-webapp.tiktok.com", seed = 0) -> dict:
+    """Return the itemStruct of a video, a slide or a post with many hashtags."""
+    rng = random.Random(seed * 1_000_003 + i)
+    video_id = str(7_300_000_000_000_000_000 + i)
+    n_hashtags = rng.randint(20, 40) if kind == "hashtags" else rng.randint(0, 5)
+
+    text_extra = []
+    challenges = []
+    for h in range(n_hashtags):
+        hashtag_id = str(1_000_000 + rng.randint(0, 50_000))
+        text_extra.append({"awemeId": "", "end": 10 + h, "hashtagId": hashtag_id, "hashtagName": f"tag{hashtag_id}",
+                           "isCommerce": False, "start": h, "subType": 0, "type": 1})
+        challenges.append({"id": hashtag_id, "title": f"tag{hashtag_id}", "desc": f"Description of hashtag {hashtag_id} " * 3,
+                           "profileLarger": "", "profileMedium": "", "profileThumb": "", "coverLarger": "", "isCommerce": False})
+    for m in range(rng.randint(0, 3)):
+        text_extra.append({"userId": str(6_800_000_000_000_000_000 + rng.randint(0, 10**6)), "userUniqueId": f"user{m}", "type": 0})
+
+    author_id = str(6_700_000_000_000_000_000 + rng.randint(0, 5_000))
+    music_id = str(7_100_000_000_000_000_000 + rng.randint(0, 2_000))
+
+    item = {
+        "id": video_id,
+        "desc": "A synthetic post " + " ".join(f"#tag{t['hashtagId']}" for t in text_extra if "hashtagId" in t),
+        "createTime": str(1_700_000_000 + i),
+        "scheduleTime": 0,
+        "video": {
+            "id": video_id, "height": 1024, "width": 576, "duration": rng.randint(5, 180), "ratio": "540p",
+            "cover": f"{cdn_url}/cover/{video_id}.jpeg", "originCover": f"{cdn_url}/cover/{video_id}.jpeg",
+            "playAddr": "" if kind == "slide" else f"{cdn_url}/video/{video_id}.mp4",
+            "downloadAddr": "" if kind == "slide" else f"{cdn_url}/video/{video_id}.mp4",
+            "bitrate": 1_000_000, "encodedType": "normal", "format": "mp4", "videoQuality": "normal",
+            "volumeInfo": {"Loudness": -14.2, "Peak": 0.89125},
+            "claInfo": {"hasOriginalAudio": True, "enableAutoCaption": False, "noCaptionReason": 1},
+            "bitrateInfo": [{"Bitrate": 1_000_000 + b, "QualityType": b, "GearName": f"gear_{b}",
+                             "PlayAddr": {"UrlList": [f"{cdn_url}/video/{video_id}_{b}.mp4"] * 3}} for b in range(4)],
+        },
+        "author": {
+            "id": author_id, "uniqueId": f"creator{author_id[-4:]}", "nickname": f"Creator {author_id[-4:]}",
+            "avatarThumb": f"{cdn_url}/avatar/{author_id}.jpeg", "signature": "Synthetic creator bio",
+            "createTime": 1_500_000_000, "verified": False, "secUid": "MS4wLjABAAAA" + author_id, "ftc": False,
+            "relation": 0, "openFavorite": False, "commentSetting": 0, "duetSetting": 0, "stitchSetting": 0,
+            "privateAccount": False, "secret": False, "isADVirtual": False, "downloadSetting": 0,
+            "recommendReason": "", "suggestAccountBind": False,
+        },
+        "music": {
+            "id": music_id, "title": f"original sound - {music_id[-4:]}", "playUrl": f"{cdn_url}/music/{music_id}.mp3",
+            "coverLarge": f"{cdn_url}/music/{music_id}.jpeg", "authorName": f"Artist {music_id[-4:]}",
+            "original": rng.random() < 0.5, "duration": 30, "scheduleSearchTime": 0, "collected": False,
+            "preciseDuration": {"preciseDuration": 30.1, "preciseShootDuration": 30.1, "preciseAuditionDuration": 30.1, "preciseVideoDuration": 30.1},
+        },
+        "challenges": challenges,
+        "stats": {"diggCount": rng.randint(0, 10**6), "shareCount": rng.randint(0, 10**4), "commentCount": rng.randint(0, 10**4),
+                  "playCount": rng.randint(0, 10**7), "collectCount": rng.randint(0, 10**4)},
+        "statsV2": {"diggCount": "1200", "shareCount": "30", "commentCount": "12", "playCount": "45000",
+                    "collectCount": "7", "repostCount": "0"},
+        "warnInfo": [],
+        "originalItem": False, "officalItem": False, "textExtra": text_extra, "secret": False, "forFriend": False,
+        "digged": False, "itemCommentStatus": 0, "takeDown": 0, "effectStickers": [], "privateItem": False,
+        "duetEnabled": True, "stitchEnabled": True, "stickersOnItem": [], "shareEnabled": True, "comments": [],
+        "duetDisplay": 0, "stitchDisplay": 0, "indexEnabled": True,
+        "diversificationLabels": ["Lifestyle", "Entertainment"], "locationCreated": "DE",
+        "suggestedWords": [f"word {w}" for w in range(rng.randint(0, 6))],
+        "contents": [{"desc": "A synthetic post", "textExtra": text_extra}],
+        "channelTags": [], "keywordTags": [], "IsAigc": False, "aigcLabelType": 0, "AIGCDescription": "",
+        "isAd": False,
+    }
+
+    if kind == "slide":
+        item["imagePost"] = {
+            "images": [{"imageURL": {"urlList": [f"{cdn_url}/image/{video_id}_{p}.jpeg"] * 3}, "imageWidth": 1080, "imageHeight": 1440}
+                       for p in range(rng.randint(2, 12))],
+            "cover": {"imageURL": {"urlList": [f"{cdn_url}/image/{video_id}_cover.jpeg"]}},
+            "title": "",
+        }
+    return item
+
+def make_corpus(n, cdn_url = "https://v16-webapp.tiktok.com", seed = 0) -> list:
+    """n item structs, cycling through videos, slides and heavy-hashtag posts."""
+    return [make_item_struct(i, KINDS[i % len(KINDS)], cdn_url=cdn_url, seed=seed) for i in range(n)]
+
+def make_rehydration_data(scope_key, scope_value) -> dict:
+    """Wrap one scope the way TikTok does, next to the other (unused) scopes of a real page."""
+    return {
+        "__DEFAULT_SCOPE__": {
+            "webapp.app-context": {"language": "en", "region": "DE", "appId": 1988, "user": {},
+                                   "abTestVersion": {"versionName": ",".join(str(v) for v in range(70_000, 70_400))}},
+            "webapp.biz-context": {"features": {f"feature_{f}": f % 2 == 0 for f in range(300)}},
+            "seo.abtest": {"canonical": "https://www.tiktok.com/", "pageId": "1", "vidList": [str(v) for v in range(50)]},
+            "webapp.i18n-translation": {f"key_{k}": f"Translated text number {k}" for k in range(800)},
+            scope_key: scope_value,
+        }
+    }
+
+def make_video_page(item) -> bytes:
+    data = make_rehydration_data("webapp.video-detail", {"itemInfo": {"itemStruct": item}, "statusCode": 0, "statusMsg": ""})
+    return _wrap_page(data)
+
+def make_user_page(username) -> bytes:
+    user_info = {"user": {"id": "6700000000000000000", "uniqueId": username, "nickname": username.title(),
+                          "signature": "Synthetic profile", "verified": False, "privateAccount": False},
+                 "stats": {"followerCount": 1234, "followingCount": 56, "heart": 7890, "videoCount": 42}}
+    data = make_rehydration_data("webapp.user-detail", {"userInfo": user_info, "statusCode": 0})
+    return _wrap_page(data)
+
+def _wrap_page(rehydration_data) -> bytes:
+    head_scripts = "".join(f'<script src="https://sf16-website.tiktokcdn.com/obj/chunk-{c}.js" defer></script>'
+                           f'<link rel="preload" href="https://sf16-website.tiktokcdn.com/obj/chunk-{c}.css" as="style">' for c in range(60))
+    inline_script = "<script>window.__INIT__ = {" + ",".join(f'"k{k}": {k}' for k in range(500)) + "};</script>"
+    body = "".join(f'<div class="css-{d}-DivContainer e1a{d}"><span class="css-{d}-Span">Item {d}</span></div>' for d in range(1500))
+    return ("<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\"><title>TikTok</title>"
+            + head_scripts + inline_script
+            + '<script id="__UNIVERSAL_DATA_FOR_REHYDRATION__" type="application/json">' + json.dumps(rehydration_data) + "</script>"
+            + "</head><body>" + body + "</body></html>").encode("utf-8")
@@ -0,0 +1,113 @@
+"""
+A local stand-in for tiktok.com and its CDN, for the end-to-end benchmarks.
+
+Video pages (/@tiktok/video/{id}) and user pages (/@{user}) are synthetic pages from _fixtures.py whose
+file links point back to the server (/cdn/video/*.mp4, /cdn/music/*.mp3, /cdn/image/*.jpeg). Every answer
+is delayed by `latency` (+ up to `jitter`) seconds, and a share `error_rate` of the page requests fails:
+with status 429 or 500, or like a throttled TikTok with a page without rehydration data ("empty").
+"""
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from benchmarks._fixtures import make_corpus, make_video_page, make_user_page
+
+VIDEO_PATH = re.compile(r"^/@[^/]+/video/(\d+)")
+ERROR_KINDS = ("429", "500", "empty")
+
+class StandInServer:
+    def __init__(self, latency = 0.0, jitter = 0.0, error_rate = 0.0, error_kind = "429", payload_bytes = 256 * 1024,
+                 n_templates = 30, seed = 0):
+        if error_kind not in ERROR_KINDS:
+            raise ValueError(f"Unknown error kind {error_kind!r}, use one of {ERROR_KINDS}")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.payload = bytes(payload_bytes)
+        self.n_templates = n_templates
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"pages": 0, "files": 0, "errors": 0, "bytes": 0}
+        self._server = None
+        self._video_pages = []
+        self._user_page = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> str:
+        """Start serving on a free port in a background thread and return the base url."""
+        server = self
+        class Handler(_Handler):
+            stand_in = server
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        # the pages link to the files of this server, so they are rendered once the port is known
+        corpus = make_corpus(self.n_templates, cdn_url=f"{self.base_url}/cdn", seed=self.seed)
+        self._video_pages = [make_video_page(item) for item in corpus]
+        self._user_page = make_user_page("tiktok")
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _answer(self, path) -> tuple:
+        """(status, content type, body) of a request."""
+        with self._lock:
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            failed = not path.startswith("/cdn/") and self._rng.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+
+        if path.startswith("/cdn/"):
+            kind = "files"
+            content_type = {"mp4": "video/mp4", "mp3": "audio/mpeg"}.get(path.rsplit(".", 1)[-1], "image/jpeg")
+            answer = (200, content_type, self.payload)
+        elif failed:
+            kind = "errors"
+            if self.error_kind == "empty":
+                answer = (200, "text/html", b"<html><head><title>TikTok</title></head><body></body></html>")
+            else:
+                answer = (int(self.error_kind), "text/html", b"Too many requests")
+        else:
+            kind = "pages"
+            match = VIDEO_PATH.match(path)
+            page = self._video_pages[int(match.group(1)) % len(self._video_pages)] if match else self._user_page
+            answer = (200, "text/html; charset=utf-8", page)
+
+        with self._lock:
+            self.stats[kind] += 1
+            self.stats["bytes"] += len(answer[2])
+        return answer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real servers
+    stand_in = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        status, content_type, body = self.stand_in._answer(self.path)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,134 @@
+"""
+End-to-end throughput of TT_Content_Scraper.scrape_pending against a local stand-in for TikTok (see _server.py):
+IDs/sec, p50 and p99 time per ID, peak RSS of the scraper and size of the progress database.
+
+The scraper runs in a fresh process (so the peak RSS is its own), the server in this one. Nothing leaves
+localhost, so the numbers can be compared across releases, e.g. with --json results.jsonl on every release.
+
+    python -m benchmarks.bench_end_to_end
+    python -m benchmarks.bench_end_to_end -n 2000 --workers 8 --latency 0.05 --error-rate 0.02 --scrape-files
+    python -m benchmarks.bench_end_to_end --async --concurrency 50 --payload-kb 1024 --scrape-files
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import TT_Content_Scraper
+from TT_Content_Scraper import TT_Content_Scraper as Scraper, RetryPolicy
+from TT_Content_Scraper.src.retry_policy import DEFAULT_BASE_DELAYS
+from benchmarks._server import StandInServer, ERROR_KINDS
+
+class TimedScraper(Scraper):
+    """Records the time from the start to the end of every ID."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.id_times = []
+
+    def _action_protocol(self, id, type, scrape_files):
+        start = time.perf_counter()
+        super()._action_protocol(id, type, scrape_files)
+        self.id_times.append(time.perf_counter() - start)
+
+    async def _async_task(self, *args, **kwargs):
+        start = time.perf_counter()
+        await super()._async_task(*args, **kwargs)
+        self.id_times.append(time.perf_counter() - start)
+
+def _folder_size(path) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+def _child(base_url, args, tmp, queue):
+    # the progress log of every ID would measure the terminal
+    logging.getLogger("TTCS").setLevel(logging.WARNING)
+    db_file = os.path.join(tmp, "progress.db")
+    # retries are due almost right away, a benchmark should not wait minutes for them
+    policy = RetryPolicy(max_attempts=args.max_attempts, base_delays={error_class: 0.05 for error_class in DEFAULT_BASE_DELAYS}, max_delay=0.5)
+    scraper = TimedScraper(wait_time=0.0, output_files_fp=os.path.join(tmp, "data"), progress_file_fn=db_file,
+                           base_url=base_url, workers=args.workers, buffered_tracker=args.buffered_tracker,
+                           metadata_sink=args.metadata_sink, retry_policy=policy)
+    n_users = int(args.n * args.users)
+    scraper.add_objects([str(7_300_000_000_000_000_000 + i) for i in range(args.n - n_users)], type="content")
+    scraper.add_objects([f"user{i}" for i in range(n_users)], type="user")
+
+    start = time.perf_counter()
+    try:
+        if args.use_async:
+            asyncio.run(scraper.scrape_pending_async(scrape_files=args.scrape_files, concurrency=args.concurrency))
+        else:
+            scraper.scrape_pending(scrape_files=args.scrape_files)
+    except AssertionError:
+        pass # nothing pending anymore
+    elapsed = time.perf_counter() - start
+    stats = scraper.get_stats()
+    scraper.close()
+
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    db_size = sum(os.path.getsize(db_file + suffix) for suffix in ("", "-wal") if os.path.exists(db_file + suffix))
+    queue.put({"elapsed": elapsed, "id_times": scraper.id_times, "stats": stats, "peak_rss": peak,
+               "db_size": db_size, "output_size": _folder_size(os.path.join(tmp, "data"))})
+
+def run(args) -> dict:
+    server = StandInServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, error_kind=args.error_kind,
+                           payload_bytes=int(args.payload_kb * 1024), seed=args.seed)
+    with server, tempfile.TemporaryDirectory() as tmp:
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        process = context.Process(target=_child, args=(server.base_url, args, tmp, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        result["server"] = dict(server.stats)
+
+    times = sorted(result.pop("id_times"))
+    quantiles = statistics.quantiles(times, n=100) if len(times) > 1 else times * 99
+    done = result["stats"]["completed"] + result["stats"]["errors"]
+    result.update(ids_per_sec=done / result["elapsed"], p50=quantiles[49], p99=quantiles[98], ids=done)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=500, help="Number of IDs (default: 500)")
+    parser.add_argument("--users", type=float, default=0.1, help="Share of user IDs among them (default: 0.1)")
+    parser.add_argument("--workers", type=int, default=4, help="Worker threads of scrape_pending (default: 4)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run scrape_pending_async instead")
+    parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight with --async (default: 50)")
+    parser.add_argument("--scrape-files", action="store_true", help="Also download the videos, pictures and music")
+    parser.add_argument("--buffered-tracker", action="store_true", help="Write the progress database in batches")
+    parser.add_argument("--metadata-sink", choices=["files", "segments"], default="files", help="Metadata sink (default: files)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per ID of the retry policy (default: 3)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Delay of every answer in seconds (default: 0.02)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Random extra delay of up to this many seconds (default: 0.01)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of page requests that fail (default: 0)")
+    parser.add_argument("--error-kind", choices=ERROR_KINDS, default="429", help="How they fail (default: 429)")
+    parser.add_argument("--payload-kb", type=float, default=256, help="Size of every file on the CDN in KiB (default: 256)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fixtures and of the errors (default: 0)")
+    parser.add_argument("--json", metavar="FILE", help="Append the result with the configuration as one JSON line to FILE")
+    args = parser.parse_args()
+
+    result = run(args)
+    stats = result["stats"]
+    mode = f"async, concurrency {args.concurrency}" if args.use_async else f"{args.workers} workers"
+    print(f"{result['ids']:,} IDs ({mode}) in {result['elapsed']:.2f} sec. - {stats['completed']:,} completed, {stats['errors']:,} errors")
+    print(f"throughput : {result['ids_per_sec']:10,.1f} IDs/sec")
+    print(f"per ID     : p50 {result['p50'] * 1000:8.1f} ms   p99 {result['p99'] * 1000:8.1f} ms")
+    print(f"peak RSS   : {result['peak_rss'] / 2**20:10.1f} MiB")
+    print(f"progress db: {result['db_size'] / 2**20:10.2f} MiB   output {result['output_size'] / 2**20:.1f} MiB")
+    print(f"server     : {result['server']['pages']:,} pages, {result['server']['files']:,} files, {result['server']['errors']:,} errors")
+
+    if args.json:
+        record = {"version": TT_Content_Scraper.__version__, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), **result}
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+if __name__ == "__main__":
+    main()
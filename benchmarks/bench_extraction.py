@@ -0,0 +1,54 @@
+"""
+Compare the byte scanning rehydration extractor with the BeautifulSoup parser.
+
+    python -m benchmarks.bench_extraction
+    python -m benchmarks.bench_extraction --pages saved_pages/   # *.html pages saved from tiktok.com
+"""
+import argparse
+import time
+from pathlib import Path
+
+from TT_Content_Scraper.src.scraper_functions._extract_rehydration_data import _extract_rehydration_data, _soup_rehydration_data
+from benchmarks._fixtures import make_corpus, make_video_page, make_user_page
+
+def load_pages(pages_dir, n) -> list:
+    if pages_dir:
+        return [p.read_bytes() for p in sorted(Path(pages_dir).glob("*.html"))]
+    pages = [make_video_page(item) for item in make_corpus(n)]
+    pages.append(make_user_page("tiktok"))
+    return pages
+
+def time_per_page(function, pages, repeat) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            function(page)
+        best = min(best, time.perf_counter() - start)
+    return best / len(pages)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", help="Directory with saved *.html pages (default: synthetic pages)")
+    parser.add_argument("-n", type=int, default=30, help="Number of synthetic pages (default: 30)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the best one is reported (default: 5)")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.n)
+    if not pages:
+        raise SystemExit(f"No *.html pages found in {args.pages}")
+
+    # both extractors have to return the same payload
+    for page in pages:
+        assert _extract_rehydration_data(page) == _soup_rehydration_data(page), "extractors disagree"
+
+    mean_size = sum(len(p) for p in pages) / len(pages)
+    soup = time_per_page(_soup_rehydration_data, pages, args.repeat)
+    scan = time_per_page(_extract_rehydration_data, pages, args.repeat)
+
+    print(f"{len(pages)} pages, {mean_size / 1024:.0f} KiB on average")
+    print(f"BeautifulSoup : {soup * 1e3:8.3f} ms/page")
+    print(f"byte scan     : {scan * 1e3:8.3f} ms/page  ({soup / scan:.0f}x faster)")
+
+if __name__ == "__main__":
+    main()
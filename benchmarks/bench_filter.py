@@ -0,0 +1,67 @@
+"""
+Benchmark the per-item hot path _filter_tiktok_data (and _prep_hashtags_and_mentions) against the
+former hand-written implementation, and check that both produce identical output.
+
+    python -m benchmarks.bench_filter
+"""
+import argparse
+import copy
+import time
+
+from TT_Content_Scraper.src.scraper_functions._filter_tiktok_data import _filter_tiktok_data, _prep_hashtags_and_mentions
+from benchmarks import _legacy_filter
+from benchmarks._fixtures import make_corpus
+
+def variants(item) -> list:
+    """The item itself plus copies that hit the special cases of the coercions."""
+    result = [item]
+    edited = copy.deepcopy(item)
+    edited.pop("statsV2")
+    edited["locationCreated"] = "FAKE-AD"
+    edited["warnInfo"] = {}
+    edited["channelTags"] = {}
+    edited["AIGCDescription"] = "AI generated"
+    edited["effectStickers"] = [{"name": "sticker"}]
+    edited["video"]["ratio"] = ""
+    result.append(edited)
+    edited = copy.deepcopy(item)
+    edited["locationCreated"] = "Germany"
+    edited["suggestedWords"] = []
+    edited.pop("music")
+    edited.pop("author")
+    edited["textExtra"] = [{"hashtagName": "unknown", "hashtagId": "1"}, {"hashtagName": "no id"}]
+    edited["challenges"] = [{"id": "x", "desc": "no numeric id"}, {"id": "1", "desc": "first"}, {"id": "01", "desc": "second"}]
+    result.append(edited)
+    return result
+
+def time_per_item(function, corpus, repeat) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in corpus:
+            function(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=3000, help="Number of item structs (default: 3000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the best one is reported (default: 5)")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.n)
+    for item in corpus[:30]:
+        for variant in variants(item):
+            assert _filter_tiktok_data(variant) == _legacy_filter._filter_tiktok_data(variant), "output differs from the hand-written filter"
+    for item in corpus:
+        assert _filter_tiktok_data(item) == _legacy_filter._filter_tiktok_data(item), "output differs from the hand-written filter"
+
+    print(f"{len(corpus)} item structs (videos, slides, heavy-hashtag posts), parity ok")
+    for name, new, old in [("_filter_tiktok_data", _filter_tiktok_data, _legacy_filter._filter_tiktok_data),
+                           ("_prep_hashtags_and_mentions", _prep_hashtags_and_mentions, _legacy_filter._prep_hashtags_and_mentions)]:
+        new_time = time_per_item(new, corpus, args.repeat)
+        old_time = time_per_item(old, corpus, args.repeat)
+        print(f"{name:<28}: {new_time * 1e6:7.1f} us/item  (hand-written: {old_time * 1e6:7.1f} us/item, {old_time / new_time:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measure the throughput and peak memory of adding a seed file to the progress database:
+the streaming ingest (open_id_source + iter_ids + add_objects_stream) vs. reading the whole file
+into a list for add_objects. Every run happens in a fresh process, so the peak RSS is its own.
+
+    python -m benchmarks.bench_ingest
+    python -m benchmarks.bench_ingest -n 5000000 --compression zstd
+"""
+import argparse
+import gzip
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from TT_Content_Scraper.src.ingest import open_id_source, iter_ids
+from TT_Content_Scraper.src.object_tracker_db import ObjectTracker
+
+def write_seed_file(path, n, compression):
+    opener = {"none": open, "gzip": gzip.open}.get(compression)
+    if compression == "zstd":
+        if zstandard is None:
+            raise SystemExit("--compression zstd requires the zstandard package")
+        raw = open(path, "wb")
+        f = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        write = lambda text: f.write(text.encode())
+    else:
+        f = opener(path, "wt")
+        write = f.write
+    with f:
+        for start in range(0, n, 100_000):
+            write("".join(f"{7_300_000_000_000_000_000 + i}\n" for i in range(start, min(n, start + 100_000))))
+
+def run_streaming(seed_file, db_file, chunk_size):
+    tracker = ObjectTracker(db_file)
+    with open_id_source(seed_file) as source:
+        added = tracker.add_objects_stream(iter_ids(source), type="content", chunk_size=chunk_size)
+    tracker.close()
+    return added
+
+def run_list(seed_file, db_file, chunk_size):
+    # what `tt-scraper add` did before: every ID in one list, one transaction
+    with open_id_source(seed_file) as source:
+        ids = [line.strip() for line in source if line.strip()]
+    tracker = ObjectTracker(db_file)
+    tracker.add_objects(ids, type="content")
+    tracker.close()
+    return len(ids)
+
+def _child(mode, seed_file, db_file, chunk_size, queue):
+    start = time.perf_counter()
+    added = {"streaming": run_streaming, "list": run_list}[mode](seed_file, db_file, chunk_size)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    queue.put((added, elapsed, peak))
+
+def measure(mode, seed_file, db_file, chunk_size):
+    queue = multiprocessing.get_context("spawn").Queue()
+    process = multiprocessing.get_context("spawn").Process(target=_child, args=(mode, seed_file, db_file, chunk_size, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=1_000_000, help="Number of IDs in the seed file (default: 1000000)")
+    parser.add_argument("--compression", choices=["none", "gzip", "zstd"], default="gzip", help="Seed file compression (default: gzip)")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="IDs per transaction of the streaming ingest (default: 50000)")
+    parser.add_argument("--skip-list", action="store_true", help="Only run the streaming ingest, e.g. for files that do not fit in memory")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_file = os.path.join(tmp, "seeds.txt")
+        write_seed_file(seed_file, args.n, args.compression)
+        print(f"{args.n:,} IDs, {args.compression} compressed, {os.path.getsize(seed_file) / 2**20:.1f} MiB")
+
+        modes = ["streaming"] if args.skip_list else ["streaming", "list"]
+        for mode in modes:
+            db_file = os.path.join(tmp, f"{mode}.db")
+            added, elapsed, peak = measure(mode, seed_file, db_file, args.chunk_size)
+            assert added == args.n, f"{mode} added {added} of {args.n} IDs"
+            print(f"{mode:9} : {args.n / elapsed:12,.0f} rows/sec  {elapsed:7.2f} sec  peak RSS {peak / 2**20:7.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Decode the rehydration payload with every available JSON backend, eager and lazy, and check the
+result against json.loads from the standard library.
+
+    python -m benchmarks.bench_json_decoding
+"""
+import argparse
+import json
+import time
+
+from TT_Content_Scraper.src.scraper_functions import _decode_rehydration_data as decoding
+from TT_Content_Scraper.src.scraper_functions._extract_rehydration_data import _extract_rehydration_data
+from benchmarks._fixtures import make_corpus, make_video_page, make_user_page
+
+VIDEO_PATH = ("__DEFAULT_SCOPE__", "webapp.video-detail", "itemInfo", "itemStruct")
+USER_PATH = ("__DEFAULT_SCOPE__", "webapp.user-detail", "userInfo")
+
+def reference(payload, path):
+    data = json.loads(payload)
+    for key in path:
+        data = data[key]
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=30, help="Number of synthetic pages (default: 30)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the best one is reported (default: 5)")
+    args = parser.parse_args()
+
+    payloads = [(_extract_rehydration_data(make_video_page(item)), VIDEO_PATH) for item in make_corpus(args.n)]
+    payloads.append((_extract_rehydration_data(make_user_page("tiktok")), USER_PATH))
+    expected = [reference(payload, path) for payload, path in payloads]
+    previous = decoding.get_json_backend()
+
+    print(f"{len(payloads)} payloads, {sum(len(p) for p, _ in payloads) / len(payloads) / 1024:.0f} KiB on average")
+    try:
+        for backend in decoding.BACKENDS:
+            for lazy in (False, True):
+                decoding.set_json_backend(backend, lazy=lazy)
+
+                # parity with the standard library
+                for (payload, path), reference_value in zip(payloads, expected):
+                    assert decoding._decode_rehydration_path(payload, path) == reference_value, f"{backend} (lazy={lazy}) differs from json"
+
+                best = float("inf")
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    for payload, path in payloads:
+                        decoding._decode_rehydration_path(payload, path)
+                    best = min(best, time.perf_counter() - start)
+                print(f"{backend:<7} lazy={str(lazy):<5}: {best / len(payloads) * 1e6:8.1f} us/payload  (parity ok)")
+    finally:
+        decoding.set_json_backend(previous["backend"], lazy=previous["lazy"])
+
+if __name__ == "__main__":
+    main()
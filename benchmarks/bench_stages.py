@@ -0,0 +1,189 @@
+"""
+Microbenchmarks of the CPU stages of one ID, each on its own: extracting the rehydration script from the page,
+decoding it (json.loads, and the configured backend as the scraper does it), _filter_tiktok_data,
+_prep_hashtags_and_mentions and writing the metadata package (_write_metadata_package, to os.devnull).
+
+Every stage runs over a synthetic corpus of videos, slides and heavy-hashtag posts. ns/op is the best of
+--repeat passes with the garbage collector off, alloc B/op the peak memory tracemalloc sees during one op,
+averaged over the corpus. Every pass is framed by passes of a fixed pure Python workload, and "rel" is the
+time of an op in units of that workload: it stays put when the whole machine is busier or slower, so --check
+compares it instead of ns/op (unless --absolute). Save a baseline on a machine and check later runs against it:
+
+    python -m benchmarks.bench_stages
+    python -m benchmarks.bench_stages --save-baseline
+    python -m benchmarks.bench_stages --check --threshold 0.15   # exits with 1 if a stage got slower
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from TT_Content_Scraper.tt_content_scraper import TT_Content_Scraper
+from TT_Content_Scraper.src.scraper_functions import _decode_rehydration_data as decoding
+from TT_Content_Scraper.src.scraper_functions._extract_rehydration_data import _extract_rehydration_data
+from TT_Content_Scraper.src.scraper_functions._filter_tiktok_data import _filter_tiktok_data, _prep_hashtags_and_mentions
+from benchmarks._fixtures import make_corpus, make_video_page
+
+VIDEO_PATH = ("__DEFAULT_SCOPE__", "webapp.video-detail", "itemInfo", "itemStruct")
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "stages.json"
+
+def build_stages(n) -> dict:
+    """stage name -> (function of one input, inputs)"""
+    items = make_corpus(n)
+    pages = [make_video_page(item) for item in items]
+    payloads = [_extract_rehydration_data(page) for page in pages]
+    packages = [_filter_tiktok_data(item) for item in items]
+    return {
+        "extract": (_extract_rehydration_data, pages),
+        "json_loads": (json.loads, payloads),
+        "decode_path": (lambda payload: decoding._decode_rehydration_path(payload, VIDEO_PATH), payloads),
+        "filter": (_filter_tiktok_data, items),
+        "hashtags": (_prep_hashtags_and_mentions, items),
+        # the method does not use self
+        "write_json": (lambda package: TT_Content_Scraper._write_metadata_package(None, package, os.devnull), packages),
+    }
+
+def _reference_work(n = 200):
+    """Fixed workload of dict, str and int operations that the stages are measured against."""
+    counts = {}
+    for i in range(n):
+        key = f"key{i % 37}"
+        counts[key] = counts.get(key, 0) + i
+    return sum(value for key, value in counts.items() if key.endswith("1"))
+
+def _pass(function, inputs, loops) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        for value in inputs:
+            function(value)
+    return time.perf_counter() - start
+
+def _calibrate(function, inputs, min_pass_time) -> int:
+    loops = 1
+    while _pass(function, inputs, loops) < min_pass_time:
+        loops *= 2
+    return loops
+
+def time_per_op(function, inputs, repeat, min_pass_time = 0.1) -> tuple:
+    """
+    Best time per op in ns over `repeat` passes that each take at least `min_pass_time` seconds,
+    and the best ratio of an op to an op of _reference_work, measured right before and after each pass.
+    """
+    reference_inputs = [200]
+    loops = _calibrate(function, inputs, min_pass_time)
+    reference_loops = _calibrate(_reference_work, reference_inputs, min_pass_time / 4)
+
+    best, best_relative = float("inf"), float("inf")
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            before = _pass(_reference_work, reference_inputs, reference_loops)
+            elapsed = _pass(function, inputs, loops) / (loops * len(inputs))
+            after = _pass(_reference_work, reference_inputs, reference_loops)
+            best = min(best, elapsed)
+            best_relative = min(best_relative, elapsed / (min(before, after) / reference_loops))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best * 1e9, best_relative
+
+def alloc_per_op(function, inputs) -> float:
+    """Average peak of traced memory during one op, in bytes."""
+    tracemalloc.start()
+    try:
+        total = 0
+        for value in inputs:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            result = function(value)
+            total += tracemalloc.get_traced_memory()[1] - before
+            del result
+    finally:
+        tracemalloc.stop()
+    return total / len(inputs)
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system(),
+            "json_backend": decoding.get_json_backend()}
+
+def check(results, baseline, threshold, alloc_threshold, absolute = False) -> list:
+    """Stages that are more than `threshold` slower (or allocate `alloc_threshold` more) than the baseline."""
+    failed = []
+    for stage, result in results.items():
+        reference = baseline["stages"].get(stage)
+        if reference is None:
+            continue
+        time_key = "ns_per_op" if absolute else "relative"
+        if result[time_key] > reference[time_key] * (1 + threshold):
+            failed.append(f"{stage}: {result[time_key]:,.2f} {time_key}, baseline {reference[time_key]:,.2f}")
+        if result["alloc_bytes_per_op"] > reference["alloc_bytes_per_op"] * (1 + alloc_threshold):
+            failed.append(f"{stage}: {result['alloc_bytes_per_op']:,.0f} B/op allocated, baseline {reference['alloc_bytes_per_op']:,.0f} B/op")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=60, help="Number of synthetic posts (default: 60)")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed passes per stage, the best one is reported (default: 7)")
+    parser.add_argument("--stages", nargs="+", help="Only run these stages")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline file (default: benchmarks/baselines/stages.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="Compare with the baseline and exit with 1 if a stage regressed")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown per stage for --check (default: 0.2 = 20%%)")
+    parser.add_argument("--absolute", action="store_true", help="Check ns/op instead of the time relative to the reference workload")
+    parser.add_argument("--alloc-threshold", type=float, default=0.1, help="Allowed growth of alloc B/op for --check (default: 0.1)")
+    args = parser.parse_args()
+
+    stages = build_stages(args.n)
+    unknown = set(args.stages or []) - set(stages)
+    if unknown:
+        raise SystemExit(f"Unknown stages {', '.join(sorted(unknown))}, available: {', '.join(stages)}")
+
+    baseline = None
+    if args.check:
+        if not os.path.exists(args.baseline):
+            raise SystemExit(f"No baseline in {args.baseline}, run with --save-baseline first")
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["environment"] != environment() or baseline["n"] != args.n:
+            print(f"Warning: the baseline was measured with {baseline['environment']} and -n {baseline['n']}")
+
+    print(f"{args.n} posts (videos, slides, heavy-hashtag posts), JSON backend {decoding.get_json_backend()['backend']}")
+    results = {}
+    for stage, (function, inputs) in stages.items():
+        if args.stages and stage not in args.stages:
+            continue
+        ns_per_op, relative = time_per_op(function, inputs, args.repeat)
+        result = results[stage] = {"ns_per_op": ns_per_op, "relative": relative, "alloc_bytes_per_op": alloc_per_op(function, inputs)}
+        line = f"{stage:<12}: {ns_per_op:12,.0f} ns/op  {relative:9,.2f} rel  {result['alloc_bytes_per_op']:12,.0f} alloc B/op"
+        reference = baseline["stages"].get(stage) if baseline else None
+        if reference:
+            line += f"  ({ns_per_op / reference['ns_per_op'] - 1:+.1%} time, {relative / reference['relative'] - 1:+.1%} rel, " \
+                    f"{result['alloc_bytes_per_op'] / max(reference['alloc_bytes_per_op'], 1) - 1:+.1%} alloc)"
+        print(line)
+
+    if args.save_baseline:
+        stored = {"environment": environment(), "n": args.n, "stages": results}
+        if os.path.exists(args.baseline):
+            # keep the stages that were not run this time
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                stored["stages"] = dict(json.load(f)["stages"], **results)
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+
+    if baseline is not None:
+        failed = check(results, baseline, args.threshold, args.alloc_threshold, absolute=args.absolute)
+        if failed:
+            print("Regressions:\n  " + "\n  ".join(failed))
+            sys.exit(1)
+        print(f"No stage regressed by more than {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    main()
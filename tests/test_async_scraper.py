@@ -0,0 +1,118 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from TT_Content_Scraper.src.scraper_functions import async_scraper
+from TT_Content_Scraper.src.scraper_functions.async_scraper import AsyncBaseScraper, _in_thread
+from TT_Content_Scraper.tt_content_scraper import TT_Content_Scraper
+from benchmarks._server import StandInServer
+
+@pytest.fixture
+def stand_in():
+    with StandInServer(payload_bytes=300 * 1024, n_templates=3) as server:
+        yield server
+
+@pytest.fixture
+def write_threads(monkeypatch):
+    """Threads that wrote downloaded files."""
+    threads = set()
+    fdopen = async_scraper.os.fdopen
+    class RecordingFile:
+        def __init__(self, f):
+            self.f = f
+        def write(self, data):
+            threads.add(threading.get_ident())
+            return self.f.write(data)
+        def __getattr__(self, name):
+            return getattr(self.f, name)
+        def __enter__(self):
+            return self
+        def __exit__(self, *args):
+            return self.f.__exit__(*args)
+    monkeypatch.setattr(async_scraper.os, "fdopen", lambda *args, **kwargs: RecordingFile(fdopen(*args, **kwargs)))
+    return threads
+
+
+def test_downloads_are_written_outside_of_the_event_loop(stand_in, tmp_path, write_threads):
+    async def main():
+        async with AsyncBaseScraper(base_url=stand_in.base_url, chunk_size=16 * 1024) as scraper:
+            paths = await asyncio.gather(*(scraper.download_to_file(f"{stand_in.base_url}/cdn/video/{i}.mp4", tmp_path / f"{i}.mp4")
+                                           for i in range(3)))
+        return paths, threading.get_ident()
+
+    paths, loop_thread = asyncio.run(main())
+    assert [path.stat().st_size for path in paths] == [300 * 1024] * 3
+    assert not list(tmp_path.glob("*.part"))
+    assert write_threads and loop_thread not in write_threads
+
+def test_scrape_pending_async_against_the_stand_in(stand_in, tmp_path, write_threads):
+    scraper = TT_Content_Scraper(wait_time=0, output_files_fp=str(tmp_path / "data"), progress_file_fn=str(tmp_path / "progress.db"),
+                                 base_url=stand_in.base_url)
+    ids = [str(7000000000000000000 + i) for i in range(6)]
+    scraper.add_objects(ids, type="content")
+    with pytest.raises(AssertionError, match="No more pending objects"):
+        asyncio.run(scraper.scrape_pending_async(scrape_files=True, concurrency=4))
+    assert scraper.get_stats()["completed"] == 6
+    assert len(list((tmp_path / "data" / "content_metadata").glob("*.json"))) == 6
+    assert list((tmp_path / "data" / "content_files").glob("*.mp4"))
+    assert threading.main_thread().ident not in write_threads
+    scraper.close()
+
+def test_timeouts_are_per_connect_and_read_not_per_download(stand_in):
+    async def main():
+        async with AsyncBaseScraper(base_url=stand_in.base_url) as scraper:
+            return scraper.session.timeout
+    timeout = asyncio.run(main())
+    assert timeout.total is None
+    assert (timeout.sock_connect, timeout.sock_read) == (20, 20)
+
+def test_an_unexpected_error_fails_only_its_id(stand_in, tmp_path, monkeypatch):
+    scraper = TT_Content_Scraper(wait_time=0, output_files_fp=str(tmp_path / "data"), progress_file_fn=str(tmp_path / "progress.db"),
+                                 base_url=stand_in.base_url)
+    ids = [str(7000000000000000000 + i) for i in range(6)]
+    scraper.add_objects(ids, type="content")
+    protocol = scraper._async_content_action_protocol
+    async def failing_protocol(async_scraper, id, scrape_files):
+        if id == ids[2]:
+            raise ValueError("unexpected")
+        await protocol(async_scraper, id, scrape_files)
+    monkeypatch.setattr(scraper, "_async_content_action_protocol", failing_protocol)
+    error_threads = []
+    mark_error = scraper.mark_error
+    def recording_mark_error(*args):
+        error_threads.append(threading.get_ident())
+        mark_error(*args)
+    monkeypatch.setattr(scraper, "mark_error", recording_mark_error)
+
+    with pytest.raises(AssertionError, match="No more pending objects"):
+        asyncio.run(scraper.scrape_pending_async(concurrency=4))
+    stats = scraper.get_stats()
+    assert (stats["completed"], stats["errors"], stats["in_progress"]) == (5, 1, 0)
+    assert scraper.get_object_status(ids[2])["last_error"] == "unexpected"
+    assert error_threads and threading.main_thread().ident not in error_threads
+    scraper.close()
+
+def test_concurrent_leases_of_a_proxy_get_their_own_scraper(tmp_path, monkeypatch):
+    scraper = TT_Content_Scraper(wait_time=0, output_files_fp=str(tmp_path / "data"), progress_file_fn=str(tmp_path / "progress.db"),
+                                 proxies=["http://127.0.0.1:9"], proxy_concurrency=3)
+    scraper.add_objects([str(7000000000000000000 + i) for i in range(9)], type="content")
+    in_use, used = [], set()
+    async def protocol(async_scraper, id, scrape_files):
+        assert async_scraper not in in_use and async_scraper.proxy == scraper.proxy_pool.slots[0].proxy
+        in_use.append(async_scraper)
+        used.add(async_scraper)
+        await asyncio.sleep(0.05)
+        in_use.remove(async_scraper)
+        await _in_thread(scraper.mark_completed, id)
+    monkeypatch.setattr(scraper, "_async_content_action_protocol", protocol)
+
+    with pytest.raises(AssertionError, match="No more pending objects"):
+        asyncio.run(scraper.scrape_pending_async(concurrency=9))
+    assert scraper.get_stats()["completed"] == 9
+    # three leases at a time, and returned scrapers are used again
+    assert len(used) == 3
+    assert all(async_scraper.session is None for async_scraper in used)
+    scraper.close()
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from TT_Content_Scraper.src.scraper_functions import _decode_rehydration_data as decoding
+from TT_Content_Scraper.src.scraper_functions._extract_rehydration_data import _extract_rehydration_data
+from benchmarks._fixtures import make_corpus, make_video_page, make_user_page
+
+VIDEO_PATH = ("__DEFAULT_SCOPE__", "webapp.video-detail", "itemInfo", "itemStruct")
+USER_PATH = ("__DEFAULT_SCOPE__", "webapp.user-detail", "userInfo")
+
+def reference(payload, path):
+    data = json.loads(payload)
+    for key in path:
+        data = data[key]
+    return data
+
+@pytest.fixture(params=[(backend, lazy) for backend in decoding.BACKENDS for lazy in (False, True)], ids=lambda p: f"{p[0]}-{'lazy' if p[1] else 'eager'}")
+def backend(request):
+    previous = decoding.get_json_backend()
+    decoding.set_json_backend(*request.param)
+    yield request.param
+    decoding.set_json_backend(previous["backend"], lazy=previous["lazy"])
+
+@pytest.fixture
+def lazy_json():
+    previous = decoding.get_json_backend()
+    decoding.set_json_backend("json", lazy=True)
+    yield
+    decoding.set_json_backend(previous["backend"], lazy=previous["lazy"])
+
+
+def test_parity_with_json_on_pages(backend):
+    payloads = [(_extract_rehydration_data(make_video_page(item)), VIDEO_PATH) for item in make_corpus(10)]
+    payloads.append((_extract_rehydration_data(make_user_page("tiktok")), USER_PATH))
+    for payload, path in payloads:
+        assert decoding._decode_rehydration_path(payload, path) == reference(payload, path)
+
+def test_nested_key_of_the_same_name_is_not_taken(backend):
+    payload = json.dumps({
+        "__DEFAULT_SCOPE__": {
+            "app-context": {"webapp.video-detail": {"itemInfo": {"itemStruct": "nested"}}},
+            "webapp.video-detail": {"itemInfo": {"itemStruct": "top"}},
+        }
+    })
+    assert decoding._decode_rehydration_path(payload, VIDEO_PATH) == "top"
+
+def test_key_outside_of_the_first_scope_is_not_taken(backend):
+    payload = json.dumps({
+        "other": {"webapp.video-detail": {"itemInfo": {"itemStruct": "other"}}},
+        "__DEFAULT_SCOPE__": {"webapp.video-detail": {"itemInfo": {"itemStruct": "top"}}},
+    })
+    assert decoding._decode_rehydration_path(payload, VIDEO_PATH) == "top"
+
+    payload = json.dumps({
+        "__DEFAULT_SCOPE__": {"app-context": {}},
+        "webapp.video-detail": {"itemInfo": {"itemStruct": "outside"}},
+    })
+    with pytest.raises(KeyError):
+        decoding._decode_rehydration_path(payload, VIDEO_PATH)
+
+def test_missing_sub_path_raises_key_error(backend):
+    payload = json.dumps({"__DEFAULT_SCOPE__": {"webapp.video-detail": {"statusCode": 10204}}})
+    with pytest.raises(KeyError):
+        decoding._decode_rehydration_path(payload, VIDEO_PATH)
+
+def test_escapes_and_brackets_in_strings(backend):
+    tricky = 'a "quoted" {bracket} [and] \\ backslash \\" ] } é 😀'
+    scope = {
+        "app-context": {"text": tricky, "list": [tricky, {"}": "]"}]},
+        "webapp.\"video\"-detail": {"x": "{"},
+        "webapp.video-detail": {"itemInfo": {"itemStruct": {"desc": tricky, "n": [1, 2.5, -3e2, True, None]}}},
+        "after": ["]", "}"],
+    }
+    for separators in ((",", ":"), (", ", ": ")):
+        payload = json.dumps({"__DEFAULT_SCOPE__": scope}, separators=separators, ensure_ascii=False)
+        assert decoding._decode_rehydration_path(payload, VIDEO_PATH) == reference(payload, VIDEO_PATH)
+    payload = json.dumps({"__DEFAULT_SCOPE__": scope}, indent=2)
+    assert decoding._decode_rehydration_path(payload, VIDEO_PATH) == reference(payload, VIDEO_PATH)
+
+def test_lazy_uses_the_configured_backend():
+    previous = decoding.get_json_backend()
+    decoded = []
+    def loads(data):
+        decoded.append(data)
+        return json.loads(data)
+    try:
+        decoding.set_json_backend(loads, lazy=True)
+        payload = json.dumps({"__DEFAULT_SCOPE__": {"app-context": {"a": 1}, "webapp.video-detail": {"itemInfo": {"itemStruct": {"id": "1"}}}}})
+        assert decoding._decode_rehydration_path(payload, VIDEO_PATH) == {"id": "1"}
+        assert decoded == ['{"itemInfo": {"itemStruct": {"id": "1"}}}']
+    finally:
+        decoding.set_json_backend(previous["backend"], lazy=previous["lazy"])
+
+def test_lazy_falls_back_to_a_full_decode(lazy_json):
+    # not an object at the top: the lazy scan finds nothing, the full decode decides
+    payload = json.dumps([{"__DEFAULT_SCOPE__": {}}])
+    with pytest.raises(TypeError):
+        decoding._decode_rehydration_path(payload, VIDEO_PATH)
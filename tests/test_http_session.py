@@ -0,0 +1,75 @@
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from TT_Content_Scraper.src.scraper_functions.http_session import PooledSessions
+from benchmarks._server import StandInServer
+
+
+class _ForwardProxy:
+    """Plain HTTP forward proxy that counts the requests it passes on."""
+    def __init__(self):
+        self.requests = 0
+        proxy = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                proxy.requests += 1
+                opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+                with opener.open(self.path) as response:
+                    body = response.read()
+                    status = response.status
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    with StandInServer(n_templates=1) as server:
+        yield server
+
+@pytest.fixture
+def proxy():
+    proxy = _ForwardProxy()
+    yield proxy
+    proxy.close()
+
+
+def test_requests_through_a_proxy_are_counted_and_reuse_the_connection(stand_in, proxy):
+    sessions = PooledSessions(page_host="127.0.0.1")
+    try:
+        for _ in range(3):
+            response = sessions.page_session.get(f"{stand_in.base_url}/@tiktok", proxies={"http": proxy.url}, timeout=10)
+            assert response.status_code == 200
+        assert proxy.requests == 3
+        assert sessions.stats.as_dict() == {"requests": 3, "new_connections": 1, "reused_connections": 2, "tls_resumptions": 0}
+    finally:
+        sessions.close()
+
+def test_proxy_managers_get_the_resuming_context_and_counting_pools():
+    sessions = PooledSessions()
+    try:
+        adapter = sessions.cdn_session.get_adapter("https://example.com")
+        manager = adapter.proxy_manager_for("http://127.0.0.1:3128")
+        assert adapter.proxy_manager_for("http://127.0.0.1:3128") is manager
+        assert manager.connection_pool_kw["ssl_context"] is adapter.ssl_context
+        for scheme, pool_class in adapter.poolmanager.pool_classes_by_scheme.items():
+            assert manager.pool_classes_by_scheme[scheme].__name__ == pool_class.__name__ == "CountingPool"
+    finally:
+        sessions.close()
@@ -0,0 +1,32 @@
+import gzip
+
+import pytest
+
+from TT_Content_Scraper.src.ingest import open_id_source, iter_ids
+
+CSV = "video_id,author\n7000000000000000001,a\n7000000000000000002,b\n"
+
+
+def test_gzip_source_closes_its_file(tmp_path):
+    path = tmp_path / "seeds.txt.gz"
+    with gzip.open(path, "wt") as f:
+        f.write("1\n2\n\n3\n")
+    with open_id_source(str(path)) as source:
+        file = source.buffer.fileobj
+        assert list(iter_ids(source)) == ["1", "2", "3"]
+    assert file.closed
+
+@pytest.mark.parametrize("column", ["video_id", "0", 0])
+def test_csv_header_is_not_an_id(tmp_path, column):
+    path = tmp_path / "seeds.csv"
+    path.write_text(CSV)
+    with open_id_source(str(path)) as source:
+        assert list(iter_ids(source, column=column)) == ["7000000000000000001", "7000000000000000002"]
+
+def test_csv_without_header(tmp_path):
+    path = tmp_path / "seeds.csv"
+    path.write_text(CSV.split("\n", 1)[1])
+    with open_id_source(str(path)) as source:
+        assert list(iter_ids(source, column=0, has_header=False)) == ["7000000000000000001", "7000000000000000002"]
+    with open_id_source(str(path)) as source, pytest.raises(ValueError):
+        list(iter_ids(source, column="video_id", has_header=False))
@@ -0,0 +1,330 @@
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import textwrap
+from datetime import datetime, timedelta
+
+import pytest
+
+from TT_Content_Scraper.src.object_tracker_db import ObjectTracker, MIGRATIONS
+from TT_Content_Scraper.src.retry_policy import RetryPolicy, DEFAULT_BASE_DELAYS
+
+def status_on_disk(db_file, id):
+    """Status of `id` as another process sees it."""
+    with sqlite3.connect(db_file) as conn:
+        return conn.execute("SELECT status FROM objects WHERE id = ?", (id,)).fetchone()[0]
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / "progress.db")
+
+
+# buffered status updates
+
+def test_buffer_is_flushed_every_n_updates(db_file):
+    tracker = ObjectTracker(db_file, buffered=True, flush_every=3, flush_interval_ms=60_000)
+    tracker.add_objects(["1", "2", "3"], type="content")
+    tracker.mark_completed("1")
+    tracker.mark_error("2", "gone")
+    assert status_on_disk(db_file, "1") == status_on_disk(db_file, "2") == "pending"
+    tracker.mark_completed("3")
+    assert [status_on_disk(db_file, id) for id in "123"] == ["completed", "error", "completed"]
+    tracker.close()
+
+def test_buffer_is_flushed_after_the_interval_without_further_updates(db_file):
+    tracker = ObjectTracker(db_file, buffered=True, flush_every=100, flush_interval_ms=100)
+    tracker.add_objects(["1"], type="content")
+    tracker.mark_completed("1")
+    assert status_on_disk(db_file, "1") == "pending"
+    deadline = time.monotonic() + 5
+    while status_on_disk(db_file, "1") != "completed" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert status_on_disk(db_file, "1") == "completed"
+    tracker.close()
+
+def test_claims_and_reads_see_buffered_updates(db_file):
+    tracker = ObjectTracker(db_file, buffered=True, flush_interval_ms=60_000)
+    tracker.add_objects(["1", "2"], type="content")
+    tracker.mark_completed("1")
+    assert list(tracker.claim_pending("worker", batch=10)) == ["2"]
+    assert status_on_disk(db_file, "1") == "completed"
+    tracker.close()
+
+def test_buffer_is_flushed_on_close(db_file):
+    tracker = ObjectTracker(db_file, buffered=True, flush_interval_ms=60_000)
+    tracker.add_objects(["1"], type="content")
+    tracker.mark_completed("1")
+    tracker.close()
+    assert status_on_disk(db_file, "1") == "completed"
+
+def _run_scraper_process(db_file, end):
+    """A process that buffers one completed ID, then ends with `end`."""
+    script = textwrap.dedent(f"""
+        import os, signal, sys
+        from TT_Content_Scraper.src.object_tracker_db import ObjectTracker
+        tracker = ObjectTracker({db_file!r}, buffered=True, flush_interval_ms=60_000)
+        tracker.add_objects(["1"], type="content")
+        tracker.mark_completed("1")
+        {end}
+    """)
+    return subprocess.run([sys.executable, "-c", script], timeout=60)
+
+def test_sigterm_flushes_the_buffer(db_file):
+    process = _run_scraper_process(db_file, "os.kill(os.getpid(), signal.SIGTERM)")
+    assert process.returncode == 128 + signal.SIGTERM
+    assert status_on_disk(db_file, "1") == "completed"
+
+def test_hard_crash_loses_only_the_buffer(db_file):
+    process = _run_scraper_process(db_file, "os.kill(os.getpid(), signal.SIGKILL)")
+    assert process.returncode == -signal.SIGKILL
+    # the ID is scraped again, the database itself is intact
+    assert status_on_disk(db_file, "1") == "pending"
+    tracker = ObjectTracker(db_file)
+    assert list(tracker.claim_pending("worker")) == ["1"]
+    tracker.close()
+
+
+# resetting errors
+
+def attempts_of(tracker, id):
+    return tracker.get_object_status(id)["attempts"]
+
+@pytest.mark.parametrize("reset_attempts, attempts", [(False, 2), (True, 0)])
+def test_reset_errors_to_pending(db_file, reset_attempts, attempts):
+    tracker = ObjectTracker(db_file)
+    tracker.add_objects(["1", "2"], type="content")
+    tracker.mark_error("1", "gone")
+    tracker.mark_error("1", "gone")
+    tracker.mark_completed("2")
+    assert tracker.reset_errors_to_pending(reset_attempts=reset_attempts) == 1
+    assert tracker.get_object_status("1")["status"] == "pending"
+    assert attempts_of(tracker, "1") == attempts
+    assert tracker.get_object_status("2")["status"] == "completed"
+    tracker.close()
+
+
+# leases
+
+def test_claims_of_workers_are_disjoint(db_file):
+    ids = [str(i) for i in range(100)]
+    ObjectTracker(db_file).add_objects(ids, type="content")
+    trackers = [ObjectTracker(db_file) for _ in range(4)]
+    claimed = [[] for _ in trackers]
+    def work(n):
+        while True:
+            batch = trackers[n].claim_pending(f"worker-{n}", batch=7)
+            if not batch:
+                return
+            claimed[n].extend(batch)
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(len(trackers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(id for ids_of_worker in claimed for id in ids_of_worker) == sorted(ids)
+    for tracker in trackers:
+        tracker.close()
+
+def test_expired_and_released_leases_are_claimed_again(db_file):
+    tracker = ObjectTracker(db_file)
+    tracker.add_objects(["1", "2", "3"], type="content")
+    assert list(tracker.claim_pending("a", batch=1, lease_seconds=-1)) == ["1"]
+    # the lease of "a" has expired
+    assert list(tracker.claim_pending("b", batch=2)) == ["1", "2"]
+    assert tracker.renew_leases("a") == 0
+    assert tracker.renew_leases("b") == 2
+    assert list(tracker.claim_pending("c", batch=10)) == ["3"]
+    assert tracker.release_leases("b") == 2
+    assert list(tracker.claim_pending("d", batch=10)) == ["1", "2"]
+    assert tracker.get_object_status("3")["status"] == "in_progress"
+    tracker.close()
+
+
+# migrations
+
+BASELINE_SCHEMA = """
+    CREATE TABLE objects (
+        id TEXT PRIMARY KEY, status TEXT NOT NULL, title TEXT, type TEXT,
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, completed_at TIMESTAMP, attempts INTEGER DEFAULT 0,
+        last_error TEXT, last_attempt TIMESTAMP, file_path TEXT, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    CREATE TRIGGER update_timestamp AFTER UPDATE ON objects
+    BEGIN
+        UPDATE objects SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+    END;
+    CREATE INDEX idx_status ON objects(status);
+    INSERT INTO objects (id, status, title, type) VALUES
+        ('1', 'pending', 'seeds', 'content'), ('2', 'completed', 'seeds', 'content'),
+        ('3', 'error', 'seeds', 'content'), ('4', 'retry', NULL, 'user');
+"""
+
+def test_migration_from_a_baseline_database(db_file):
+    with sqlite3.connect(db_file) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+
+    tracker = ObjectTracker(db_file)
+    conn = tracker.conn
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(objects)")}
+    assert {"lease_owner", "lease_expires_at", "next_attempt_at", "priority", "refresh", "posted_at", "refreshed_at"} <= columns
+    assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall() == []
+    assert sorted(conn.execute("SELECT type, title, weight FROM queues").fetchall(), key=str) == [("content", "seeds", 1.0), ("user", None, 1.0)]
+    stats = tracker.get_stats()
+    assert (stats["pending"], stats["completed"], stats["errors"], stats["retry"]) == (1, 1, 1, 1)
+    # a retry of the old schema had no next_attempt_at and is due right away
+    assert tracker.get_object_status("4")["next_attempt_at"] is not None
+    assert tracker.seconds_until_next_retry() == 0.0
+    assert sorted(tracker.claim_pending("worker")) == ["1", "4"]
+    tracker.close()
+
+    # opening it again does not migrate again
+    tracker = ObjectTracker(db_file)
+    assert tracker.conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    tracker.close()
+
+def test_a_seed_list_has_one_queue_row(db_file):
+    tracker = ObjectTracker(db_file)
+    # a second process that added the same seed lists before the unique index existed
+    tracker.conn.execute("DROP INDEX idx_queues")
+    tracker.conn.execute("PRAGMA user_version = 6")
+    tracker.add_objects(["1"], title="seeds", type="content")
+    tracker.add_objects(["2"], type="user")
+    tracker.conn.executemany("INSERT INTO queues (type, title) VALUES (?, ?)", [("content", "seeds"), ("user", None)])
+    tracker.conn.commit()
+    tracker.close()
+
+    first, second = ObjectTracker(db_file), ObjectTracker(db_file)
+    for tracker in (first, second):
+        tracker.add_objects(["3"], title="seeds", type="content")
+        tracker.add_objects(["4"], type="user")
+        tracker.add_objects(["5"], title="", type="user")
+    queues = sorted(first.conn.execute("SELECT type, title FROM queues").fetchall(), key=str)
+    assert queues == [("content", "seeds"), ("user", ""), ("user", None)]
+    first.close()
+    second.close()
+
+
+# retries
+
+def test_retry_is_claimed_once_it_is_due(db_file):
+    tracker = ObjectTracker(db_file)
+    tracker.add_objects(["1", "2"], type="content")
+    assert sorted(tracker.claim_pending("worker")) == ["1", "2"]
+    tracker.mark_retry("1", "429", datetime.now() + timedelta(hours=1))
+    tracker.mark_retry("2", "429", datetime.now() - timedelta(seconds=1))
+    assert tracker.seconds_until_next_retry() == 0.0
+    assert list(tracker.claim_pending("worker")) == ["2"]
+    assert tracker.claim_pending("worker") == {}
+    assert 3590 < tracker.seconds_until_next_retry() <= 3600
+    assert tracker.get_object_status("1")["status"] == "retry"
+    assert attempts_of(tracker, "1") == attempts_of(tracker, "2") == 1
+    tracker.close()
+
+def test_claims_do_not_read_retries_that_are_not_due(db_file):
+    tracker = ObjectTracker(db_file)
+    tracker.add_objects([str(i) for i in range(2000)], type="content")
+    tracker.claim_pending("worker", batch=2000)
+    for i in range(2000):
+        tracker.mark_retry(str(i), "429", datetime.now() + timedelta(hours=1) if i else datetime.now() - timedelta(seconds=1))
+    statements = []
+    tracker.conn.set_trace_callback(statements.append)
+    assert list(tracker.claim_pending("worker", batch=10)) == ["0"]
+    tracker.conn.set_trace_callback(None)
+    retries = [statement for statement in statements if "'retry'" in statement and statement.lstrip().startswith("SELECT")]
+    plan = " ".join(row[3] for row in tracker.conn.execute(f"EXPLAIN QUERY PLAN {retries[0]}"))
+    assert "idx_retry (status=? AND next_attempt_at<?)" in plan
+    tracker.close()
+
+def test_backoff_grows_per_attempt_and_gives_up():
+    policy = RetryPolicy(max_attempts=4, base_delays={"server": 10.0}, max_delay=25.0)
+    for attempts, maximum in ((1, 10.0), (2, 20.0), (3, 25.0)):
+        for _ in range(20):
+            delay = (policy.next_attempt_at("server", attempts) - datetime.now()).total_seconds()
+            assert maximum / 2 - 1 <= delay <= maximum
+    assert policy.next_attempt_at("server", 4) is None
+    # unknown error classes use the transient delay
+    assert (policy.next_attempt_at("unknown", 1) - datetime.now()).total_seconds() <= DEFAULT_BASE_DELAYS["transient"]
+
+def test_scraper_retries_until_max_attempts(tmp_path):
+    from TT_Content_Scraper.tt_content_scraper import TT_Content_Scraper
+    from benchmarks._server import StandInServer
+
+    with StandInServer(error_rate=1.0, error_kind="500", n_templates=1) as server:
+        scraper = TT_Content_Scraper(wait_time=0, output_files_fp=str(tmp_path / "data"), progress_file_fn=str(tmp_path / "progress.db"),
+                                     base_url=server.base_url, retry_policy=RetryPolicy(max_attempts=2, base_delays={"server": 0.01}, immediate_retries=0))
+        scraper.add_objects(["7000000000000000001"], type="content")
+        with pytest.raises(AssertionError, match="No more pending objects"):
+            scraper.scrape_pending(scrape_files=False)
+        status = scraper.get_object_status("7000000000000000001")
+        scraper.close()
+    assert status["status"] == "error"
+    assert status["attempts"] == 2
+
+
+# fair share between seed lists
+
+def test_weighted_claims(db_file):
+    tracker = ObjectTracker(db_file)
+    tracker.add_objects([f"a{i}" for i in range(300)], title="a", type="content")
+    tracker.add_objects([f"b{i}" for i in range(300)], title="b", type="content")
+    tracker.set_priority("a", weight=3)
+    claimed = []
+    for _ in range(10):
+        claimed.extend(tracker.claim_pending("worker", batch=10))
+    assert sum(id.startswith("a") for id in claimed) == 75
+    tracker.close()
+
+def test_higher_priority_is_claimed_first(db_file):
+    tracker = ObjectTracker(db_file)
+    tracker.add_objects(["a1", "a2"], title="a", type="content")
+    tracker.add_objects(["b1", "b2"], title="b", type="content", priority=5)
+    assert list(tracker.claim_pending("worker", batch=3)) == ["b1", "b2", "a1"]
+    tracker.close()
+
+def test_priorities_within_one_seed_list_against_rowid_order(db_file):
+    tracker = ObjectTracker(db_file)
+    tracker.add_objects([f"p3_{i}" for i in range(5)], title="a", type="content", priority=3)
+    tracker.add_objects([f"p5_{i}" for i in range(3)], title="a", type="content", priority=5)
+    tracker.add_objects([f"p1_{i}" for i in range(5)], title="a", type="content", priority=1)
+    claimed = list(tracker.claim_pending("worker", batch=8))
+    assert claimed == [f"p5_{i}" for i in range(3)] + [f"p3_{i}" for i in range(5)]
+    assert list(tracker.claim_pending("worker", batch=8)) == [f"p1_{i}" for i in range(5)]
+    tracker.close()
+
+def test_weight_0_pauses_a_seed_list(db_file):
+    tracker = ObjectTracker(db_file)
+    tracker.add_objects(["a1", "a2"], title="a", type="content")
+    tracker.add_objects(["b1", "b2"], title="b", type="content")
+    assert sorted(tracker.claim_pending("worker", batch=2)) == ["a1", "b1"]
+    tracker.mark_retry("a1", "429", datetime.now() - timedelta(seconds=1))
+    tracker.mark_retry("b1", "429", datetime.now() + timedelta(hours=1))
+    tracker.set_priority("a", weight=0)
+    assert list(tracker.claim_pending("worker", batch=10)) == ["b2"]
+    # the retry of "a" is due, but paused
+    assert tracker.seconds_until_next_retry() > 3500
+    tracker.set_priority("a", weight=1)
+    assert list(tracker.claim_pending("worker", batch=10)) == ["a1", "a2"]
+    with pytest.raises(ValueError):
+        tracker.set_priority("a", weight=-1)
+    tracker.close()
+
+def test_fair_claims_only_probe_queues_with_pending_objects(db_file):
+    tracker = ObjectTracker(db_file)
+    for n in range(50):
+        tracker.add_objects([f"done{n}"], title=f"done{n}", type="content")
+        tracker.mark_completed(f"done{n}")
+    tracker.add_objects([f"a{i}" for i in range(40)], title="a", type="content")
+    tracker.add_objects([f"b{i}" for i in range(40)], title="b", type="content", priority=1)
+    statements = []
+    tracker.conn.set_trace_callback(statements.append)
+    claimed = tracker.claim_pending("worker", batch=60)
+    tracker.conn.set_trace_callback(None)
+    assert list(claimed) == [f"b{i}" for i in range(40)] + [f"a{i}" for i in range(20)]
+    # one head per queue, then a few queries per queue that rows were taken from
+    queries = [statement for statement in statements if statement.lstrip().startswith("SELECT")]
+    assert len(queries) < 52 + 10
+    tracker.close()
@@ -0,0 +1,25 @@
+import tracemalloc
+
+from TT_Content_Scraper.src.profiler import ScrapeProfiler
+
+def test_windows_compare_their_top_lines_without_keeping_snapshots(tmp_path):
+    profiler = ScrapeProfiler(tmp_path, window=2, every=2, interval=0.001, top=5)
+    held = []
+    profiler.maybe_start()
+    for _ in range(4):
+        held.append([bytearray(1000) for _ in range(200)])
+        profiler.id_finished()
+    profiler.close()
+
+    # the third window starts after the fourth ID and is ended by close()
+    assert profiler.windows == 3
+    assert not tracemalloc.is_tracing()
+    first = (tmp_path / "allocations_0.txt").read_text(encoding="utf-8")
+    second = (tmp_path / "allocations_1.txt").read_text(encoding="utf-8")
+    assert "compared with the end of the previous window" not in first
+    assert "compared with the end of the previous window" in second
+    assert "test_profiler.py" in second
+    assert (tmp_path / "stacks_1.folded").exists()
+    # only (size, count) of the top lines are kept for the next window
+    assert 0 < len(profiler._previous) <= 5
+    assert all(isinstance(value, tuple) for value in profiler._previous.values())
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from TT_Content_Scraper.src.proxy_pool import ProxyPool
+
+URL = "https://www.tiktok.com/@tiktok/video/1"
+CDN = "https://v16-webapp.tiktok.com/video.mp4"
+
+def new_scraper(proxy):
+    return SimpleNamespace(proxy=proxy, base_url="https://www.tiktok.com", rate_limiter=None)
+
+def make_pool(n = 1, **kwargs):
+    return ProxyPool([f"http://10.0.0.{i}:3128" for i in range(1, n + 1)], new_scraper=new_scraper, wait_time=0, **kwargs)
+
+
+def test_403_of_a_file_does_not_count_against_the_proxy():
+    pool = make_pool(max_failures=3)
+    slot = pool.slots[0]
+    for _ in range(5):
+        slot.record(CDN, status=403, latency=0.1)
+    assert slot.failures == 0 and slot.success == 1.0
+    assert pool.healthy() == 1
+
+@pytest.mark.parametrize("answer", [{"status": 429}, {"status": 502}, {"status": 403}, {"status": 200, "retry_after": "5"}, {"throttled": True}])
+def test_failures_in_a_row_eject_the_proxy(answer):
+    pool = make_pool(max_failures=3)
+    slot = pool.slots[0]
+    for _ in range(3):
+        slot.record(URL, **answer)
+    assert pool.healthy() == 0
+    assert pool.stats()[0]["ejected_for"] > 50
+
+def test_concurrent_leases_of_a_proxy_get_their_own_scraper():
+    pool = make_pool(max_concurrency=2)
+    slot = pool.slots[0]
+    barrier = threading.Barrier(2)
+    scrapers = []
+    def lease():
+        with pool.lease() as leased:
+            scraper = leased.take_scraper()
+            scrapers.append(scraper)
+            barrier.wait(timeout=5)
+            leased.return_scraper(scraper)
+    threads = [threading.Thread(target=lease) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert scrapers[0] is not scrapers[1]
+    assert all(scraper.proxy == slot.proxy and scraper.rate_limiter is slot for scraper in scrapers)
+    # returned scrapers are used again
+    assert slot.take_scraper() in scrapers
+
+def test_lease_async_wakes_up_when_a_lease_ends(monkeypatch):
+    pool = make_pool(max_concurrency=1)
+    picks = []
+    pick = pool._pick
+    def counting_pick():
+        picks.append(time.monotonic())
+        return pick()
+    monkeypatch.setattr(pool, "_pick", counting_pick)
+
+    async def hold(seconds):
+        async with pool.lease_async() as slot:
+            await asyncio.sleep(seconds)
+            return slot
+
+    async def main():
+        start = time.monotonic()
+        first = asyncio.create_task(hold(0.3))
+        await asyncio.sleep(0)
+        second = await hold(0)
+        return first.result(), second, time.monotonic() - start
+
+    first, second, elapsed = asyncio.run(main())
+    assert first is second
+    assert 0.3 <= elapsed < 0.9
+    # no polling: one pick of the first lease, one before and one after the wait of the second
+    assert len(picks) == 3
@@ -0,0 +1,52 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+from TT_Content_Scraper.src.rate_limiter import AdaptiveRateLimiter, MAX_RETRY_AFTER, retry_after_seconds
+
+PAGE = "https://www.tiktok.com/@tiktok/video/1"
+CDN = "https://v16-webapp.tiktok.com/video.mp4"
+
+@pytest.fixture
+def limiter():
+    return AdaptiveRateLimiter(page_host="www.tiktok.com", initial_rate=4.0)
+
+
+def test_403_throttles_pages_but_not_files(limiter):
+    limiter.record(PAGE, status=403)
+    assert limiter.budgets["page"].throttled == 1
+    assert limiter.current_rates()["page"] == 2.0
+    rate = limiter.current_rates()["cdn"]
+    limiter.record(CDN, status=403)
+    assert limiter.budgets["cdn"].throttled == 0
+    assert limiter.current_rates()["cdn"] > rate
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_throttle_status_halves_the_rate(limiter, status):
+    limiter.record(PAGE, status=status)
+    assert limiter.budgets["page"].throttled == 1
+    assert limiter.current_rates() == {"page": 2.0, "cdn": 16.0}
+
+def test_retry_after_throttles_and_holds_back_the_next_request(limiter):
+    limiter.record(CDN, status=200, retry_after="2")
+    assert limiter.budgets["cdn"].throttled == 1
+    assert limiter.current_rates()["cdn"] == 8.0
+    assert limiter.budgets["cdn"].bucket._reserve() == pytest.approx(2.0, abs=0.05)
+    # the page budget is not affected
+    assert limiter.budgets["page"].bucket._reserve() == 0.0
+
+def test_retry_after_is_also_obeyed_during_the_cooldown(limiter):
+    limiter.record(PAGE, status=429)
+    limiter.record(PAGE, status=429, retry_after="1")
+    assert limiter.current_rates()["page"] == 2.0
+    assert limiter.budgets["page"].bucket._reserve() == pytest.approx(1.0, abs=0.05)
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("") is None
+    assert retry_after_seconds("soon") is None
+    assert retry_after_seconds("5") == 5.0
+    assert retry_after_seconds("-1") == 0.0
+    assert retry_after_seconds("86400") == MAX_RETRY_AFTER
+    assert retry_after_seconds(formatdate(time.time() + 60, usegmt=True)) == pytest.approx(60, abs=2)
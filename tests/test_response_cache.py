@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+import requests
+
+from TT_Content_Scraper.src.response_cache import ResponseCache, CacheMissError
+from TT_Content_Scraper.src.scraper_functions.base_scraper import BaseScraper
+from benchmarks._server import StandInServer
+
+@pytest.fixture
+def stand_in():
+    with StandInServer(payload_bytes=300 * 1024, n_templates=1) as server:
+        yield server
+
+@pytest.fixture
+def unread_bodies(monkeypatch):
+    """Fail if the whole body of a streamed response is read into memory."""
+    content = requests.Response.content
+    def guarded(response):
+        if response.raw is not None and not response._content_consumed and response.headers.get("Content-Type") == "video/mp4":
+            raise AssertionError(f"{response.url} was read into memory")
+        return content.fget(response)
+    monkeypatch.setattr(requests.Response, "content", property(guarded))
+
+
+def test_recorded_downloads_are_streamed_into_the_cache(stand_in, tmp_path, unread_bodies):
+    scraper = BaseScraper(base_url=stand_in.base_url)
+    scraper.response_cache = ResponseCache(tmp_path / "cache")
+    url = f"{stand_in.base_url}/cdn/video/1.mp4"
+    scraper.download_to_file(url, tmp_path / "1.mp4")
+    assert scraper.response_cache.get(url).body == (tmp_path / "1.mp4").read_bytes()
+    assert not list((tmp_path / "cache").rglob("*.part"))
+
+    # replayed from the cache, without a request
+    files = stand_in.stats["files"]
+    scraper.response_cache = ResponseCache(tmp_path / "cache", mode="replay")
+    scraper.download_to_file(url, tmp_path / "2.mp4")
+    assert (tmp_path / "2.mp4").read_bytes() == (tmp_path / "1.mp4").read_bytes()
+    assert stand_in.stats["files"] == files
+    with pytest.raises(CacheMissError):
+        scraper.download_to_file(f"{stand_in.base_url}/cdn/video/2.mp4", tmp_path / "3.mp4")
+    scraper.close()
+
+def test_failed_and_oversized_answers_are_not_stored(tmp_path):
+    cache = ResponseCache(tmp_path / "cache", max_bytes=1000)
+    (tmp_path / "small").write_bytes(bytes(100))
+    (tmp_path / "big").write_bytes(bytes(101))
+    cache.put_file("https://cdn/404", 404, None, tmp_path / "small")
+    cache.put_file("https://cdn/big", 200, None, tmp_path / "big")
+    cache.put_file("https://cdn/small", 200, None, tmp_path / "small")
+    assert cache.get("https://cdn/404") is None and cache.get("https://cdn/big") is None
+    assert cache.get("https://cdn/small").body == bytes(100)
+    assert cache.stats["stored"] == 1
+
+def test_async_downloads_are_streamed_into_the_cache(stand_in, tmp_path):
+    pytest.importorskip("aiohttp")
+    from TT_Content_Scraper.src.scraper_functions.async_scraper import AsyncBaseScraper
+    url = f"{stand_in.base_url}/cdn/video/1.mp4"
+
+    async def download(cache, filename):
+        async with AsyncBaseScraper(base_url=stand_in.base_url) as scraper:
+            scraper.response_cache = cache
+            return await scraper.download_to_file(url, filename)
+
+    asyncio.run(download(ResponseCache(tmp_path / "cache"), tmp_path / "1.mp4"))
+    files = stand_in.stats["files"]
+    asyncio.run(download(ResponseCache(tmp_path / "cache", mode="replay"), tmp_path / "2.mp4"))
+    assert stand_in.stats["files"] == files
+    assert (tmp_path / "2.mp4").read_bytes() == (tmp_path / "1.mp4").read_bytes() == bytes(300 * 1024)
+
+def test_a_stats_refresh_fetches_the_page_again(stand_in, tmp_path):
+    scraper = BaseScraper(base_url=stand_in.base_url)
+    scraper.response_cache = ResponseCache(tmp_path / "cache")
+    scraper.scrape_metadata("7000000000000000001")
+    scraper.scrape_metadata("7000000000000000001")
+    assert stand_in.stats["pages"] == 1
+    scraper.scrape_metadata("7000000000000000001", refresh=True)
+    assert stand_in.stats["pages"] == 2
+
+    # a replay has nothing but the recording
+    scraper.response_cache = ResponseCache(tmp_path / "cache", mode="replay")
+    scraper.scrape_metadata("7000000000000000001", refresh=True)
+    assert stand_in.stats["pages"] == 2
+    scraper.close()